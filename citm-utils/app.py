@@ -16,6 +16,7 @@ from service_discovery import get_citm_dns_entries
 # BEGIN GENERATED DEFAULT PORTS
 DEFAULT_CADDY_ADMIN_PORT = 63858
 DEFAULT_CITM_UTILS_WEB_PORT = 19000
+DEFAULT_CITM_DNS_STATS_PORT = 19053
 DEFAULT_MITMPROXY_WEB_PORT = 19082
 # END GENERATED DEFAULT PORTS
 
@@ -52,6 +53,9 @@ def create_app(
     mitmproxy_web_port = int(
         os.getenv("MITMPROXY_WEB_PORT", str(DEFAULT_MITMPROXY_WEB_PORT))
     )
+    dns_stats_port = int(
+        os.getenv("CITM_DNS_STATS_PORT", str(DEFAULT_CITM_DNS_STATS_PORT))
+    )
     caddy_enabled = get_enabled_flag("ENABLE_CADDY")
     dns_forwarder_enabled = get_enabled_flag("ENABLE_CITM_UTILS_DNS_FORWARDER")
     mitmproxy_enabled = get_enabled_flag("ENABLE_MITMPROXY")
@@ -238,6 +242,58 @@ def create_app(
 
         return jsonify(status="unhealthy", checks=results), 503
 
+    def proxy_dns_stats(path: str):
+        if not dns_forwarder_enabled:
+            return (
+                jsonify(
+                    {
+                        "error": "DNS forwarder is disabled",
+                        "reason": "ENABLE_CITM_UTILS_DNS_FORWARDER=false",
+                    }
+                ),
+                404,
+            )
+
+        raw_worker = request.args.get("worker", "0")
+        if not raw_worker.isdigit():
+            return (
+                jsonify(
+                    {
+                        "error": "Invalid DNS stats request",
+                        "details": "worker must be a non-negative integer",
+                    }
+                ),
+                400,
+            )
+
+        try:
+            response = http_get(
+                f"http://127.0.0.1:{dns_stats_port + int(raw_worker)}{path}",
+                timeout=2,
+            )
+            payload = response.json()
+        except Exception as e:
+            return (
+                jsonify(
+                    {"error": "DNS forwarder stats unavailable", "details": str(e)}
+                ),
+                502,
+            )
+
+        return jsonify(payload), response.status_code
+
+    @app.route("/dns/upstreams", methods=["GET"])
+    def get_dns_upstreams():
+        return proxy_dns_stats("/upstreams")
+
+    @app.route("/dns/metrics", methods=["GET"])
+    def get_dns_metrics():
+        return proxy_dns_stats("/metrics")
+
+    @app.route("/dns/querylog", methods=["GET"])
+    def get_dns_querylog():
+        return proxy_dns_stats("/querylog")
+
     return app
 
 
@@ -1,6 +1,10 @@
+from .flow_index import FlowFilter, FlowIndex, FlowIndexEntry
 from .har import HarGenerationInProgressError, generate_har
 
 __all__ = [
+    "FlowFilter",
+    "FlowIndex",
+    "FlowIndexEntry",
     "HarGenerationInProgressError",
     "generate_har",
 ]
@@ -0,0 +1,95 @@
+import json
+import os
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+from .flow_index import FlowIndex, FlowIndexEntry
+
+MITMPROXY_DATA_DIR = "/var/lib/mitmproxy"
+MITM_FLOW_PATH = f"{MITMPROXY_DATA_DIR}/dump.flow"
+CAPTURE_DIR = f"{MITMPROXY_DATA_DIR}/capture"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+BLOBS_DIR_NAME = "blobs"
+
+_flow_indexes: dict[str, FlowIndex] = {}
+
+
+@dataclass(frozen=True)
+class CaptureSegment:
+    path: str
+    min_timestamp: float | None = None
+    max_timestamp: float | None = None
+    closed: bool = False
+
+    @property
+    def blobs_dir(self) -> str:
+        return os.path.join(os.path.dirname(self.path), BLOBS_DIR_NAME)
+
+    def overlaps(self, *, since: float | None, until: float | None) -> bool:
+        if not self.closed or self.min_timestamp is None or self.max_timestamp is None:
+            return True
+        if since is not None and self.max_timestamp < since:
+            return False
+        if until is not None and self.min_timestamp > until:
+            return False
+        return True
+
+
+def _read_manifest(capture_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(capture_dir, MANIFEST_NAME), encoding="utf-8") as handle:
+            manifest = json.load(handle)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def list_capture_segments(
+    *,
+    capture_dir: str = CAPTURE_DIR,
+    legacy_flow_path: str = MITM_FLOW_PATH,
+) -> list[CaptureSegment]:
+    manifest = _read_manifest(capture_dir)
+    if manifest is None:
+        return [CaptureSegment(path=legacy_flow_path)]
+
+    segments = [
+        CaptureSegment(
+            path=os.path.join(capture_dir, raw_segment["name"]),
+            min_timestamp=raw_segment.get("min_timestamp"),
+            max_timestamp=raw_segment.get("max_timestamp"),
+            closed=bool(raw_segment.get("closed")),
+        )
+        for raw_segment in manifest.get("segments", [])
+    ]
+    return [segment for segment in segments if os.path.exists(segment.path)]
+
+
+def get_flow_index(flow_path: str) -> FlowIndex:
+    flow_index = _flow_indexes.get(flow_path)
+    if flow_index is None:
+        flow_index = _flow_indexes[flow_path] = FlowIndex(flow_path)
+    return flow_index
+
+
+def _forget_missing_indexes(segments: Iterable[CaptureSegment]) -> None:
+    current_paths = {segment.path for segment in segments}
+    for flow_path in list(_flow_indexes):
+        if flow_path not in current_paths and not os.path.exists(flow_path):
+            del _flow_indexes[flow_path]
+
+
+def iter_segment_entries(
+    segments: list[CaptureSegment],
+    *,
+    since: float | None = None,
+    until: float | None = None,
+) -> Iterator[tuple[CaptureSegment, tuple[FlowIndexEntry, ...]]]:
+    _forget_missing_indexes(segments)
+    for segment in segments:
+        if not segment.overlaps(since=since, until=until):
+            continue
+        yield segment, get_flow_index(segment.path).update()
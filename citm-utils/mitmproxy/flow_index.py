@@ -0,0 +1,345 @@
+import fcntl
+import json
+import os
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, BinaryIO
+
+from . import tnetstring
+
+INDEX_VERSION = 3
+SPILLED_BODIES_METADATA_KEY = "citm_spilled_bodies"
+INDEX_SUFFIX = ".idx"
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class FlowIndexEntry:
+    offset: int
+    length: int
+    flow_type: str
+    timestamp_start: float | None
+    host: str
+    path: str
+    method: str
+    status_code: int | None
+    spilled_bodies: bool = False
+    flow_id: str = ""
+    timestamp_connect: float | None = None
+    timestamp_tls: float | None = None
+    timestamp_first_byte: float | None = None
+    timestamp_end: float | None = None
+    request_size: int | None = None
+    response_size: int | None = None
+    comment: str = ""
+    marked: str = ""
+
+
+@dataclass(frozen=True)
+class FlowFilter:
+    since: float | None = None
+    until: float | None = None
+    host: str | None = None
+    path_prefix: str | None = None
+    method: str | None = None
+    status_min: int | None = None
+    status_max: int | None = None
+
+    def is_empty(self) -> bool:
+        return self == FlowFilter()
+
+    def matches(self, entry: FlowIndexEntry) -> bool:
+        if entry.flow_type != "http":
+            return False
+        if self.since is not None or self.until is not None:
+            if entry.timestamp_start is None:
+                return False
+            if self.since is not None and entry.timestamp_start < self.since:
+                return False
+            if self.until is not None and entry.timestamp_start > self.until:
+                return False
+        if self.host is not None and entry.host != self.host.strip().lower():
+            return False
+        if self.path_prefix is not None and not entry.path.startswith(self.path_prefix):
+            return False
+        if self.method is not None and entry.method != self.method.upper():
+            return False
+        if self.status_min is not None or self.status_max is not None:
+            if entry.status_code is None:
+                return False
+            if self.status_min is not None and entry.status_code < self.status_min:
+                return False
+            if self.status_max is not None and entry.status_code > self.status_max:
+                return False
+        return True
+
+
+def _parse_timestamp(name: str, raw: str) -> float:
+    try:
+        return float(raw)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(raw)
+    except ValueError as exc:
+        raise ValueError(
+            f"{name} must be a Unix timestamp or an ISO 8601 datetime"
+        ) from exc
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _parse_status_range(raw: str) -> tuple[int, int]:
+    low, separator, high = raw.partition("-")
+    try:
+        status_min = int(low)
+        status_max = int(high) if separator else status_min
+    except ValueError as exc:
+        raise ValueError("status must be a code or a <min>-<max> range") from exc
+    if status_min > status_max:
+        raise ValueError("status range minimum must not exceed maximum")
+    return status_min, status_max
+
+
+def parse_flow_filter(args: Mapping[str, str]) -> FlowFilter:
+    status_min = status_max = None
+    if status := args.get("status"):
+        status_min, status_max = _parse_status_range(status)
+
+    return FlowFilter(
+        since=_parse_timestamp("since", args["since"]) if args.get("since") else None,
+        until=_parse_timestamp("until", args["until"]) if args.get("until") else None,
+        host=args.get("host") or None,
+        path_prefix=args.get("path_prefix") or None,
+        method=args.get("method") or None,
+        status_min=status_min,
+        status_max=status_max,
+    )
+
+
+def _to_text(value: Any) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    if value is None:
+        return ""
+    return str(value)
+
+
+def _strip_port(host: str) -> str:
+    if host.startswith("["):
+        return host[1 : host.find("]")] if "]" in host else host
+    if host.count(":") == 1:
+        return host.split(":", 1)[0]
+    return host
+
+
+def _request_host(request: dict[str, Any]) -> str:
+    authority = _to_text(request.get("authority"))
+    if authority:
+        return _strip_port(authority).lower()
+    for name, value in request.get("headers") or []:
+        if _to_text(name).lower() == "host":
+            return _strip_port(_to_text(value)).lower()
+    return _to_text(request.get("host")).lower()
+
+
+def _to_timestamp(value: Any) -> float | None:
+    return float(value) if value is not None else None
+
+
+def _message_size(
+    message: dict[str, Any], spilled: dict[str, Any], message_key: str
+) -> int | None:
+    if message_key in spilled:
+        return spilled[message_key].get("size")
+    content = message.get("content")
+    return len(content) if content is not None else None
+
+
+def _marked(value: Any) -> str:
+    if isinstance(value, bool):
+        return ":default:" if value else ""
+    return _to_text(value)
+
+
+def summarize_flow(
+    state: dict[str, Any], *, offset: int, length: int
+) -> FlowIndexEntry:
+    request = state.get("request") or {}
+    response = state.get("response") or {}
+    server_conn = state.get("server_conn") or {}
+    metadata = state.get("metadata") or {}
+    spilled = metadata.get(SPILLED_BODIES_METADATA_KEY) or {}
+    return FlowIndexEntry(
+        offset=offset,
+        length=length,
+        flow_type=_to_text(state.get("type")),
+        timestamp_start=_to_timestamp(
+            request.get("timestamp_start", state.get("timestamp_created"))
+        ),
+        host=_request_host(request) if request else "",
+        path=_to_text(request.get("path")),
+        method=_to_text(request.get("method")).upper(),
+        status_code=response.get("status_code"),
+        spilled_bodies=SPILLED_BODIES_METADATA_KEY in metadata,
+        flow_id=_to_text(state.get("id")),
+        timestamp_connect=_to_timestamp(server_conn.get("timestamp_tcp_setup")),
+        timestamp_tls=_to_timestamp(server_conn.get("timestamp_tls_setup")),
+        timestamp_first_byte=_to_timestamp(response.get("timestamp_start")),
+        timestamp_end=_to_timestamp(
+            response.get("timestamp_end", request.get("timestamp_end"))
+        ),
+        request_size=_message_size(request, spilled, "request") if request else None,
+        response_size=(
+            _message_size(response, spilled, "response") if response else None
+        ),
+        comment=_to_text(state.get("comment")),
+        marked=_marked(state.get("marked")),
+    )
+
+
+def _encode_line(value: dict[str, Any]) -> bytes:
+    return json.dumps(value).encode("utf-8") + b"\n"
+
+
+def iter_flow_records(
+    handle: BinaryIO, *, start: int = 0
+) -> Iterator[tuple[int, bytes]]:
+    handle.seek(start)
+    offset = start
+    buffer = b""
+    while True:
+        size = tnetstring.record_size(buffer) if buffer else None
+        while size is None or len(buffer) < size:
+            chunk = handle.read(max(SCAN_CHUNK_SIZE, (size or 0) - len(buffer)))
+            if not chunk:
+                return
+            buffer += chunk
+            if size is None:
+                size = tnetstring.record_size(buffer)
+        yield offset, buffer[:size]
+        buffer = buffer[size:]
+        offset += size
+
+
+def read_flow_records(
+    handle: BinaryIO, entries: Iterable[FlowIndexEntry]
+) -> Iterator[tuple[FlowIndexEntry, bytes]]:
+    for entry in entries:
+        handle.seek(entry.offset)
+        record = handle.read(entry.length)
+        if len(record) == entry.length:
+            yield entry, record
+
+
+class FlowIndex:
+    def __init__(self, flow_path: str, *, index_path: str | None = None):
+        self._flow_path = flow_path
+        self._index_path = index_path or f"{flow_path}{INDEX_SUFFIX}"
+        self._header: dict[str, Any] | None = None
+        self._entries: list[FlowIndexEntry] = []
+        self._index_read_offset = 0
+
+    @property
+    def flow_path(self) -> str:
+        return self._flow_path
+
+    @property
+    def generation(self) -> str | None:
+        return self._header.get("generation") if self._header else None
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(f"{self._index_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _indexed_end(self) -> int:
+        if not self._entries:
+            return 0
+        last = self._entries[-1]
+        return last.offset + last.length
+
+    def _reset(self, flow_stat: os.stat_result) -> None:
+        self._header = {
+            "version": INDEX_VERSION,
+            "device": flow_stat.st_dev,
+            "inode": flow_stat.st_ino,
+            "generation": os.urandom(8).hex(),
+        }
+        self._entries = []
+        with open(self._index_path, "wb") as handle:
+            handle.write(_encode_line(self._header))
+            self._index_read_offset = handle.tell()
+
+    def _load_sidecar(self) -> None:
+        try:
+            handle = open(self._index_path, "rb")
+        except FileNotFoundError:
+            self._header = None
+            self._entries = []
+            self._index_read_offset = 0
+            return
+
+        with handle:
+            try:
+                header = json.loads(handle.readline())
+            except json.JSONDecodeError:
+                header = None
+            if header != self._header:
+                self._header = header
+                self._entries = []
+                self._index_read_offset = handle.tell()
+
+            handle.seek(self._index_read_offset)
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                self._entries.append(FlowIndexEntry(**json.loads(line)))
+                self._index_read_offset += len(line)
+
+    def _is_current(self, flow_stat: os.stat_result) -> bool:
+        return (
+            self._header is not None
+            and self._header.get("version") == INDEX_VERSION
+            and self._header.get("device") == flow_stat.st_dev
+            and self._header.get("inode") == flow_stat.st_ino
+            and flow_stat.st_size >= self._indexed_end()
+        )
+
+    def update(self) -> tuple[FlowIndexEntry, ...]:
+        if not os.path.exists(self._flow_path):
+            return ()
+        with self._locked():
+            try:
+                flow_handle = open(self._flow_path, "rb")
+            except FileNotFoundError:
+                return ()
+
+            with flow_handle:
+                flow_stat = os.fstat(flow_handle.fileno())
+                self._load_sidecar()
+                if not self._is_current(flow_stat):
+                    self._reset(flow_stat)
+
+                new_entries = [
+                    summarize_flow(
+                        tnetstring.loads(record), offset=offset, length=len(record)
+                    )
+                    for offset, record in iter_flow_records(
+                        flow_handle, start=self._indexed_end()
+                    )
+                ]
+
+            if new_entries:
+                with open(self._index_path, "ab") as handle:
+                    handle.write(
+                        b"".join(_encode_line(asdict(entry)) for entry in new_entries)
+                    )
+                    self._index_read_offset = handle.tell()
+                self._entries.extend(new_entries)
+
+            return tuple(self._entries)
@@ -0,0 +1,174 @@
+import argparse
+import functools
+import operator
+import sys
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import BinaryIO
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+from .capture import (
+    CAPTURE_DIR,
+    MITM_FLOW_PATH,
+    get_flow_index,
+    iter_segment_entries,
+    list_capture_segments,
+)
+from .flow_index import FlowFilter, FlowIndexEntry, parse_flow_filter
+
+FLOW_TABLE_SCHEMA = pa.schema(
+    [
+        ("flow_id", pa.string()),
+        ("timestamp_start", pa.float64()),
+        ("timestamp_connect", pa.float64()),
+        ("timestamp_tls", pa.float64()),
+        ("timestamp_first_byte", pa.float64()),
+        ("timestamp_end", pa.float64()),
+        ("host", pa.string()),
+        ("path", pa.string()),
+        ("method", pa.string()),
+        ("status_code", pa.int32()),
+        ("request_size", pa.int64()),
+        ("response_size", pa.int64()),
+        ("comment", pa.string()),
+        ("marked", pa.string()),
+    ]
+)
+FILTER_ARGUMENTS = ("since", "until", "host", "path_prefix", "method", "status")
+FLOW_TABLE_MIMETYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+@dataclass
+class _SegmentBatches:
+    generation: str | None
+    indexed_count: int
+    batches: list[pa.RecordBatch]
+
+
+_segment_batches: dict[str, _SegmentBatches] = {}
+
+
+def build_flow_batch(entries: Sequence[FlowIndexEntry]) -> pa.RecordBatch:
+    http_entries = [entry for entry in entries if entry.flow_type == "http"]
+    return pa.RecordBatch.from_pydict(
+        {
+            name: [getattr(entry, name) for entry in http_entries]
+            for name in FLOW_TABLE_SCHEMA.names
+        },
+        schema=FLOW_TABLE_SCHEMA,
+    )
+
+
+def _segment_flow_batches(
+    flow_path: str, entries: tuple[FlowIndexEntry, ...]
+) -> list[pa.RecordBatch]:
+    generation = get_flow_index(flow_path).generation
+    cached = _segment_batches.get(flow_path)
+    if (
+        cached is None
+        or cached.generation != generation
+        or cached.indexed_count > len(entries)
+    ):
+        cached = _segment_batches[flow_path] = _SegmentBatches(generation, 0, [])
+    if cached.indexed_count < len(entries):
+        cached.batches.append(build_flow_batch(entries[cached.indexed_count :]))
+        cached.indexed_count = len(entries)
+    return cached.batches
+
+
+def filter_flow_table(table: pa.Table, flow_filter: FlowFilter) -> pa.Table:
+    conditions = []
+    if flow_filter.since is not None:
+        conditions.append(pc.field("timestamp_start") >= flow_filter.since)
+    if flow_filter.until is not None:
+        conditions.append(pc.field("timestamp_start") <= flow_filter.until)
+    if flow_filter.host is not None:
+        conditions.append(pc.field("host") == flow_filter.host.strip().lower())
+    if flow_filter.path_prefix is not None:
+        conditions.append(pc.starts_with(pc.field("path"), flow_filter.path_prefix))
+    if flow_filter.method is not None:
+        conditions.append(pc.field("method") == flow_filter.method.upper())
+    if flow_filter.status_min is not None:
+        conditions.append(pc.field("status_code") >= flow_filter.status_min)
+    if flow_filter.status_max is not None:
+        conditions.append(pc.field("status_code") <= flow_filter.status_max)
+    if not conditions:
+        return table
+    return table.filter(functools.reduce(operator.and_, conditions))
+
+
+def build_flow_table(
+    *,
+    flow_path: str = MITM_FLOW_PATH,
+    capture_dir: str = CAPTURE_DIR,
+    flow_filter: FlowFilter | None = None,
+) -> pa.Table:
+    flow_filter = flow_filter or FlowFilter()
+    segments = list_capture_segments(
+        capture_dir=capture_dir, legacy_flow_path=flow_path
+    )
+    batches = []
+    for segment, entries in iter_segment_entries(
+        segments, since=flow_filter.since, until=flow_filter.until
+    ):
+        batches.extend(_segment_flow_batches(segment.path, entries))
+    for cached_path in set(_segment_batches) - {segment.path for segment in segments}:
+        del _segment_batches[cached_path]
+
+    table = pa.Table.from_batches(batches, schema=FLOW_TABLE_SCHEMA)
+    return filter_flow_table(table, flow_filter)
+
+
+def write_flow_table(table: pa.Table, sink: BinaryIO, *, table_format: str) -> None:
+    if table_format == "parquet":
+        pq.write_table(table, sink, compression="zstd")
+    elif table_format == "arrow":
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"format must be one of {', '.join(FLOW_TABLE_MIMETYPES)}")
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m mitmproxy.flow_table",
+        description="Export one row per captured HTTP flow as Parquet or Arrow IPC.",
+    )
+    parser.add_argument(
+        "--format", choices=tuple(FLOW_TABLE_MIMETYPES), default="parquet"
+    )
+    parser.add_argument("--output", default="-")
+    parser.add_argument("--capture-dir", default=CAPTURE_DIR)
+    parser.add_argument("--flow-path", default=MITM_FLOW_PATH)
+    for name in FILTER_ARGUMENTS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+    args = parser.parse_args(argv)
+
+    filter_args = {
+        name: value for name in FILTER_ARGUMENTS if (value := getattr(args, name))
+    }
+    try:
+        flow_filter = parse_flow_filter(filter_args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    table = build_flow_table(
+        flow_path=args.flow_path, capture_dir=args.capture_dir, flow_filter=flow_filter
+    )
+    if args.output == "-":
+        write_flow_table(table, sys.stdout.buffer, table_format=args.format)
+    else:
+        with open(args.output, "wb") as handle:
+            write_flow_table(table, handle, table_format=args.format)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
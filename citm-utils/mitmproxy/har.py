@@ -1,11 +1,23 @@
 import fcntl
+import os
+import shutil
 import subprocess
 from collections.abc import Callable, Sequence
 
-MITMPROXY_DATA_DIR = "/var/lib/mitmproxy"
+from . import tnetstring
+from .capture import (
+    CAPTURE_DIR,
+    MITM_FLOW_PATH,
+    MITMPROXY_DATA_DIR,
+    CaptureSegment,
+    iter_segment_entries,
+    list_capture_segments,
+)
+from .flow_index import SPILLED_BODIES_METADATA_KEY, FlowFilter, read_flow_records
+
 HAR_LOCK_PATH = f"{MITMPROXY_DATA_DIR}/har.lock"
-MITM_FLOW_PATH = f"{MITMPROXY_DATA_DIR}/dump.flow"
 HAR_OUTPUT_PATH = f"{MITMPROXY_DATA_DIR}/dump.har"
+FILTERED_FLOW_PATH = f"{MITMPROXY_DATA_DIR}/dump.filtered.flow"
 
 
 class HarGenerationInProgressError(Exception):
@@ -27,12 +39,94 @@ def build_har_command(*, flow_path: str, output_path: str) -> list[str]:
     ]
 
 
+def strip_flow_bodies(record: bytes) -> bytes:
+    state = tnetstring.loads(record)
+    for message_key in ("request", "response"):
+        message = state.get(message_key)
+        if message and message.get("content"):
+            message["content"] = b""
+    return tnetstring.dumps(state)
+
+
+def restore_spilled_bodies(record: bytes, *, blobs_dir: str) -> bytes:
+    state = tnetstring.loads(record)
+    spilled = (state.get("metadata") or {}).pop(SPILLED_BODIES_METADATA_KEY, {})
+    for message_key, reference in spilled.items():
+        message = state.get(message_key)
+        digest = reference.get("sha256", "")
+        if not message or not digest:
+            continue
+        try:
+            with open(os.path.join(blobs_dir, digest[:2], digest), "rb") as handle:
+                message["content"] = handle.read()
+        except FileNotFoundError:
+            continue
+    return tnetstring.dumps(state)
+
+
+def _copy_segments(segments: list[CaptureSegment], output_path: str) -> int:
+    copied = 0
+    with open(output_path, "wb") as output_handle:
+        for segment in segments:
+            try:
+                with open(segment.path, "rb") as segment_handle:
+                    shutil.copyfileobj(segment_handle, output_handle)
+            except FileNotFoundError:
+                continue
+            copied += 1
+    return copied
+
+
+def _has_spilled_bodies(segments: list[CaptureSegment]) -> bool:
+    return any(
+        entry.spilled_bodies
+        for _segment, entries in iter_segment_entries(segments)
+        for entry in entries
+    )
+
+
+def write_filtered_flows(
+    *,
+    segments: list[CaptureSegment],
+    flow_filter: FlowFilter,
+    strip_bodies: bool,
+    output_path: str,
+) -> int:
+    written = 0
+    with open(output_path, "wb") as output_handle:
+        for segment, entries in iter_segment_entries(
+            segments, since=flow_filter.since, until=flow_filter.until
+        ):
+            matching = [entry for entry in entries if flow_filter.matches(entry)]
+            if not matching:
+                continue
+            try:
+                flow_handle = open(segment.path, "rb")
+            except FileNotFoundError:
+                continue
+            with flow_handle:
+                for entry, record in read_flow_records(flow_handle, matching):
+                    if strip_bodies:
+                        record = strip_flow_bodies(record)
+                    elif entry.spilled_bodies:
+                        record = restore_spilled_bodies(
+                            record, blobs_dir=segment.blobs_dir
+                        )
+                    output_handle.write(record)
+                    written += 1
+    return written
+
+
 def generate_har(
     *,
     runner: Callable[[Sequence[str]], None] = subprocess.check_call,
     lock_path: str = HAR_LOCK_PATH,
     flow_path: str = MITM_FLOW_PATH,
+    capture_dir: str = CAPTURE_DIR,
     output_path: str = HAR_OUTPUT_PATH,
+    flow_filter: FlowFilter | None = None,
+    strip_bodies: bool = False,
+    filtered_flow_path: str = FILTERED_FLOW_PATH,
 ) -> str:
     with open(lock_path, "w") as lock_file:
         try:
@@ -40,6 +134,27 @@ def generate_har(
         except BlockingIOError as exc:
             raise HarGenerationInProgressError() from exc
 
-        runner(build_har_command(flow_path=flow_path, output_path=output_path))
+        segments = list_capture_segments(
+            capture_dir=capture_dir, legacy_flow_path=flow_path
+        )
+        if (
+            strip_bodies
+            or (flow_filter is not None and not flow_filter.is_empty())
+            or _has_spilled_bodies(segments)
+        ):
+            write_filtered_flows(
+                segments=segments,
+                flow_filter=flow_filter or FlowFilter(),
+                strip_bodies=strip_bodies,
+                output_path=filtered_flow_path,
+            )
+            source_path = filtered_flow_path
+        elif len(segments) == 1:
+            source_path = segments[0].path
+        else:
+            _copy_segments(segments, filtered_flow_path)
+            source_path = filtered_flow_path
+
+        runner(build_har_command(flow_path=source_path, output_path=output_path))
 
     return output_path
@@ -0,0 +1,196 @@
+import math
+import re
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+
+from .capture import (
+    CAPTURE_DIR,
+    MITM_FLOW_PATH,
+    get_flow_index,
+    iter_segment_entries,
+    list_capture_segments,
+)
+from .flow_index import FlowIndexEntry
+
+SKETCH_RELATIVE_ACCURACY = 0.01
+BUCKET_SECONDS = 60
+REPORT_QUANTILES = (0.5, 0.95, 0.99)
+ID_PLACEHOLDER = "{id}"
+
+_ID_SEGMENT_PATTERN = re.compile(
+    r"^(?:\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    r"|[0-9a-f]{16,}|(?=[^/]*\d)[0-9A-Za-z_-]{20,})$",
+    re.IGNORECASE,
+)
+
+EndpointKey = tuple[str, str, str]
+
+
+class DDSketch:
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        self._relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._bins: dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        if value <= 0:
+            self._zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self._bins[key] = self._bins.get(key, 0) + 1
+        self.count += 1
+
+    def merge(self, other: "DDSketch") -> None:
+        if other._relative_accuracy != self._relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for key, count in other._bins.items():
+            self._bins[key] = self._bins.get(key, 0) + count
+        self._zero_count += other._zero_count
+        self.count += other.count
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        cumulative = self._zero_count
+        if rank < cumulative:
+            return 0.0
+        for key in sorted(self._bins):
+            cumulative += self._bins[key]
+            if cumulative > rank:
+                return 2 * self._gamma**key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._bins) / (self._gamma + 1)
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    errors: int = 0
+    latency: DDSketch = field(default_factory=DDSketch)
+
+    def add(self, entry: FlowIndexEntry) -> None:
+        self.requests += 1
+        if entry.status_code is None or entry.status_code >= 500:
+            self.errors += 1
+        if (
+            entry.status_code is not None
+            and entry.timestamp_start is not None
+            and entry.timestamp_end is not None
+        ):
+            self.latency.add(entry.timestamp_end - entry.timestamp_start)
+
+    def merge(self, other: "EndpointStats") -> None:
+        self.requests += other.requests
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+
+
+@dataclass
+class _SegmentLatency:
+    generation: str | None
+    indexed_count: int = 0
+    buckets: dict[int, dict[EndpointKey, EndpointStats]] = field(default_factory=dict)
+
+
+_segment_latencies: dict[str, _SegmentLatency] = {}
+
+
+def path_template(path: str) -> str:
+    path = path.split("?", 1)[0].split("#", 1)[0]
+    return "/".join(
+        ID_PLACEHOLDER if _ID_SEGMENT_PATTERN.match(segment) else segment
+        for segment in path.split("/")
+    )
+
+
+def add_entries(
+    buckets: dict[int, dict[EndpointKey, EndpointStats]],
+    entries: Sequence[FlowIndexEntry],
+) -> None:
+    for entry in entries:
+        if entry.flow_type != "http" or entry.timestamp_start is None:
+            continue
+        bucket = buckets.setdefault(int(entry.timestamp_start // BUCKET_SECONDS), {})
+        key = (entry.host, entry.method, path_template(entry.path))
+        stats = bucket.get(key)
+        if stats is None:
+            stats = bucket[key] = EndpointStats()
+        stats.add(entry)
+
+
+def _segment_buckets(
+    flow_path: str, entries: tuple[FlowIndexEntry, ...]
+) -> dict[int, dict[EndpointKey, EndpointStats]]:
+    generation = get_flow_index(flow_path).generation
+    cached = _segment_latencies.get(flow_path)
+    if (
+        cached is None
+        or cached.generation != generation
+        or cached.indexed_count > len(entries)
+    ):
+        cached = _segment_latencies[flow_path] = _SegmentLatency(generation)
+    add_entries(cached.buckets, entries[cached.indexed_count :])
+    cached.indexed_count = len(entries)
+    return cached.buckets
+
+
+def _format_milliseconds(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def build_latency_report(
+    *,
+    minutes: int,
+    host: str | None = None,
+    flow_path: str = MITM_FLOW_PATH,
+    capture_dir: str = CAPTURE_DIR,
+    clock: Callable[[], float] = time.time,
+) -> dict:
+    until = clock()
+    first_bucket = int((until - minutes * 60) // BUCKET_SECONDS)
+    since = first_bucket * BUCKET_SECONDS
+    host = host.strip().lower() if host else None
+
+    segments = list_capture_segments(
+        capture_dir=capture_dir, legacy_flow_path=flow_path
+    )
+    totals: dict[EndpointKey, EndpointStats] = {}
+    for segment, entries in iter_segment_entries(segments, since=since):
+        for bucket, endpoints in _segment_buckets(segment.path, entries).items():
+            if bucket < first_bucket:
+                continue
+            for key, stats in endpoints.items():
+                if host is not None and key[0] != host:
+                    continue
+                totals.setdefault(key, EndpointStats()).merge(stats)
+    for cached_path in set(_segment_latencies) - {segment.path for segment in segments}:
+        del _segment_latencies[cached_path]
+
+    endpoints = []
+    for (endpoint_host, method, template), stats in sorted(
+        totals.items(), key=lambda item: (-item[1].requests, item[0])
+    ):
+        endpoint = {
+            "host": endpoint_host,
+            "method": method,
+            "path_template": template,
+            "requests": stats.requests,
+            "errors": stats.errors,
+            "error_rate": stats.errors / stats.requests,
+        }
+        for quantile in REPORT_QUANTILES:
+            endpoint[f"p{round(quantile * 100)}_ms"] = _format_milliseconds(
+                stats.latency.quantile(quantile)
+            )
+        endpoints.append(endpoint)
+
+    return {
+        "since": since,
+        "until": until,
+        "window_minutes": minutes,
+        "endpoints": endpoints,
+    }
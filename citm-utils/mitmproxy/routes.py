@@ -1,19 +1,89 @@
+import io
 import subprocess
 
-from flask import Blueprint, jsonify, send_file
+import pyarrow as pa
+from flask import Blueprint, jsonify, request, send_file
 
+from . import tnetstring
+from .flow_index import parse_flow_filter
+from .flow_table import FLOW_TABLE_MIMETYPES, build_flow_table, write_flow_table
 from .har import HarGenerationInProgressError, generate_har
+from .latency import build_latency_report
 
 mitmproxy_blueprint = Blueprint("mitmproxy", __name__)
 
+TRUE_VALUES = {"1", "true"}
+DEFAULT_LATENCY_WINDOW_MINUTES = 15
+
 
 @mitmproxy_blueprint.route("/har", methods=["GET"])
 def get_har():
     try:
-        har_path = generate_har()
+        flow_filter = parse_flow_filter(request.args)
+    except ValueError as e:
+        return jsonify({"error": "Invalid HAR filter", "details": str(e)}), 400
+    strip_bodies = request.args.get("no_bodies", "").strip().lower() in TRUE_VALUES
+
+    try:
+        har_path = generate_har(flow_filter=flow_filter, strip_bodies=strip_bodies)
     except HarGenerationInProgressError:
         return jsonify({"error": "HAR generation already in progress"}), 409
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, tnetstring.TNetstringError) as e:
         return jsonify({"error": "HAR generation failed", "details": str(e)}), 502
 
     return send_file(har_path, mimetype="application/json")
+
+
+@mitmproxy_blueprint.route("/flows/summary", methods=["GET"])
+def get_flow_summary():
+    table_format = request.args.get("format", "parquet").strip().lower()
+    try:
+        if table_format not in FLOW_TABLE_MIMETYPES:
+            raise ValueError(f"format must be one of {', '.join(FLOW_TABLE_MIMETYPES)}")
+        flow_filter = parse_flow_filter(request.args)
+    except ValueError as e:
+        return (
+            jsonify({"error": "Invalid flow summary request", "details": str(e)}),
+            400,
+        )
+
+    output = io.BytesIO()
+    try:
+        write_flow_table(
+            build_flow_table(flow_filter=flow_filter), output, table_format=table_format
+        )
+    except (tnetstring.TNetstringError, pa.ArrowException) as e:
+        return jsonify({"error": "Flow summary failed", "details": str(e)}), 502
+    output.seek(0)
+    return send_file(
+        output,
+        mimetype=FLOW_TABLE_MIMETYPES[table_format],
+        download_name=f"flows.{table_format}",
+    )
+
+
+@mitmproxy_blueprint.route("/flows/latency", methods=["GET"])
+def get_flow_latency():
+    raw_minutes = request.args.get("minutes", str(DEFAULT_LATENCY_WINDOW_MINUTES))
+    try:
+        minutes = int(raw_minutes)
+    except ValueError:
+        minutes = 0
+    if minutes <= 0:
+        return (
+            jsonify(
+                {
+                    "error": "Invalid latency report request",
+                    "details": "minutes must be a positive integer",
+                }
+            ),
+            400,
+        )
+
+    try:
+        report = build_latency_report(
+            minutes=minutes, host=request.args.get("host") or None
+        )
+    except tnetstring.TNetstringError as e:
+        return jsonify({"error": "Latency report failed", "details": str(e)}), 502
+    return jsonify(report)
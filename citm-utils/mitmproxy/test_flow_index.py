@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+from mitmproxy import tnetstring
+from mitmproxy.flow_index import FlowFilter, FlowIndex
+
+
+def _flow_record(
+    *,
+    host: str = "api.example",
+    path: str = "/items",
+    method: str = "GET",
+    status_code: int | None = 200,
+    timestamp_start: float = 1000.0,
+    content: bytes = b"",
+) -> bytes:
+    state = {
+        "type": "http",
+        "timestamp_created": timestamp_start,
+        "request": {
+            "host": "10.0.0.2",
+            "port": 443,
+            "method": method.encode(),
+            "scheme": b"https",
+            "authority": b"",
+            "path": path.encode(),
+            "http_version": b"HTTP/1.1",
+            "headers": [[b"Host", host.encode()]],
+            "content": content,
+            "timestamp_start": timestamp_start,
+            "timestamp_end": timestamp_start + 0.1,
+        },
+        "response": (
+            {
+                "status_code": status_code,
+                "content": content,
+                "timestamp_start": timestamp_start + 0.2,
+                "timestamp_end": timestamp_start + 0.3,
+            }
+            if status_code is not None
+            else None
+        ),
+    }
+    return tnetstring.dumps(state)
+
+
+def test_tnetstring_round_trips_flow_records():
+    record = _flow_record(content=b"payload")
+
+    assert tnetstring.dumps(tnetstring.loads(record)) == record
+
+
+def test_flow_index_summarizes_records_with_offsets(tmp_path):
+    first = _flow_record(host="API.example:8443", path="/a")
+    second = _flow_record(host="other.example", method="post", status_code=None)
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(first + second)
+
+    entries = FlowIndex(str(flow_path)).update()
+
+    assert [(entry.offset, entry.length) for entry in entries] == [
+        (0, len(first)),
+        (len(first), len(second)),
+    ]
+    assert entries[0].host == "api.example"
+    assert entries[0].path == "/a"
+    assert entries[0].status_code == 200
+    assert entries[1].method == "POST"
+    assert entries[1].status_code is None
+
+
+def test_flow_index_only_scans_appended_complete_records(tmp_path, monkeypatch):
+    flow_path = tmp_path / "dump.flow"
+    first = _flow_record(path="/first")
+    second = _flow_record(path="/second")
+    flow_path.write_bytes(first + second[:10])
+
+    flow_index = FlowIndex(str(flow_path))
+    assert [entry.path for entry in flow_index.update()] == ["/first"]
+
+    loaded: list[bytes] = []
+    original_loads = tnetstring.loads
+    monkeypatch.setattr(
+        tnetstring,
+        "loads",
+        lambda record: loaded.append(record) or original_loads(record),
+    )
+    with open(flow_path, "ab") as handle:
+        handle.write(second[10:])
+
+    assert [entry.path for entry in flow_index.update()] == ["/first", "/second"]
+    assert loaded == [second]
+
+
+def test_flow_index_reuses_sidecar_across_instances(tmp_path, monkeypatch):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(_flow_record(path="/persisted"))
+    FlowIndex(str(flow_path)).update()
+
+    def fail_loads(_record):
+        raise AssertionError("indexed records must not be parsed again")
+
+    monkeypatch.setattr(tnetstring, "loads", fail_loads)
+
+    entries = FlowIndex(str(flow_path)).update()
+
+    assert [entry.path for entry in entries] == ["/persisted"]
+    assert (tmp_path / "dump.flow.idx").exists()
+
+
+def test_flow_index_rebuilds_when_flow_file_is_replaced(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(_flow_record(path="/old") + _flow_record(path="/old"))
+    flow_index = FlowIndex(str(flow_path))
+    flow_index.update()
+
+    flow_path.unlink()
+    flow_path.write_bytes(_flow_record(path="/new"))
+
+    assert [entry.path for entry in flow_index.update()] == ["/new"]
+
+
+def test_flow_index_returns_empty_when_flow_file_is_missing(tmp_path):
+    assert FlowIndex(str(tmp_path / "missing.flow")).update() == ()
+
+
+def test_flow_filter_matches_time_window_host_path_method_and_status(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(
+        _flow_record(path="/api/a", timestamp_start=100.0)
+        + _flow_record(path="/api/b", timestamp_start=200.0, status_code=503)
+        + _flow_record(path="/web", timestamp_start=200.0, host="web.example")
+        + _flow_record(path="/api/c", timestamp_start=300.0, method="POST")
+    )
+    entries = FlowIndex(str(flow_path)).update()
+
+    def paths(flow_filter: FlowFilter) -> list[str]:
+        return [entry.path for entry in entries if flow_filter.matches(entry)]
+
+    assert paths(FlowFilter(since=150.0, until=250.0)) == ["/api/b", "/web"]
+    assert paths(FlowFilter(host="WEB.example")) == ["/web"]
+    assert paths(FlowFilter(path_prefix="/api/")) == ["/api/a", "/api/b", "/api/c"]
+    assert paths(FlowFilter(method="post")) == ["/api/c"]
+    assert paths(FlowFilter(status_min=500, status_max=599)) == ["/api/b"]
+    assert FlowFilter().is_empty()
+
+
+def test_flow_index_records_timing_size_and_annotation_columns(tmp_path):
+    state = tnetstring.loads(_flow_record(content=b"payload"))
+    state["id"] = "flow-1"
+    state["comment"] = "mocked by mock_responder"
+    state["marked"] = ":default:"
+    state["server_conn"] = {
+        "timestamp_tcp_setup": 1000.05,
+        "timestamp_tls_setup": 1000.08,
+    }
+    state["metadata"] = {
+        "citm_spilled_bodies": {"response": {"sha256": "ab" * 32, "size": 4096}}
+    }
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(tnetstring.dumps(state))
+
+    (entry,) = FlowIndex(str(flow_path)).update()
+
+    assert entry.flow_id == "flow-1"
+    assert entry.timestamp_connect == 1000.05
+    assert entry.timestamp_tls == 1000.08
+    assert entry.timestamp_first_byte == 1000.2
+    assert entry.timestamp_end == 1000.3
+    assert entry.request_size == len(b"payload")
+    assert entry.response_size == 4096
+    assert entry.comment == "mocked by mock_responder"
+    assert entry.marked == ":default:"
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import io
+
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import pytest
+
+import mitmproxy.flow_table as flow_table
+from mitmproxy import tnetstring
+from mitmproxy.flow_index import FlowFilter
+from mitmproxy.flow_table import (
+    FLOW_TABLE_SCHEMA,
+    build_flow_table,
+    main,
+    write_flow_table,
+)
+
+
+def _flow_record(
+    *,
+    host: str = "api.example",
+    path: str = "/items",
+    method: str = "GET",
+    status_code: int = 200,
+    timestamp_start: float = 1000.0,
+    flow_type: str = "http",
+) -> bytes:
+    state = {
+        "type": flow_type,
+        "id": f"{host}{path}",
+        "timestamp_created": timestamp_start,
+        "server_conn": {"timestamp_tcp_setup": timestamp_start + 0.01},
+        "request": {
+            "method": method.encode(),
+            "authority": b"",
+            "path": path.encode(),
+            "headers": [[b"Host", host.encode()]],
+            "content": b"ping",
+            "timestamp_start": timestamp_start,
+            "timestamp_end": timestamp_start + 0.1,
+        },
+        "response": {
+            "status_code": status_code,
+            "content": b"pong!",
+            "timestamp_start": timestamp_start + 0.2,
+            "timestamp_end": timestamp_start + 0.3,
+        },
+    }
+    return tnetstring.dumps(state)
+
+
+@pytest.fixture(autouse=True)
+def _reset_segment_batches(monkeypatch):
+    monkeypatch.setattr(flow_table, "_segment_batches", {})
+
+
+def test_build_flow_table_has_one_row_per_http_flow(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(
+        _flow_record(path="/a")
+        + _flow_record(flow_type="tcp")
+        + _flow_record(path="/b", status_code=503)
+    )
+
+    table = build_flow_table(
+        flow_path=str(flow_path), capture_dir=str(tmp_path / "capture")
+    )
+
+    assert table.schema == FLOW_TABLE_SCHEMA
+    assert table.column("path").to_pylist() == ["/a", "/b"]
+    assert table.column("status_code").to_pylist() == [200, 503]
+    assert table.column("timestamp_connect").to_pylist() == [1000.01, 1000.01]
+    assert table.column("request_size").to_pylist() == [4, 4]
+    assert table.column("response_size").to_pylist() == [5, 5]
+
+
+def test_build_flow_table_only_converts_appended_flows(tmp_path, monkeypatch):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(_flow_record(path="/a"))
+    build_flow_table(flow_path=str(flow_path), capture_dir=str(tmp_path / "capture"))
+
+    converted: list[int] = []
+    original_build_flow_batch = flow_table.build_flow_batch
+
+    def _recording_build_flow_batch(entries):
+        converted.append(len(entries))
+        return original_build_flow_batch(entries)
+
+    monkeypatch.setattr(flow_table, "build_flow_batch", _recording_build_flow_batch)
+    with flow_path.open("ab") as handle:
+        handle.write(_flow_record(path="/b"))
+
+    table = build_flow_table(
+        flow_path=str(flow_path), capture_dir=str(tmp_path / "capture")
+    )
+
+    assert converted == [1]
+    assert table.column("path").to_pylist() == ["/a", "/b"]
+
+
+def test_build_flow_table_applies_flow_filter(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(
+        _flow_record(host="api.example", path="/v1/a", timestamp_start=1000.0)
+        + _flow_record(host="api.example", path="/v2/b", timestamp_start=2000.0)
+        + _flow_record(host="other.example", path="/v1/c", timestamp_start=2000.0)
+        + _flow_record(host="api.example", path="/v1/d", status_code=500)
+    )
+
+    table = build_flow_table(
+        flow_path=str(flow_path),
+        capture_dir=str(tmp_path / "capture"),
+        flow_filter=FlowFilter(
+            host="API.example", path_prefix="/v1", status_min=200, status_max=299
+        ),
+    )
+
+    assert table.column("path").to_pylist() == ["/v1/a"]
+
+
+@pytest.mark.parametrize("table_format", ["parquet", "arrow"])
+def test_write_flow_table_round_trips(tmp_path, table_format):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(_flow_record())
+    table = build_flow_table(
+        flow_path=str(flow_path), capture_dir=str(tmp_path / "capture")
+    )
+    output = io.BytesIO()
+
+    write_flow_table(table, output, table_format=table_format)
+
+    output.seek(0)
+    if table_format == "parquet":
+        restored = pq.read_table(output)
+    else:
+        restored = pyarrow.ipc.open_file(output).read_all()
+    assert restored.equals(table)
+
+
+def test_cli_writes_filtered_table_to_output_path(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(
+        _flow_record(method="GET", path="/a") + _flow_record(method="POST", path="/b")
+    )
+    output_path = tmp_path / "flows.parquet"
+
+    exit_code = main(
+        [
+            "--flow-path",
+            str(flow_path),
+            "--capture-dir",
+            str(tmp_path / "capture"),
+            "--output",
+            str(output_path),
+            "--method",
+            "post",
+        ]
+    )
+
+    assert exit_code == 0
+    assert pq.read_table(output_path).column("path").to_pylist() == ["/b"]
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import fcntl
+import json
 import subprocess
 
 import pytest
 
+from mitmproxy import tnetstring
+from mitmproxy.flow_index import FlowFilter
 from mitmproxy.har import (
     HarGenerationInProgressError,
     build_har_command,
@@ -12,6 +15,27 @@ from mitmproxy.har import (
 )
 
 
+def _flow_record(
+    *,
+    host: str = "api.example",
+    timestamp_start: float = 1000.0,
+    content: bytes = b"",
+) -> bytes:
+    return tnetstring.dumps(
+        {
+            "type": "http",
+            "request": {
+                "method": b"GET",
+                "path": b"/",
+                "headers": [[b"Host", host.encode()]],
+                "content": content,
+                "timestamp_start": timestamp_start,
+            },
+            "response": {"status_code": 200, "content": content},
+        }
+    )
+
+
 def test_build_har_command_uses_flow_and_output_paths():
     command = build_har_command(
         flow_path="/tmp/input.flow",
@@ -92,3 +116,144 @@ def test_generate_har_bubbles_runner_failures(tmp_path):
             flow_path=str(tmp_path / "dump.flow"),
             output_path=str(tmp_path / "dump.har"),
         )
+
+
+def test_generate_har_converts_only_filtered_records(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    filtered_flow_path = tmp_path / "dump.filtered.flow"
+    matching = _flow_record(host="api.example", timestamp_start=200.0)
+    flow_path.write_bytes(
+        _flow_record(host="api.example", timestamp_start=100.0)
+        + matching
+        + _flow_record(host="other.example", timestamp_start=200.0)
+    )
+    command_calls: list[list[str]] = []
+
+    generate_har(
+        runner=lambda command: command_calls.append(list(command)),
+        lock_path=str(tmp_path / "har.lock"),
+        flow_path=str(flow_path),
+        output_path=str(tmp_path / "dump.har"),
+        capture_dir=str(tmp_path / "capture"),
+        flow_filter=FlowFilter(since=150.0, host="api.example"),
+        filtered_flow_path=str(filtered_flow_path),
+    )
+
+    assert filtered_flow_path.read_bytes() == matching
+    assert command_calls[0][7] == str(filtered_flow_path)
+
+
+def test_generate_har_strips_bodies_when_requested(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    filtered_flow_path = tmp_path / "dump.filtered.flow"
+    flow_path.write_bytes(_flow_record(content=b"large body"))
+
+    generate_har(
+        runner=lambda _command: None,
+        lock_path=str(tmp_path / "har.lock"),
+        flow_path=str(flow_path),
+        output_path=str(tmp_path / "dump.har"),
+        capture_dir=str(tmp_path / "capture"),
+        strip_bodies=True,
+        filtered_flow_path=str(filtered_flow_path),
+    )
+
+    state = tnetstring.loads(filtered_flow_path.read_bytes())
+    assert state["request"]["content"] == b""
+    assert state["response"]["content"] == b""
+
+
+def _write_capture(capture_dir, segments: list[tuple[str, bytes, dict]]) -> None:
+    capture_dir.mkdir()
+    manifest_segments = []
+    for name, content, metadata in segments:
+        (capture_dir / name).write_bytes(content)
+        manifest_segments.append({"name": name, **metadata})
+    (capture_dir / "manifest.json").write_text(
+        json.dumps({"version": 1, "segments": manifest_segments}),
+        encoding="utf-8",
+    )
+
+
+def test_generate_har_concatenates_capture_segments(tmp_path):
+    capture_dir = tmp_path / "capture"
+    first = _flow_record(timestamp_start=100.0)
+    second = _flow_record(timestamp_start=200.0)
+    _write_capture(
+        capture_dir,
+        [
+            ("segment-000001.flow", first, {"closed": True}),
+            ("segment-000002.flow", second, {"closed": False}),
+        ],
+    )
+    command_calls: list[list[str]] = []
+
+    generate_har(
+        runner=lambda command: command_calls.append(list(command)),
+        lock_path=str(tmp_path / "har.lock"),
+        capture_dir=str(capture_dir),
+        output_path=str(tmp_path / "dump.har"),
+        filtered_flow_path=str(tmp_path / "dump.filtered.flow"),
+    )
+
+    assert (tmp_path / "dump.filtered.flow").read_bytes() == first + second
+    assert command_calls[0][7] == str(tmp_path / "dump.filtered.flow")
+
+
+def test_generate_har_skips_segments_outside_time_window(tmp_path):
+    capture_dir = tmp_path / "capture"
+    recent = _flow_record(timestamp_start=500.0)
+    _write_capture(
+        capture_dir,
+        [
+            (
+                "segment-000001.flow",
+                _flow_record(timestamp_start=100.0),
+                {"closed": True, "min_timestamp": 100.0, "max_timestamp": 100.0},
+            ),
+            ("segment-000002.flow", recent, {"closed": False}),
+        ],
+    )
+
+    generate_har(
+        runner=lambda _command: None,
+        lock_path=str(tmp_path / "har.lock"),
+        capture_dir=str(capture_dir),
+        output_path=str(tmp_path / "dump.har"),
+        flow_filter=FlowFilter(since=400.0),
+        filtered_flow_path=str(tmp_path / "dump.filtered.flow"),
+    )
+
+    assert (tmp_path / "dump.filtered.flow").read_bytes() == recent
+    assert not (capture_dir / "segment-000001.flow.idx").exists()
+    assert (capture_dir / "segment-000002.flow.idx").exists()
+
+
+def test_generate_har_restores_spilled_bodies_from_blobs(tmp_path):
+    capture_dir = tmp_path / "capture"
+    digest = "ab" + "0" * 62
+    record = tnetstring.dumps(
+        {
+            "type": "http",
+            "metadata": {
+                "citm_spilled_bodies": {"response": {"sha256": digest, "size": 4}}
+            },
+            "request": {"method": b"GET", "path": b"/", "content": b""},
+            "response": {"status_code": 200, "content": b""},
+        }
+    )
+    _write_capture(capture_dir, [("segment-000001.flow", record, {"closed": False})])
+    (capture_dir / "blobs" / "ab").mkdir(parents=True)
+    (capture_dir / "blobs" / "ab" / digest).write_bytes(b"blob")
+
+    generate_har(
+        runner=lambda _command: None,
+        lock_path=str(tmp_path / "har.lock"),
+        capture_dir=str(capture_dir),
+        output_path=str(tmp_path / "dump.har"),
+        filtered_flow_path=str(tmp_path / "dump.filtered.flow"),
+    )
+
+    state = tnetstring.loads((tmp_path / "dump.filtered.flow").read_bytes())
+    assert state["response"]["content"] == b"blob"
+    assert "citm_spilled_bodies" not in state["metadata"]
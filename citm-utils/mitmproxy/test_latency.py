@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+import mitmproxy.latency as latency
+from mitmproxy import tnetstring
+from mitmproxy.latency import DDSketch, build_latency_report, path_template
+
+
+def _flow_record(
+    *,
+    host: str = "api.example",
+    path: str = "/items",
+    method: str = "GET",
+    status_code: int | None = 200,
+    timestamp_start: float = 1000.0,
+    duration: float = 0.1,
+) -> bytes:
+    state = {
+        "type": "http",
+        "timestamp_created": timestamp_start,
+        "request": {
+            "method": method.encode(),
+            "authority": b"",
+            "path": path.encode(),
+            "headers": [[b"Host", host.encode()]],
+            "content": b"",
+            "timestamp_start": timestamp_start,
+            "timestamp_end": timestamp_start,
+        },
+        "response": (
+            {
+                "status_code": status_code,
+                "content": b"",
+                "timestamp_start": timestamp_start + duration / 2,
+                "timestamp_end": timestamp_start + duration,
+            }
+            if status_code is not None
+            else None
+        ),
+    }
+    return tnetstring.dumps(state)
+
+
+@pytest.fixture(autouse=True)
+def _reset_segment_latencies(monkeypatch):
+    monkeypatch.setattr(latency, "_segment_latencies", {})
+
+
+def test_ddsketch_quantiles_stay_within_relative_accuracy():
+    values = [random.Random(7).lognormvariate(-3, 1) for _ in range(5000)]
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+
+    ordered = sorted(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = ordered[round(q * (len(ordered) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.011)
+
+
+def test_ddsketch_merge_matches_single_sketch():
+    merged, left, right = DDSketch(), DDSketch(), DDSketch()
+    for value in range(1, 101):
+        merged.add(value / 1000)
+        (left if value % 2 else right).add(value / 1000)
+
+    left.merge(right)
+
+    assert left.count == merged.count
+    assert left.quantile(0.95) == merged.quantile(0.95)
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("/users/42/orders?page=2", "/users/{id}/orders"),
+        ("/items/0f8fad5b-d9cb-469f-a165-70867728950e", "/items/{id}"),
+        ("/blobs/9f86d081884c7d659a2feaa0c55ad015", "/blobs/{id}"),
+        ("/articles/how-to-write-a-long-slug", "/articles/how-to-write-a-long-slug"),
+    ],
+)
+def test_path_template_replaces_identifier_segments(path, expected):
+    assert path_template(path) == expected
+
+
+def test_build_latency_report_groups_by_endpoint_within_window(tmp_path):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(
+        _flow_record(path="/users/1", timestamp_start=9000.0, duration=0.1)
+        + _flow_record(path="/users/2", timestamp_start=9500.0, duration=0.3)
+        + _flow_record(
+            path="/users/3", timestamp_start=9600.0, duration=0.3, status_code=503
+        )
+        + _flow_record(path="/users/4", timestamp_start=9700.0, status_code=None)
+        + _flow_record(method="POST", path="/users", timestamp_start=9800.0)
+    )
+
+    report = build_latency_report(
+        minutes=10,
+        flow_path=str(flow_path),
+        capture_dir=str(tmp_path / "capture"),
+        clock=lambda: 10000.0,
+    )
+
+    assert report["since"] == 9360
+    users, create = report["endpoints"]
+    assert (users["method"], users["path_template"]) == ("GET", "/users/{id}")
+    assert users["requests"] == 3
+    assert users["errors"] == 2
+    assert users["error_rate"] == pytest.approx(2 / 3)
+    assert users["p50_ms"] == pytest.approx(300, rel=0.02)
+    assert users["p99_ms"] == pytest.approx(300, rel=0.02)
+    assert (create["method"], create["requests"], create["errors"]) == ("POST", 1, 0)
+
+
+def test_build_latency_report_only_sketches_appended_flows(tmp_path, monkeypatch):
+    flow_path = tmp_path / "dump.flow"
+    flow_path.write_bytes(_flow_record(timestamp_start=9900.0))
+    report_args = {
+        "minutes": 5,
+        "flow_path": str(flow_path),
+        "capture_dir": str(tmp_path / "capture"),
+        "clock": lambda: 10000.0,
+    }
+    build_latency_report(**report_args)
+
+    sketched: list[int] = []
+    original_add_entries = latency.add_entries
+
+    def _recording_add_entries(buckets, entries):
+        sketched.append(len(entries))
+        original_add_entries(buckets, entries)
+
+    monkeypatch.setattr(latency, "add_entries", _recording_add_entries)
+    with flow_path.open("ab") as handle:
+        handle.write(_flow_record(timestamp_start=9950.0, host="other.example"))
+
+    report = build_latency_report(**report_args, host="OTHER.example")
+
+    assert sketched == [1]
+    assert [endpoint["host"] for endpoint in report["endpoints"]] == ["other.example"]
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import functools
+import io
+import json
 import subprocess
 
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+import pytest
 from flask import Flask
 
 import mitmproxy.routes as routes
-from mitmproxy.har import HarGenerationInProgressError
+from mitmproxy import tnetstring
+from mitmproxy.flow_index import FlowFilter
+from mitmproxy.flow_table import build_flow_table
+from mitmproxy.har import HarGenerationInProgressError, generate_har
+from mitmproxy.latency import build_latency_report
 from mitmproxy.routes import mitmproxy_blueprint
 
 
@@ -19,7 +30,7 @@ def test_har_route_returns_file_on_success(monkeypatch, tmp_path):
     har_path = tmp_path / "dump.har"
     har_path.write_text('{"log": {}}', encoding="utf-8")
 
-    monkeypatch.setattr(routes, "generate_har", lambda: str(har_path))
+    monkeypatch.setattr(routes, "generate_har", lambda **_kwargs: str(har_path))
     client = _create_client()
 
     response = client.get("/har")
@@ -30,7 +41,7 @@ def test_har_route_returns_file_on_success(monkeypatch, tmp_path):
 
 
 def test_har_route_returns_conflict_when_generation_in_progress(monkeypatch):
-    def _raise_in_progress():
+    def _raise_in_progress(**_kwargs):
         raise HarGenerationInProgressError()
 
     monkeypatch.setattr(routes, "generate_har", _raise_in_progress)
@@ -43,7 +54,7 @@ def test_har_route_returns_conflict_when_generation_in_progress(monkeypatch):
 
 
 def test_har_route_returns_bad_gateway_on_subprocess_error(monkeypatch):
-    def _raise_subprocess_error():
+    def _raise_subprocess_error(**_kwargs):
         raise subprocess.CalledProcessError(1, ["mitmdump"])
 
     monkeypatch.setattr(routes, "generate_har", _raise_subprocess_error)
@@ -55,3 +66,236 @@ def test_har_route_returns_bad_gateway_on_subprocess_error(monkeypatch):
     payload = response.get_json()
     assert payload["error"] == "HAR generation failed"
     assert "non-zero exit status" in payload["details"]
+
+
+def _write_corrupt_capture(capture_dir) -> None:
+    capture_dir.mkdir()
+    record = tnetstring.dumps({"type": "http", "request": {"path": b"/"}})
+    (capture_dir / "segment-000001.flow").write_bytes(record + b"garbage-rec:ord")
+    (capture_dir / "manifest.json").write_text(
+        json.dumps(
+            {"version": 1, "segments": [{"name": "segment-000001.flow"}]},
+        ),
+        encoding="utf-8",
+    )
+
+
+def test_har_route_returns_bad_gateway_for_corrupt_capture(monkeypatch, tmp_path):
+    capture_dir = tmp_path / "capture"
+    _write_corrupt_capture(capture_dir)
+    monkeypatch.setattr(
+        routes,
+        "generate_har",
+        functools.partial(
+            generate_har,
+            runner=lambda _command: pytest.fail("unexpected HAR conversion"),
+            lock_path=str(tmp_path / "har.lock"),
+            capture_dir=str(capture_dir),
+            output_path=str(tmp_path / "dump.har"),
+            filtered_flow_path=str(tmp_path / "dump.filtered.flow"),
+        ),
+    )
+
+    response = _create_client().get("/har?host=api.example")
+
+    assert response.status_code == 502
+    payload = response.get_json()
+    assert payload["error"] == "HAR generation failed"
+    assert "tnetstring length" in payload["details"]
+
+
+def test_har_route_passes_query_filters_to_generation(monkeypatch, tmp_path):
+    har_path = tmp_path / "dump.har"
+    har_path.write_text('{"log": {}}', encoding="utf-8")
+    calls: list[dict] = []
+
+    def fake_generate_har(**kwargs):
+        calls.append(kwargs)
+        return str(har_path)
+
+    monkeypatch.setattr(routes, "generate_har", fake_generate_har)
+    client = _create_client()
+
+    response = client.get(
+        "/har?since=100&until=1970-01-01T00:05:00&host=api.example"
+        "&path_prefix=/v1&method=get&status=200-299&no_bodies=true"
+    )
+
+    assert response.status_code == 200
+    assert calls == [
+        {
+            "flow_filter": FlowFilter(
+                since=100.0,
+                until=300.0,
+                host="api.example",
+                path_prefix="/v1",
+                method="get",
+                status_min=200,
+                status_max=299,
+            ),
+            "strip_bodies": True,
+        }
+    ]
+
+
+def test_har_route_accepts_single_status_code(monkeypatch, tmp_path):
+    har_path = tmp_path / "dump.har"
+    har_path.write_text('{"log": {}}', encoding="utf-8")
+    calls: list[dict] = []
+    monkeypatch.setattr(
+        routes,
+        "generate_har",
+        lambda **kwargs: calls.append(kwargs) or str(har_path),
+    )
+
+    response = _create_client().get("/har?status=404")
+
+    assert response.status_code == 200
+    assert calls[0]["flow_filter"] == FlowFilter(status_min=404, status_max=404)
+    assert calls[0]["strip_bodies"] is False
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["since=yesterday", "until=1.2.3", "status=abc", "status=500-200"],
+)
+def test_har_route_returns_bad_request_for_invalid_filters(monkeypatch, query):
+    def _unexpected_generate_har(**_kwargs):
+        raise AssertionError("HAR generation must not run for invalid filters")
+
+    monkeypatch.setattr(routes, "generate_har", _unexpected_generate_har)
+
+    response = _create_client().get(f"/har?{query}")
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid HAR filter"
+
+
+def test_flow_summary_route_returns_parquet_by_default(monkeypatch):
+    calls = []
+
+    def _build_flow_table(**kwargs):
+        calls.append(kwargs)
+        return pa.table({"path": ["/a"]})
+
+    monkeypatch.setattr(routes, "build_flow_table", _build_flow_table)
+    client = _create_client()
+
+    response = client.get("/flows/summary?host=api.example")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/vnd.apache.parquet"
+    assert calls == [{"flow_filter": FlowFilter(host="api.example")}]
+    assert pq.read_table(io.BytesIO(response.data)).column("path").to_pylist() == ["/a"]
+
+
+def test_flow_summary_route_returns_arrow_ipc(monkeypatch):
+    monkeypatch.setattr(
+        routes, "build_flow_table", lambda **_kwargs: pa.table({"path": ["/a"]})
+    )
+    client = _create_client()
+
+    response = client.get("/flows/summary?format=arrow")
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/vnd.apache.arrow.file"
+    assert pyarrow.ipc.open_file(response.data).read_all().num_rows == 1
+
+
+def test_flow_summary_route_returns_bad_gateway_for_corrupt_capture(
+    monkeypatch, tmp_path
+):
+    capture_dir = tmp_path / "capture"
+    _write_corrupt_capture(capture_dir)
+    monkeypatch.setattr(
+        routes,
+        "build_flow_table",
+        functools.partial(build_flow_table, capture_dir=str(capture_dir)),
+    )
+
+    response = _create_client().get("/flows/summary")
+
+    assert response.status_code == 502
+    payload = response.get_json()
+    assert payload["error"] == "Flow summary failed"
+    assert "tnetstring length" in payload["details"]
+
+
+def test_flow_summary_route_returns_bad_gateway_on_arrow_error(monkeypatch):
+    def _write_flow_table(_table, _sink, *, table_format):
+        raise pa.ArrowInvalid("cannot write table")
+
+    monkeypatch.setattr(
+        routes, "build_flow_table", lambda **_kwargs: pa.table({"path": ["/a"]})
+    )
+    monkeypatch.setattr(routes, "write_flow_table", _write_flow_table)
+
+    response = _create_client().get("/flows/summary")
+
+    assert response.status_code == 502
+    assert response.get_json() == {
+        "error": "Flow summary failed",
+        "details": "cannot write table",
+    }
+
+
+@pytest.mark.parametrize("query", ["format=csv", "status=abc"])
+def test_flow_summary_route_rejects_invalid_requests(monkeypatch, query):
+    monkeypatch.setattr(
+        routes, "build_flow_table", lambda **_kwargs: pytest.fail("unexpected build")
+    )
+    client = _create_client()
+
+    response = client.get(f"/flows/summary?{query}")
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid flow summary request"
+
+
+def test_flow_latency_route_returns_report(monkeypatch):
+    calls = []
+
+    def _build_latency_report(**kwargs):
+        calls.append(kwargs)
+        return {"endpoints": []}
+
+    monkeypatch.setattr(routes, "build_latency_report", _build_latency_report)
+    client = _create_client()
+
+    response = client.get("/flows/latency?minutes=5&host=api.example")
+
+    assert response.status_code == 200
+    assert response.get_json() == {"endpoints": []}
+    assert calls == [{"minutes": 5, "host": "api.example"}]
+
+
+def test_flow_latency_route_returns_bad_gateway_for_corrupt_capture(
+    monkeypatch, tmp_path
+):
+    capture_dir = tmp_path / "capture"
+    _write_corrupt_capture(capture_dir)
+    monkeypatch.setattr(
+        routes,
+        "build_latency_report",
+        functools.partial(build_latency_report, capture_dir=str(capture_dir)),
+    )
+
+    response = _create_client().get("/flows/latency?minutes=5")
+
+    assert response.status_code == 502
+    payload = response.get_json()
+    assert payload["error"] == "Latency report failed"
+    assert "tnetstring length" in payload["details"]
+
+
+@pytest.mark.parametrize("minutes", ["0", "-1", "abc"])
+def test_flow_latency_route_rejects_invalid_window(monkeypatch, minutes):
+    monkeypatch.setattr(
+        routes, "build_latency_report", lambda **_kwargs: pytest.fail("unexpected")
+    )
+    client = _create_client()
+
+    response = client.get(f"/flows/latency?minutes={minutes}")
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid latency report request"
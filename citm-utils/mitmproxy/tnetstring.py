@@ -0,0 +1,135 @@
+from typing import Any
+
+# mitmproxy persists flows as concatenated tnetstrings. This module implements
+# the subset of the format needed to read and rewrite those records without
+# importing mitmproxy itself.
+
+TNetstringValue = Any
+
+
+_TAG_BYTES = ord(",")
+_TAG_STR = ord(";")
+_TAG_INT = ord("#")
+_TAG_FLOAT = ord("^")
+_TAG_BOOL = ord("!")
+_TAG_NULL = ord("~")
+_TAG_LIST = ord("]")
+_TAG_DICT = ord("}")
+
+
+class TNetstringError(ValueError):
+    pass
+
+
+def dumps(value: TNetstringValue) -> bytes:
+    chunks: list[bytes] = []
+    _dump(value, chunks)
+    return b"".join(chunks)
+
+
+def _frame(payload: bytes, tag: bytes) -> bytes:
+    return b"%d:%s%s" % (len(payload), payload, tag)
+
+
+def _dump(value: TNetstringValue, chunks: list[bytes]) -> None:
+    if value is None:
+        chunks.append(b"0:~")
+    elif isinstance(value, bool):
+        chunks.append(_frame(b"true" if value else b"false", b"!"))
+    elif isinstance(value, int):
+        chunks.append(_frame(str(value).encode(), b"#"))
+    elif isinstance(value, float):
+        chunks.append(_frame(repr(value).encode(), b"^"))
+    elif isinstance(value, bytes):
+        chunks.append(_frame(value, b","))
+    elif isinstance(value, str):
+        chunks.append(_frame(value.encode("utf-8"), b";"))
+    elif isinstance(value, (list, tuple)):
+        chunks.append(_frame(b"".join(dumps(item) for item in value), b"]"))
+    elif isinstance(value, dict):
+        chunks.append(
+            _frame(
+                b"".join(dumps(key) + dumps(item) for key, item in value.items()),
+                b"}",
+            )
+        )
+    else:
+        raise TNetstringError(f"Unsupported tnetstring value: {type(value)!r}")
+
+
+def parse_length_prefix(data: bytes) -> tuple[int, int] | None:
+    colon = data.find(b":", 0, 12)
+    if colon == -1:
+        if len(data) >= 12:
+            raise TNetstringError("Missing tnetstring length separator")
+        return None
+    digits = data[:colon]
+    if not digits.isdigit():
+        raise TNetstringError(f"Invalid tnetstring length {digits!r}")
+    return colon + 1, int(digits)
+
+
+def record_size(data: bytes) -> int | None:
+    prefix = parse_length_prefix(data)
+    if prefix is None:
+        return None
+    header_size, payload_size = prefix
+    return header_size + payload_size + 1
+
+
+def loads(data: bytes) -> TNetstringValue:
+    value, end = _parse(data, 0, len(data))
+    if end != len(data):
+        raise TNetstringError("Trailing data after tnetstring value")
+    return value
+
+
+def _parse(data: bytes, start: int, limit: int) -> tuple[TNetstringValue, int]:
+    colon = data.find(b":", start, min(start + 12, limit))
+    if colon == -1:
+        raise TNetstringError("Truncated tnetstring length")
+    digits = data[start:colon]
+    if not digits.isdigit():
+        raise TNetstringError(f"Invalid tnetstring length {digits!r}")
+    payload_start = colon + 1
+    payload_end = payload_start + int(digits)
+    if payload_end >= limit:
+        raise TNetstringError("Truncated tnetstring payload")
+    tag = data[payload_end]
+    return _decode(data, payload_start, payload_end, tag), payload_end + 1
+
+
+def _decode(data: bytes, start: int, end: int, tag: int) -> TNetstringValue:
+    if tag == _TAG_BYTES:
+        return data[start:end]
+    if tag == _TAG_STR:
+        return data[start:end].decode("utf-8")
+    if tag == _TAG_INT:
+        return int(data[start:end])
+    if tag == _TAG_FLOAT:
+        return float(data[start:end])
+    if tag == _TAG_BOOL:
+        payload = data[start:end]
+        if payload not in {b"true", b"false"}:
+            raise TNetstringError(f"Invalid tnetstring boolean {payload!r}")
+        return payload == b"true"
+    if tag == _TAG_NULL:
+        if end != start:
+            raise TNetstringError("Invalid tnetstring null")
+        return None
+    if tag == _TAG_LIST:
+        items = []
+        while start < end:
+            item, start = _parse(data, start, end)
+            items.append(item)
+        return items
+    if tag == _TAG_DICT:
+        mapping = {}
+        while start < end:
+            key, start = _parse(data, start, end)
+            item, start = _parse(data, start, end)
+            if isinstance(key, bytes):
+                key = key.decode("utf-8")
+            mapping[key] = item
+        return mapping
+    raise TNetstringError(f"Unknown tnetstring type tag {bytes([tag])!r}")
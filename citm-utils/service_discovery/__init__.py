@@ -1,11 +1,16 @@
 from .discovery import (
     DnsRecordSet,
+    SrvRecord,
     get_citm_dns_entries,
     get_citm_dns_record_sets,
 )
+from .registry import DiscoveryRegistry, DiscoverySnapshot
 
 __all__ = [
+    "DiscoveryRegistry",
+    "DiscoverySnapshot",
     "DnsRecordSet",
+    "SrvRecord",
     "get_citm_dns_entries",
     "get_citm_dns_record_sets",
 ]
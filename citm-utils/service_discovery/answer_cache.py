@@ -0,0 +1,217 @@
+import struct
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from dnslib import DNSRecord, QTYPE, RCODE
+
+from .wire import DNS_HEADER_SIZE, question_end, skip_name
+
+DEFAULT_ANSWER_CACHE_MAX_ENTRIES = 10000
+MAX_POSITIVE_TTL_SECONDS = 86400
+MAX_NEGATIVE_TTL_SECONDS = 3600
+DEFAULT_SERVE_STALE_SECONDS = 86400.0
+STALE_ANSWER_TTL_SECONDS = 30
+PREFETCH_TTL_FRACTION = 0.1
+PREFETCH_MIN_HITS = 2
+CACHEABLE_RCODES = frozenset({RCODE.NOERROR, RCODE.NXDOMAIN})
+EDNS_DO_FLAG = 0x8000
+
+ANSWER_SECTION = 0
+AUTHORITY_SECTION = 1
+
+AnswerCacheKey = tuple[str, int, int, bool, bool, bool]
+
+
+@dataclass(frozen=True)
+class _ResourceRecord:
+    section: int
+    rtype: int
+    ttl_offset: int
+    ttl: int
+    rdata_end: int
+
+
+@dataclass
+class _CachedAnswer:
+    response: bytes
+    question_end: int
+    ttl_offsets: tuple[tuple[int, int], ...]
+    stored_at: float
+    expires_at: float
+    ttl: int
+    hits: int = 0
+
+
+def answer_cache_key(request: DNSRecord) -> AnswerCacheKey:
+    dnssec_ok = any(
+        rr.rtype == QTYPE.OPT and rr.ttl & EDNS_DO_FLAG for rr in request.ar
+    )
+    return (
+        str(request.q.qname).lower().rstrip("."),
+        request.q.qtype,
+        request.q.qclass,
+        bool(request.header.rd),
+        bool(request.header.cd),
+        dnssec_ok,
+    )
+
+
+def _parse_records(data: bytes) -> tuple[int, list[_ResourceRecord]]:
+    counts = struct.unpack_from("!3H", data, 6)
+    questions_end = offset = question_end(data)
+    records = []
+    for section, count in enumerate(counts):
+        for _ in range(count):
+            offset = skip_name(data, offset)
+            rtype, _rclass, ttl, rdlength = struct.unpack_from("!HHIH", data, offset)
+            rdata_end = offset + 10 + rdlength
+            records.append(_ResourceRecord(section, rtype, offset + 4, ttl, rdata_end))
+            offset = rdata_end
+    if offset > len(data):
+        raise ValueError("Truncated DNS message")
+    return questions_end, records
+
+
+def _answer_ttl(
+    data: bytes, rcode: int, records: list[_ResourceRecord]
+) -> tuple[int, bool]:
+    answers = [record for record in records if record.section == ANSWER_SECTION]
+    if rcode == RCODE.NOERROR and answers:
+        ttl = min(record.ttl for record in answers)
+        return min(ttl, MAX_POSITIVE_TTL_SECONDS), False
+    for record in records:
+        if record.section == AUTHORITY_SECTION and record.rtype == QTYPE.SOA:
+            minimum = struct.unpack_from("!I", data, record.rdata_end - 4)[0]
+            return min(record.ttl, minimum, MAX_NEGATIVE_TTL_SECONDS), True
+    return 0, True
+
+
+def _adopt_query(response: bytearray, request_bytes: bytes, end: int) -> None:
+    response[:2] = request_bytes[:2]
+    if question_end(request_bytes) == end:
+        response[DNS_HEADER_SIZE:end] = request_bytes[DNS_HEADER_SIZE:end]
+
+
+def answer_for_query(response: bytes, request_bytes: bytes) -> bytes:
+    try:
+        adopted = bytearray(response)
+        _adopt_query(adopted, request_bytes, question_end(response))
+    except (IndexError, struct.error):
+        return response
+    return bytes(adopted)
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_ANSWER_CACHE_MAX_ENTRIES,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        serve_stale_seconds: float = DEFAULT_SERVE_STALE_SECONDS,
+    ):
+        self._max_entries = max_entries
+        self._clock = clock
+        self._serve_stale_seconds = serve_stale_seconds
+        self._entries: OrderedDict[AnswerCacheKey, _CachedAnswer] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: AnswerCacheKey, request_bytes: bytes) -> bytes | None:
+        entry = self._entries.get(key)
+        now = self._clock()
+        if entry is not None and now >= entry.expires_at:
+            if now >= entry.expires_at + self._serve_stale_seconds:
+                del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        entry.hits += 1
+        response = bytearray(entry.response)
+        _adopt_query(response, request_bytes, entry.question_end)
+        elapsed = int(now - entry.stored_at)
+        for ttl_offset, ttl in entry.ttl_offsets:
+            struct.pack_into("!I", response, ttl_offset, max(ttl - elapsed, 0))
+        return bytes(response)
+
+    def has_stale(self, key: AnswerCacheKey) -> bool:
+        entry = self._entries.get(key)
+        return (
+            entry is not None
+            and entry.expires_at
+            <= self._clock()
+            < entry.expires_at + self._serve_stale_seconds
+        )
+
+    def get_stale(self, key: AnswerCacheKey, request_bytes: bytes) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._clock() >= entry.expires_at + self._serve_stale_seconds:
+            return None
+
+        self.stale_hits += 1
+        response = bytearray(entry.response)
+        _adopt_query(response, request_bytes, entry.question_end)
+        for ttl_offset, ttl in entry.ttl_offsets:
+            struct.pack_into(
+                "!I", response, ttl_offset, min(ttl, STALE_ANSWER_TTL_SECONDS)
+            )
+        return bytes(response)
+
+    def needs_prefetch(self, key: AnswerCacheKey) -> bool:
+        entry = self._entries.get(key)
+        if entry is None or entry.hits < PREFETCH_MIN_HITS:
+            return False
+        remaining = entry.expires_at - self._clock()
+        return 0 < remaining <= entry.ttl * PREFETCH_TTL_FRACTION
+
+    def put(self, key: AnswerCacheKey, response: bytes) -> None:
+        try:
+            flags = struct.unpack_from("!H", response, 2)[0]
+            rcode = flags & 0xF
+            truncated = flags & 0x0200
+            if truncated or rcode not in CACHEABLE_RCODES:
+                return
+            questions_end, records = _parse_records(response)
+            ttl, negative = _answer_ttl(response, rcode, records)
+        except (IndexError, struct.error, ValueError):
+            return
+        if ttl <= 0:
+            return
+
+        now = self._clock()
+        self._entries[key] = _CachedAnswer(
+            response=response,
+            question_end=questions_end,
+            ttl_offsets=tuple(
+                (record.ttl_offset, min(record.ttl, ttl) if negative else record.ttl)
+                for record in records
+                if record.rtype != QTYPE.OPT
+            ),
+            stored_at=now,
+            expires_at=now + ttl,
+            ttl=ttl,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict[str, float | int]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,110 @@
+import functools
+import math
+import random
+from dataclasses import replace
+
+from .discovery import DEFAULT_WEIGHT, DnsRecordSet
+from .wire import UNCHANGED_ORDER, AddressOrder
+
+ANSWER_ORDER_FIXED = "fixed"
+ANSWER_ORDER_ROUND_ROBIN = "round-robin"
+ANSWER_ORDER_RANDOM = "random"
+ANSWER_ORDER_WEIGHTED = "weighted"
+ANSWER_ORDERS = (
+    ANSWER_ORDER_FIXED,
+    ANSWER_ORDER_ROUND_ROBIN,
+    ANSWER_ORDER_RANDOM,
+    ANSWER_ORDER_WEIGHTED,
+)
+DEFAULT_ANSWER_ORDER = ANSWER_ORDER_ROUND_ROBIN
+ROTATION_CACHE_SIZE = 1024
+
+
+@functools.lru_cache(maxsize=ROTATION_CACHE_SIZE)
+def _rotation(count: int, offset: int) -> tuple[int, ...] | None:
+    if count < 2 or offset % count == 0:
+        return None
+    offset %= count
+    return tuple(range(offset, count)) + tuple(range(offset))
+
+
+def _ordered(
+    addresses: tuple[str, ...], order: tuple[int, ...] | None
+) -> tuple[str, ...]:
+    if order is None:
+        return addresses
+    return tuple(addresses[index] for index in order)
+
+
+def ordered_record_set(record_set: DnsRecordSet, order: AddressOrder) -> DnsRecordSet:
+    if order == UNCHANGED_ORDER:
+        return record_set
+    return replace(
+        record_set,
+        ipv4=_ordered(record_set.ipv4, order[0]),
+        ipv6=_ordered(record_set.ipv6, order[1]),
+    )
+
+
+class AnswerOrder:
+    def __init__(
+        self,
+        mode: str = DEFAULT_ANSWER_ORDER,
+        *,
+        rng: random.Random | None = None,
+    ):
+        self.mode = mode
+        self._random = rng or random.Random()
+        self._rotations: dict[str, int] = {}
+        self._weights: dict[str, tuple[tuple[int, ...], tuple[int, ...]]] = {}
+        self._version: int | None = None
+
+    def _shuffled(self, count: int) -> tuple[int, ...] | None:
+        if count < 2:
+            return None
+        return tuple(self._random.sample(range(count), count))
+
+    def _weighted(self, weights: tuple[int, ...]) -> tuple[int, ...] | None:
+        if len(weights) < 2:
+            return None
+        return tuple(
+            sorted(
+                range(len(weights)),
+                key=lambda index: self._random.random() ** (1 / weights[index]),
+                reverse=True,
+            )
+        )
+
+    def _address_weights(
+        self, name: str, record_set: DnsRecordSet
+    ) -> tuple[tuple[int, ...], tuple[int, ...]]:
+        weights = self._weights.get(name)
+        if weights is None:
+            by_address = dict(record_set.weights)
+            weights = self._weights[name] = (
+                tuple(by_address.get(ip, DEFAULT_WEIGHT) for ip in record_set.ipv4),
+                tuple(by_address.get(ip, DEFAULT_WEIGHT) for ip in record_set.ipv6),
+            )
+        return weights
+
+    def arrange(
+        self, name: str, record_set: DnsRecordSet, *, version: int = 0
+    ) -> AddressOrder:
+        ipv4_count = len(record_set.ipv4)
+        ipv6_count = len(record_set.ipv6)
+        if self.mode == ANSWER_ORDER_FIXED or (ipv4_count < 2 and ipv6_count < 2):
+            return UNCHANGED_ORDER
+        if version != self._version:
+            self._rotations.clear()
+            self._weights.clear()
+            self._version = version
+        if self.mode == ANSWER_ORDER_ROUND_ROBIN:
+            offset = self._rotations.get(name, 0)
+            self._rotations[name] = (offset + 1) % math.lcm(
+                ipv4_count or 1, ipv6_count or 1
+            )
+            return _rotation(ipv4_count, offset), _rotation(ipv6_count, offset)
+        if self.mode == ANSWER_ORDER_RANDOM:
+            return self._shuffled(ipv4_count), self._shuffled(ipv6_count)
+        ipv4_weights, ipv6_weights = self._address_weights(name, record_set)
+        return self._weighted(ipv4_weights), self._weighted(ipv6_weights)
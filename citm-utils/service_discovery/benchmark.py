@@ -0,0 +1,847 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import docker
+from dnslib import A, EDNS0, SOA, DNSRecord, QTYPE, RCODE, RR
+
+from .discovery import DnsRecordSet, get_container_records, list_container_records
+from .dns_forwarder import (
+    DEFAULT_RECORD_TTL_SECONDS,
+    DnsForwarder,
+    build_local_response,
+)
+from .dns_server import DEFAULT_MAX_CONCURRENT_QUERIES, DnsServer
+from .registry import DiscoverySnapshot
+from .suffix_trie import SuffixTrie
+from .upstream import TcpUpstream, UdpUpstream
+from .wire import local_answer, parse_query
+
+DOCKER_API_VERSION = "1.43"
+BENCHMARK_NETWORK = "citm-benchmark"
+DEFAULT_BENCHMARK_CONTAINERS = 1000
+DEFAULT_BENCHMARK_ROUNDS = 5
+DEFAULT_BENCHMARK_NAMES = 5000
+DEFAULT_BENCHMARK_QUERIES = 2000
+DEFAULT_BENCHMARK_DNS_QUERIES = 20000
+DEFAULT_BENCHMARK_CONCURRENCY = 64
+BENCHMARK_QUERY_TIMEOUT_SECONDS = 2.0
+LOAD_QUERY_TIMEOUT_SECONDS = BENCHMARK_QUERY_TIMEOUT_SECONDS + 1.0
+LOAD_ANSWER_DEADLINE_SECONDS = 1.0
+DEFAULT_LOAD_QPS = 2000
+DEFAULT_LOAD_DURATION_SECONDS = 5.0
+DEFAULT_LOAD_TCP_RATIO = 0.1
+DEFAULT_LOAD_TCP_CONNECTIONS = 4
+DEFAULT_LOAD_MIX = {"local": 4, "cached": 4, "cold": 1, "nxdomain": 1}
+LOAD_CACHED_NAMES = 100
+LOAD_QUANTILES = (0.5, 0.99, 0.999)
+
+_API_PATH_PATTERN = re.compile(r"^/v[\d.]+(?P<path>/.*)$")
+
+
+def _container_ip(index: int) -> str:
+    return f"10.{(index >> 16) & 0xFF}.{(index >> 8) & 0xFF}.{index & 0xFF}"
+
+
+class FakeDockerApi:
+    def __init__(
+        self,
+        *,
+        containers: int,
+        network_name: str = BENCHMARK_NETWORK,
+    ):
+        self.network_name = network_name
+        self.requests: Counter[str] = Counter()
+        self._containers: dict[str, dict[str, Any]] = {}
+        for index in range(containers):
+            container_id = f"{index:064x}"
+            self._containers[container_id] = {
+                "id": container_id,
+                "labels": {
+                    "citm_network": network_name,
+                    "citm_dns_names": f"svc-{index}.bench.internal",
+                },
+                "ipv4": _container_ip(index + 2),
+            }
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"tcp://{host}:{port}"
+
+    def __enter__(self) -> "FakeDockerApi":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_exc_info: object) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _network_settings(self, container: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "Networks": {
+                self.network_name: {
+                    "IPAddress": container["ipv4"],
+                    "GlobalIPv6Address": "",
+                }
+            }
+        }
+
+    def _list_containers(self, query: dict[str, list[str]]) -> list[dict[str, Any]]:
+        filters = json.loads(query.get("filters", ["{}"])[0])
+        label_filters = filters.get("label", [])
+        listed = []
+        for container in self._containers.values():
+            labels = container["labels"]
+            if all(
+                labels.get(key) == value if separator else key in labels
+                for key, separator, value in (
+                    label_filter.partition("=") for label_filter in label_filters
+                )
+            ):
+                listed.append(
+                    {
+                        "Id": container["id"],
+                        "Labels": labels,
+                        "State": "running",
+                        "NetworkSettings": self._network_settings(container),
+                    }
+                )
+        return listed
+
+    def _inspect_container(self, container_id: str) -> dict[str, Any] | None:
+        container = self._containers.get(container_id)
+        if container is None:
+            return None
+        return {
+            "Id": container["id"],
+            "Config": {"Labels": container["labels"]},
+            "State": {"Running": True},
+            "NetworkSettings": self._network_settings(container),
+        }
+
+    def _inspect_network(self, network_name: str) -> dict[str, Any] | None:
+        if network_name != self.network_name:
+            return None
+        return {
+            "Id": network_name,
+            "Name": network_name,
+            "Containers": {
+                container["id"]: {
+                    "IPv4Address": f"{container['ipv4']}/8",
+                    "IPv6Address": "",
+                }
+                for container in self._containers.values()
+            },
+        }
+
+    def route(self, method: str, raw_path: str) -> tuple[str, Any]:
+        url = urlsplit(raw_path)
+        match = _API_PATH_PATTERN.match(url.path)
+        path = match.group("path") if match else url.path
+        parts = path.strip("/").split("/")
+
+        if method == "GET" and parts == ["_ping"]:
+            return "ping", "OK"
+        if method == "GET" and parts == ["version"]:
+            return "version", {"ApiVersion": DOCKER_API_VERSION}
+        if method == "GET" and parts == ["containers", "json"]:
+            return "containers.list", self._list_containers(parse_qs(url.query))
+        if method == "GET" and len(parts) == 3 and parts[0] == "containers":
+            return "containers.inspect", self._inspect_container(parts[1])
+        if method == "GET" and len(parts) == 2 and parts[0] == "networks":
+            return "networks.inspect", self._inspect_network(parts[1])
+        return "unknown", None
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                endpoint, payload = api.route("GET", self.path)
+                api.requests[endpoint] += 1
+                if payload is None:
+                    status, payload = 404, {"message": "not found"}
+                else:
+                    status = 200
+                body = (
+                    payload.encode()
+                    if isinstance(payload, str)
+                    else json.dumps(payload).encode()
+                )
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def _per_container_refresh(
+    docker_client: docker.DockerClient, network_name: str
+) -> int:
+    containers = docker_client.containers.list(
+        all=False,
+        filters={"label": ["citm_dns_names", f"citm_network={network_name}"]},
+    )
+    return sum(
+        1
+        for container in containers
+        if get_container_records(container, network_name=network_name)
+    )
+
+
+def _network_scoped_refresh(
+    docker_client: docker.DockerClient, network_name: str
+) -> int:
+    return len(list_container_records(docker_client, network_name=network_name))
+
+
+def _measure(
+    api: FakeDockerApi, refresh: Callable[[], int], *, rounds: int
+) -> dict[str, Any]:
+    api.requests.clear()
+    durations = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        discovered = refresh()
+        durations.append(time.perf_counter() - started)
+    return {
+        "containers_discovered": discovered,
+        "api_calls_per_refresh": sum(api.requests.values()) / rounds,
+        "api_calls_by_endpoint": {
+            endpoint: count / rounds for endpoint, count in sorted(api.requests.items())
+        },
+        "seconds_per_refresh": {
+            "min": min(durations),
+            "mean": sum(durations) / rounds,
+            "max": max(durations),
+        },
+    }
+
+
+def benchmark_discovery(*, containers: int, rounds: int) -> dict[str, Any]:
+    with FakeDockerApi(containers=containers) as api:
+        docker_client = docker.DockerClient(
+            base_url=api.base_url, version=DOCKER_API_VERSION
+        )
+        try:
+            return {
+                "benchmark": "discovery",
+                "containers": containers,
+                "rounds": rounds,
+                "per_container_inspect": _measure(
+                    api,
+                    lambda: _per_container_refresh(docker_client, api.network_name),
+                    rounds=rounds,
+                ),
+                "network_scoped": _measure(
+                    api,
+                    lambda: _network_scoped_refresh(docker_client, api.network_name),
+                    rounds=rounds,
+                ),
+            }
+        finally:
+            docker_client.close()
+
+
+def _normalize_dns_name(name: str) -> str:
+    return name.strip().lower().rstrip(".")
+
+
+def matches_suffix(name: str, suffix: str) -> bool:
+    normalized_name = _normalize_dns_name(name)
+    normalized_suffix = _normalize_dns_name(suffix)
+    return normalized_name == normalized_suffix or normalized_name.endswith(
+        f".{normalized_suffix}"
+    )
+
+
+def select_best_suffix_match(
+    name: str, records: Mapping[str, DnsRecordSet]
+) -> str | None:
+    normalized_name = _normalize_dns_name(name)
+    matches = [
+        suffix for suffix in records.keys() if matches_suffix(normalized_name, suffix)
+    ]
+    if not matches:
+        return None
+    return max(matches, key=len)
+
+
+def _queries_per_second(
+    lookup: Callable[[str], str | None], queries: list[str]
+) -> tuple[float, int]:
+    started = time.perf_counter()
+    matched = sum(1 for query in queries if lookup(query) is not None)
+    elapsed = time.perf_counter() - started
+    return len(queries) / elapsed, matched
+
+
+def benchmark_suffix_match(*, names: int, queries: int) -> dict[str, Any]:
+    empty = DnsRecordSet(ipv4=(), ipv6=())
+    records = {f"svc-{index}.bench.internal": empty for index in range(names)}
+    query_names = [
+        (
+            f"api.svc-{index % names}.bench.internal"
+            if index % 2
+            else f"host-{index}.example.com"
+        )
+        for index in range(queries)
+    ]
+
+    build_started = time.perf_counter()
+    suffix_index = SuffixTrie(records)
+    build_seconds = time.perf_counter() - build_started
+
+    results = {}
+    for name, lookup in (
+        ("linear_scan", lambda query: select_best_suffix_match(query, records)),
+        ("suffix_trie", suffix_index.longest_match),
+    ):
+        rate, matched = _queries_per_second(lookup, query_names)
+        results[name] = {"queries_per_second": rate, "matched": matched}
+    results["suffix_trie"]["build_seconds"] = build_seconds
+
+    return {
+        "benchmark": "suffix-match",
+        "names": names,
+        "queries": queries,
+        **results,
+    }
+
+
+def _dnslib_local_answer(request_bytes: bytes, record_set: DnsRecordSet) -> bytes:
+    request = DNSRecord.parse(request_bytes)
+    return build_local_response(
+        request, record_set=record_set, ttl_seconds=DEFAULT_RECORD_TTL_SECONDS
+    ).pack()
+
+
+def _wire_local_answer(request_bytes: bytes, record_set: DnsRecordSet) -> bytes:
+    return local_answer(
+        request_bytes,
+        parse_query(request_bytes),
+        record_set,
+        ttl_seconds=DEFAULT_RECORD_TTL_SECONDS,
+    )
+
+
+def benchmark_local_answer(*, queries: int) -> dict[str, Any]:
+    record_set = DnsRecordSet(ipv4=("10.0.0.2", "10.0.0.3"), ipv6=("fd00::2",))
+    requests = []
+    for index in range(queries):
+        request = DNSRecord.question(
+            f"api-{index}.bench.internal", ("A", "AAAA", "ANY")[index % 3]
+        )
+        if index % 2:
+            request.add_ar(EDNS0(udp_len=1232))
+        requests.append(request.pack())
+
+    results = {}
+    answers = {}
+    for name, answer in (
+        ("dnslib", _dnslib_local_answer),
+        ("wire", _wire_local_answer),
+    ):
+        started = time.perf_counter()
+        answers[name] = [answer(request, record_set) for request in requests]
+        elapsed = time.perf_counter() - started
+        results[name] = {"answers_per_second": queries / elapsed}
+
+    return {
+        "benchmark": "local-answer",
+        "queries": queries,
+        **results,
+        "identical_answers": sum(
+            dnslib == wire for dnslib, wire in zip(answers["dnslib"], answers["wire"])
+        ),
+    }
+
+
+class _StaticRegistry:
+    def __init__(self, records: dict[str, DnsRecordSet]):
+        self.snapshot = DiscoverySnapshot.build(records, version=1)
+
+
+async def _upstream_answer(request_bytes: bytes, *, via_tcp: bool) -> bytes:
+    reply = DNSRecord.parse(request_bytes).reply()
+    reply.add_answer(RR(reply.q.qname, QTYPE.A, ttl=60, rdata=A("192.0.2.1")))
+    return reply.pack()
+
+
+@contextmanager
+def _event_loop_thread() -> Iterator[asyncio.AbstractEventLoop]:
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield loop
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def _run_in(loop: asyncio.AbstractEventLoop, coroutine: Any) -> Any:
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+async def _thread_cpu_seconds() -> float:
+    return time.thread_time()
+
+
+@contextmanager
+def _running_dns_servers(
+    *,
+    names: int,
+    max_concurrent_queries: int,
+    upstream_resolve: Callable[..., Any] = _upstream_answer,
+) -> Iterator[tuple[int, DnsForwarder, asyncio.AbstractEventLoop]]:
+    with _event_loop_thread() as upstream_loop, _event_loop_thread() as loop:
+        upstream = DnsServer(upstream_resolve, host="127.0.0.1", port=0)
+        _run_in(upstream_loop, upstream.start())
+        forwarder = DnsForwarder(
+            docker_client=None,
+            upstream_nameservers=["127.0.0.1"],
+            cache_ttl_seconds=60,
+            upstream_timeout_seconds=BENCHMARK_QUERY_TIMEOUT_SECONDS,
+            registry=_StaticRegistry(
+                {
+                    f"svc-{index}.bench.internal": DnsRecordSet(
+                        ipv4=(_container_ip(index + 2),), ipv6=()
+                    )
+                    for index in range(names)
+                }
+            ),
+            upstream_port=upstream.port,
+        )
+        server = DnsServer(
+            forwarder.resolve,
+            host="127.0.0.1",
+            port=0,
+            max_concurrent_queries=max_concurrent_queries,
+        )
+        _run_in(loop, server.start())
+        try:
+            yield server.port, forwarder, loop
+        finally:
+            _run_in(loop, server.close())
+            _run_in(upstream_loop, upstream.close())
+
+
+async def _send_udp_queries(
+    port: int, queries: Iterator[DNSRecord], latencies: list[float]
+) -> int:
+    loop = asyncio.get_running_loop()
+    timeouts = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+        client.setblocking(False)
+        await loop.sock_connect(client, ("127.0.0.1", port))
+        for query in queries:
+            started = time.perf_counter()
+            await loop.sock_sendall(client, query.pack())
+            try:
+                async with asyncio.timeout(BENCHMARK_QUERY_TIMEOUT_SECONDS):
+                    while (
+                        DNSRecord.parse(await loop.sock_recv(client, 65535)).header.id
+                        != query.header.id
+                    ):
+                        continue
+            except TimeoutError:
+                timeouts += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    return timeouts
+
+
+def _percentile(sorted_values: list[float], q: float) -> float | None:
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def _latency_ms(latencies: list[float], quantiles: Sequence[float]) -> dict[str, float]:
+    latencies = sorted(latencies)
+    return {
+        f"p{q * 100:g}": round(_percentile(latencies, q) * 1000, 3)
+        for q in quantiles
+        if latencies
+    }
+
+
+async def _udp_load(
+    port: int, queries: list[DNSRecord], *, concurrency: int
+) -> dict[str, Any]:
+    pending = iter(queries)
+    latencies: list[float] = []
+    started = time.perf_counter()
+    timeouts = await asyncio.gather(
+        *(_send_udp_queries(port, pending, latencies) for _ in range(concurrency))
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "answered": len(latencies),
+        "timeouts": sum(timeouts),
+        "queries_per_second": len(latencies) / elapsed,
+        "latency_ms": _latency_ms(latencies, (0.5, 0.99)),
+    }
+
+
+def benchmark_dns_server(
+    *, queries: int, concurrency: int, names: int = DEFAULT_BENCHMARK_NAMES
+) -> dict[str, Any]:
+    workloads = {
+        "local": [
+            DNSRecord.question(f"api.svc-{index % names}.bench.internal")
+            for index in range(queries)
+        ],
+        "forwarded": [
+            DNSRecord.question(f"host-{index}.example.com") for index in range(queries)
+        ],
+        "cached": [
+            DNSRecord.question(f"cached-{index % 100}.example.com")
+            for index in range(queries)
+        ],
+    }
+    with _running_dns_servers(
+        names=names, max_concurrent_queries=DEFAULT_MAX_CONCURRENT_QUERIES
+    ) as (port, forwarder, _loop):
+        results = {
+            name: asyncio.run(_udp_load(port, workload, concurrency=concurrency))
+            for name, workload in workloads.items()
+        }
+        answer_cache = forwarder.answer_cache.stats()
+        coalesced_queries = forwarder.coalesced_queries
+    return {
+        "benchmark": "dns-server",
+        "queries": queries,
+        "concurrency": concurrency,
+        **results,
+        "answer_cache": answer_cache,
+        "coalesced_queries": coalesced_queries,
+    }
+
+
+class FakeUpstream:
+    def __init__(self, *, latency_seconds: float, loss: float, seed: int = 0):
+        self._latency_seconds = latency_seconds
+        self._loss = loss
+        self._random = random.Random(seed)
+        self.queries = 0
+        self.dropped = 0
+
+    async def resolve(self, request_bytes: bytes, *, via_tcp: bool) -> bytes:
+        self.queries += 1
+        if not via_tcp and self._random.random() < self._loss:
+            self.dropped += 1
+            return b""
+        if self._latency_seconds > 0:
+            await asyncio.sleep(self._latency_seconds)
+        request = DNSRecord.parse(request_bytes)
+        reply = request.reply()
+        if str(request.q.qname).startswith("missing-"):
+            reply.header.rcode = RCODE.NXDOMAIN
+            reply.add_auth(
+                RR(
+                    "example.com",
+                    QTYPE.SOA,
+                    ttl=60,
+                    rdata=SOA(
+                        "ns.example.com",
+                        "hostmaster.example.com",
+                        (1, 3600, 600, 86400, 60),
+                    ),
+                )
+            )
+        else:
+            reply.add_answer(RR(request.q.qname, QTYPE.A, ttl=60, rdata=A("192.0.2.1")))
+        return reply.pack()
+
+
+def parse_load_mix(raw: str) -> dict[str, int]:
+    mix = {}
+    for part in raw.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in DEFAULT_LOAD_MIX or not weight.strip().isdigit():
+            raise argparse.ArgumentTypeError(
+                f"expected kind=weight pairs with kinds {', '.join(DEFAULT_LOAD_MIX)}"
+            )
+        mix[kind] = int(weight)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("at least one weight must be positive")
+    return mix
+
+
+def _load_plan(
+    *, queries: int, mix: dict[str, int], tcp_ratio: float, names: int, seed: int
+) -> list[tuple[str, bool, bytes]]:
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    plan = []
+    for index in range(queries):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "local":
+            name = f"api.svc-{index % names}.bench.internal"
+        elif kind == "cached":
+            name = f"cached-{rng.randrange(LOAD_CACHED_NAMES)}.example.com"
+        elif kind == "cold":
+            name = f"host-{index}.example.com"
+        else:
+            name = f"missing-{index}.example.com"
+        plan.append((kind, rng.random() < tcp_ratio, DNSRecord.question(name).pack()))
+    return plan
+
+
+async def _timed_query(
+    client: UdpUpstream | TcpUpstream, request_bytes: bytes, scheduled: float
+) -> tuple[float, int] | None:
+    try:
+        async with asyncio.timeout(LOAD_QUERY_TIMEOUT_SECONDS):
+            response = await client.query(request_bytes)
+    except (TimeoutError, OSError):
+        return None
+    return time.perf_counter() - scheduled, response[3] & 0xF
+
+
+async def _open_loop_load(
+    port: int,
+    plan: list[tuple[str, bool, bytes]],
+    *,
+    qps: float,
+    tcp_connections: int,
+) -> tuple[list[tuple[float, int] | None], float]:
+    udp = UdpUpstream("127.0.0.1", port)
+    tcp = TcpUpstream("127.0.0.1", port, pool_size=tcp_connections)
+    tasks = []
+    started = time.perf_counter()
+    try:
+        for index, (_kind, via_tcp, request_bytes) in enumerate(plan):
+            scheduled = started + index / qps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(
+                asyncio.create_task(
+                    _timed_query(tcp if via_tcp else udp, request_bytes, scheduled)
+                )
+            )
+        sent_seconds = time.perf_counter() - started
+        return await asyncio.gather(*tasks), sent_seconds
+    finally:
+        udp.close()
+        tcp.close()
+
+
+def _load_summary(results: list[tuple[float, int] | None]) -> dict[str, Any]:
+    received = [result for result in results if result is not None]
+    late = [
+        latency
+        for latency, _rcode in received
+        if latency > LOAD_ANSWER_DEADLINE_SECONDS
+    ]
+    rcodes = Counter(RCODE.get(rcode, str(rcode)) for _latency, rcode in received)
+    return {
+        "queries": len(results),
+        "answered": len(received) - len(late),
+        "late_answers": len(late),
+        "timeouts": len(results) - len(received),
+        "rcodes": dict(sorted(rcodes.items())),
+        "latency_ms": _latency_ms(
+            [latency for latency, _rcode in received], LOAD_QUANTILES
+        ),
+    }
+
+
+def benchmark_load(
+    *,
+    qps: float,
+    duration_seconds: float,
+    mix: dict[str, int] | None = None,
+    tcp_ratio: float = DEFAULT_LOAD_TCP_RATIO,
+    tcp_connections: int = DEFAULT_LOAD_TCP_CONNECTIONS,
+    upstream_latency_seconds: float = 0.0,
+    upstream_loss: float = 0.0,
+    names: int = DEFAULT_BENCHMARK_NAMES,
+    seed: int = 0,
+) -> dict[str, Any]:
+    mix = mix or DEFAULT_LOAD_MIX
+    plan = _load_plan(
+        queries=max(1, round(qps * duration_seconds)),
+        mix=mix,
+        tcp_ratio=tcp_ratio,
+        names=names,
+        seed=seed,
+    )
+    upstream = FakeUpstream(
+        latency_seconds=upstream_latency_seconds, loss=upstream_loss, seed=seed
+    )
+    with _running_dns_servers(
+        names=names,
+        max_concurrent_queries=DEFAULT_MAX_CONCURRENT_QUERIES,
+        upstream_resolve=upstream.resolve,
+    ) as (port, forwarder, loop):
+        cpu_started = _run_in(loop, _thread_cpu_seconds())
+        results, sent_seconds = asyncio.run(
+            _open_loop_load(port, plan, qps=qps, tcp_connections=tcp_connections)
+        )
+        cpu_seconds = _run_in(loop, _thread_cpu_seconds()) - cpu_started
+        metrics = forwarder.metrics_stats()
+
+    summary = _load_summary(results)
+    return {
+        "benchmark": "load",
+        "target_qps": qps,
+        "duration_seconds": duration_seconds,
+        "mix": mix,
+        "tcp_ratio": tcp_ratio,
+        "upstream": {
+            "latency_ms": upstream_latency_seconds * 1000,
+            "loss": upstream_loss,
+            "queries": upstream.queries,
+            "dropped": upstream.dropped,
+        },
+        **summary,
+        "sent_per_second": len(plan) / sent_seconds,
+        "answer_deadline_ms": LOAD_ANSWER_DEADLINE_SECONDS * 1000,
+        "queries_per_second": summary["answered"] / sent_seconds,
+        "forwarder_cpu_us_per_query": cpu_seconds * 1_000_000 / len(plan),
+        "by_kind": {
+            kind: _load_summary(
+                [
+                    result
+                    for (query_kind, _via_tcp, _request), result in zip(plan, results)
+                    if query_kind == kind
+                ]
+            )
+            for kind in mix
+        },
+        "by_transport": {
+            transport: _load_summary(
+                [
+                    result
+                    for (_kind, via_tcp, _request), result in zip(plan, results)
+                    if via_tcp == (transport == "tcp")
+                ]
+            )
+            for transport in ("udp", "tcp")
+        },
+        "answers": metrics["answers"],
+        "answer_cache": metrics["answer_cache"],
+        "coalesced_queries": metrics["coalesced_queries"],
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m service_discovery.benchmark")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    discovery_parser = subparsers.add_parser(
+        "discovery", help="Compare discovery refresh cost against a fake Docker API."
+    )
+    discovery_parser.add_argument(
+        "--containers", type=int, default=DEFAULT_BENCHMARK_CONTAINERS
+    )
+    discovery_parser.add_argument(
+        "--rounds", type=int, default=DEFAULT_BENCHMARK_ROUNDS
+    )
+
+    suffix_parser = subparsers.add_parser(
+        "suffix-match", help="Compare linear suffix matching with the suffix trie."
+    )
+    suffix_parser.add_argument("--names", type=int, default=DEFAULT_BENCHMARK_NAMES)
+    suffix_parser.add_argument("--queries", type=int, default=DEFAULT_BENCHMARK_QUERIES)
+
+    local_parser = subparsers.add_parser(
+        "local-answer", help="Compare dnslib and wire-format local answers."
+    )
+    local_parser.add_argument(
+        "--queries", type=int, default=DEFAULT_BENCHMARK_DNS_QUERIES
+    )
+
+    dns_parser = subparsers.add_parser(
+        "dns-server", help="Measure UDP query throughput and latency of the server."
+    )
+    dns_parser.add_argument(
+        "--queries", type=int, default=DEFAULT_BENCHMARK_DNS_QUERIES
+    )
+    dns_parser.add_argument(
+        "--concurrency", type=int, default=DEFAULT_BENCHMARK_CONCURRENCY
+    )
+
+    load_parser = subparsers.add_parser(
+        "load",
+        help="Replay a mixed UDP/TCP query load at a target rate against a fake "
+        "upstream.",
+    )
+    load_parser.add_argument("--qps", type=float, default=DEFAULT_LOAD_QPS)
+    load_parser.add_argument(
+        "--duration", type=float, default=DEFAULT_LOAD_DURATION_SECONDS
+    )
+    load_parser.add_argument(
+        "--mix",
+        type=parse_load_mix,
+        default=DEFAULT_LOAD_MIX,
+        help="Comma-separated kind=weight pairs for local, cached, cold, and "
+        "nxdomain queries.",
+    )
+    load_parser.add_argument("--tcp-ratio", type=float, default=DEFAULT_LOAD_TCP_RATIO)
+    load_parser.add_argument(
+        "--tcp-connections", type=int, default=DEFAULT_LOAD_TCP_CONNECTIONS
+    )
+    load_parser.add_argument("--upstream-latency-ms", type=float, default=0.0)
+    load_parser.add_argument("--upstream-loss", type=float, default=0.0)
+    load_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.benchmark == "discovery":
+        result = benchmark_discovery(containers=args.containers, rounds=args.rounds)
+    elif args.benchmark == "suffix-match":
+        result = benchmark_suffix_match(names=args.names, queries=args.queries)
+    elif args.benchmark == "local-answer":
+        result = benchmark_local_answer(queries=args.queries)
+    elif args.benchmark == "load":
+        result = benchmark_load(
+            qps=args.qps,
+            duration_seconds=args.duration,
+            mix=args.mix,
+            tcp_ratio=args.tcp_ratio,
+            tcp_connections=args.tcp_connections,
+            upstream_latency_seconds=args.upstream_latency_ms / 1000,
+            upstream_loss=args.upstream_loss,
+            seed=args.seed,
+        )
+    else:
+        result = benchmark_dns_server(
+            queries=args.queries, concurrency=args.concurrency
+        )
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
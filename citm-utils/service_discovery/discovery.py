@@ -1,21 +1,35 @@
 import os
 from collections import defaultdict
+from collections.abc import Iterable
 from dataclasses import dataclass
 
+import docker
 from docker import DockerClient
 
+SRV_PROTOCOLS = ("tcp", "udp")
+DEFAULT_WEIGHT = 1
+
+
+@dataclass(frozen=True, order=True)
+class SrvRecord:
+    service: str
+    protocol: str
+    port: int
+
 
 @dataclass(frozen=True)
 class DnsRecordSet:
     ipv4: tuple[str, ...]
     ipv6: tuple[str, ...]
+    srv: tuple[SrvRecord, ...] = ()
+    weights: tuple[tuple[str, int], ...] = ()
 
 
 def _normalize_dns_name(name: str) -> str:
     return name.strip().lower().rstrip(".")
 
 
-def _get_discovery_network(explicit_network: str | None = None) -> str | None:
+def get_discovery_network(explicit_network: str | None = None) -> str | None:
     if explicit_network:
         return explicit_network
     return os.getenv("CITM_DNS_NETWORK") or os.getenv("CITM_NETWORK")
@@ -34,10 +48,26 @@ def _list_discoverable_containers(
         if network_name
         else {"label": ["citm_network", "citm_dns_names"]}
     )
-    containers = docker_client.containers.list(all=False, filters=filters)
+    containers = docker_client.containers.list(all=False, filters=filters, sparse=True)
     return sorted(containers, key=lambda container: container.id)
 
 
+def _list_network_endpoints(
+    docker_client: DockerClient, network_name: str
+) -> dict[str, dict[str, str]]:
+    try:
+        network = docker_client.networks.get(network_name)
+    except docker.errors.NotFound:
+        return {}
+    return {
+        container_id: {
+            "IPAddress": (endpoint.get("IPv4Address") or "").split("/", 1)[0],
+            "GlobalIPv6Address": (endpoint.get("IPv6Address") or "").split("/", 1)[0],
+        }
+        for container_id, endpoint in (network.attrs.get("Containers") or {}).items()
+    }
+
+
 def _to_dns_names(raw_names: str) -> list[str]:
     return [
         normalized
@@ -46,49 +76,154 @@ def _to_dns_names(raw_names: str) -> list[str]:
     ]
 
 
-def get_citm_dns_record_sets(
+def _to_srv_records(raw_services: str) -> list[SrvRecord]:
+    records = []
+    for entry in raw_services.split(","):
+        service, _, port_spec = entry.strip().lower().partition(":")
+        port, _, protocol = port_spec.partition("/")
+        protocol = protocol or SRV_PROTOCOLS[0]
+        if not service or protocol not in SRV_PROTOCOLS or not port.isdigit():
+            continue
+        if 0 < int(port) < 65536:
+            records.append(SrvRecord(service.lstrip("_"), protocol, int(port)))
+    return records
+
+
+def _to_weight(raw_weight: str | None) -> int:
+    if raw_weight is None or not raw_weight.strip().isdigit():
+        return DEFAULT_WEIGHT
+    return int(raw_weight) or DEFAULT_WEIGHT
+
+
+def _is_unhealthy(attrs: dict) -> bool:
+    state = attrs.get("State")
+    if isinstance(state, dict):
+        return (state.get("Health") or {}).get("Status") == "unhealthy"
+    return "(unhealthy)" in (attrs.get("Status") or "")
+
+
+@dataclass(frozen=True)
+class ContainerRecords:
+    dns_names: tuple[str, ...]
+    ipv4: str
+    ipv6: str
+    srv: tuple[SrvRecord, ...] = ()
+    weight: int = DEFAULT_WEIGHT
+    healthy: bool = True
+
+
+def _to_container_records(
+    labels: dict[str, str],
+    networks: dict[str, dict[str, str]],
+    *,
+    network_name: str | None,
+    healthy: bool = True,
+) -> ContainerRecords | None:
+    container_network = labels.get("citm_network")
+    if not container_network:
+        return None
+    if network_name and container_network != network_name:
+        return None
+
+    network = networks.get(container_network)
+    if not network:
+        return None
+
+    ipv4 = (network.get("IPAddress") or "").strip()
+    ipv6 = (network.get("GlobalIPv6Address") or "").strip()
+    if not ipv4 and not ipv6:
+        return None
+
+    dns_names = _to_dns_names(labels.get("citm_dns_names", ""))
+    if not dns_names:
+        return None
+    return ContainerRecords(
+        dns_names=tuple(dns_names),
+        ipv4=ipv4,
+        ipv6=ipv6,
+        srv=tuple(_to_srv_records(labels.get("citm_dns_srv", ""))),
+        weight=_to_weight(labels.get("citm_dns_weight")),
+        healthy=healthy,
+    )
+
+
+def get_container_records(
+    container, *, network_name: str | None
+) -> ContainerRecords | None:
+    return _to_container_records(
+        container.labels,
+        container.attrs["NetworkSettings"]["Networks"],
+        network_name=network_name,
+        healthy=not _is_unhealthy(container.attrs),
+    )
+
+
+def list_container_records(
     docker_client: DockerClient, *, network_name: str | None = None
-) -> dict[str, DnsRecordSet]:
-    selected_network = _get_discovery_network(network_name)
+) -> dict[str, ContainerRecords]:
+    selected_network = get_discovery_network(network_name)
     containers = _list_discoverable_containers(
         docker_client, network_name=selected_network
     )
-
-    records: dict[str, dict[str, set[str]]] = defaultdict(
-        lambda: {"ipv4": set(), "ipv6": set()}
+    endpoints = (
+        _list_network_endpoints(docker_client, selected_network)
+        if selected_network
+        else {}
     )
 
+    container_records: dict[str, ContainerRecords] = {}
     for container in containers:
-        container_network = container.labels.get("citm_network")
-        if not container_network:
-            continue
-        if selected_network and container_network != selected_network:
-            continue
-
-        network = container.attrs["NetworkSettings"]["Networks"].get(container_network)
-        if not network:
-            continue
+        if selected_network:
+            endpoint = endpoints.get(container.id)
+            networks = {selected_network: endpoint} if endpoint else {}
+        else:
+            networks = (container.attrs.get("NetworkSettings") or {}).get(
+                "Networks"
+            ) or {}
+        records = _to_container_records(
+            container.attrs.get("Labels") or {},
+            networks,
+            network_name=selected_network,
+            healthy=not _is_unhealthy(container.attrs),
+        )
+        if records is not None:
+            container_records[container.id] = records
+    return container_records
 
-        ipv4 = (network.get("IPAddress") or "").strip()
-        ipv6 = (network.get("GlobalIPv6Address") or "").strip()
 
-        if not ipv4 and not ipv6:
-            continue
+def merge_container_records(
+    container_records: Iterable[ContainerRecords],
+) -> dict[str, DnsRecordSet]:
+    entries_by_name: dict[str, list[ContainerRecords]] = defaultdict(list)
+    for entry in container_records:
+        for dns_name in entry.dns_names:
+            entries_by_name[dns_name].append(entry)
+
+    records = {}
+    for dns_name, entries in sorted(entries_by_name.items()):
+        healthy = [entry for entry in entries if entry.healthy]
+        entries = healthy or entries
+        weights = {
+            ip: entry.weight
+            for entry in entries
+            for ip in (entry.ipv4, entry.ipv6)
+            if ip and entry.weight != DEFAULT_WEIGHT
+        }
+        records[dns_name] = DnsRecordSet(
+            ipv4=tuple(sorted({entry.ipv4 for entry in entries if entry.ipv4})),
+            ipv6=tuple(sorted({entry.ipv6 for entry in entries if entry.ipv6})),
+            srv=tuple(sorted({srv for entry in entries for srv in entry.srv})),
+            weights=tuple(sorted(weights.items())),
+        )
+    return records
 
-        dns_names = _to_dns_names(container.labels.get("citm_dns_names", ""))
-        for dns_name in dns_names:
-            if ipv4:
-                records[dns_name]["ipv4"].add(ipv4)
-            if ipv6:
-                records[dns_name]["ipv6"].add(ipv6)
 
-    return {
-        dns_name: DnsRecordSet(
-            ipv4=tuple(sorted(families["ipv4"])),
-            ipv6=tuple(sorted(families["ipv6"])),
-        )
-        for dns_name, families in sorted(records.items())
-    }
+def get_citm_dns_record_sets(
+    docker_client: DockerClient, *, network_name: str | None = None
+) -> dict[str, DnsRecordSet]:
+    return merge_container_records(
+        list_container_records(docker_client, network_name=network_name).values()
+    )
 
 
 def get_citm_dns_entries(
@@ -1,20 +1,81 @@
+import asyncio
 import atexit
 import ipaddress
 import os
 import shutil
 import signal
-import socket
-import socketserver
 import threading
 import time
-from collections.abc import Callable
+from collections import OrderedDict
+from collections.abc import Callable, Collection, Iterable
 from dataclasses import dataclass
 from typing import Any
 
 import docker
-from dnslib import A, AAAA, DNSHeader, DNSRecord, QTYPE, RCODE, RR
-
+from dnslib import A, AAAA, EDNS0, PTR, SRV, DNSHeader, DNSRecord, QTYPE, RCODE, RR
+
+from .answer_cache import (
+    DEFAULT_ANSWER_CACHE_MAX_ENTRIES,
+    DEFAULT_SERVE_STALE_SECONDS,
+    AnswerCache,
+    AnswerCacheKey,
+    answer_cache_key,
+    answer_for_query,
+)
+from .answer_order import (
+    ANSWER_ORDERS,
+    DEFAULT_ANSWER_ORDER,
+    AnswerOrder,
+    ordered_record_set,
+)
 from .discovery import DnsRecordSet, get_citm_dns_record_sets
+from .dns_server import (
+    DEFAULT_MAX_CONCURRENT_QUERIES,
+    DEFAULT_TCP_IDLE_TIMEOUT_SECONDS,
+    DEFAULT_TCP_MAX_QUERIES_PER_CONNECTION,
+    DnsServer,
+)
+from .forwarding import ForwardingTable, ForwardZone, parse_forward_zones
+from .metrics import (
+    DEFAULT_QUERY_LOG_SIZE,
+    SOURCE_CACHE,
+    SOURCE_INVALID,
+    SOURCE_LOCAL,
+    SOURCE_SERVFAIL,
+    SOURCE_STALE,
+    SOURCE_UPSTREAM,
+    DnsMetrics,
+)
+from .registry import (
+    DEFAULT_RESYNC_INTERVAL_SECONDS,
+    DiscoveryRegistry,
+    DiscoverySnapshot,
+)
+from .stats_server import StatsRoute, StatsServer
+from .upstream import (
+    DEFAULT_RACE_DELAY_SECONDS,
+    DEFAULT_UPSTREAM_STRATEGY,
+    DNS_PORT,
+    UPSTREAM_STRATEGIES,
+    UpstreamResolver,
+    is_failed_response,
+)
+from .wire import (
+    EDNS_UDP_PAYLOAD_SIZE,
+    LOCAL_ANSWER_QTYPES,
+    advertise_udp_payload_size,
+    local_answer,
+    parse_query,
+    response_for_client,
+    udp_payload_limit,
+)
+from .workers import (
+    DEFAULT_DISCOVERY_FEED_PATH,
+    DEFAULT_WORKERS,
+    SnapshotPublisher,
+    SnapshotSubscriber,
+    WorkerPool,
+)
 
 ENV_CACHE_TTL_SECONDS = "CITM_DNS_CACHE_TTL_SECONDS"
 ENV_LISTEN_HOST = "CITM_DNS_LISTEN_HOST"
@@ -22,17 +83,45 @@ ENV_LISTEN_PORT = "CITM_DNS_LISTEN_PORT"
 ENV_UPSTREAM_NAMESERVERS = "CITM_DNS_UPSTREAM_NAMESERVERS"
 ENV_UPSTREAM_TIMEOUT_SECONDS = "CITM_DNS_UPSTREAM_TIMEOUT_SECONDS"
 ENV_DISCOVERY_NETWORK = "CITM_DNS_NETWORK"
+ENV_NEGATIVE_CACHE_TTL_SECONDS = "CITM_DNS_NEGATIVE_CACHE_TTL_SECONDS"
+ENV_FORCED_REFRESH_INTERVAL_SECONDS = "CITM_DNS_FORCED_REFRESH_INTERVAL_SECONDS"
+ENV_DISCOVERY_MODE = "CITM_DNS_DISCOVERY_MODE"
+ENV_RESYNC_INTERVAL_SECONDS = "CITM_DNS_RESYNC_INTERVAL_SECONDS"
+ENV_MAX_CONCURRENT_QUERIES = "CITM_DNS_MAX_CONCURRENT_QUERIES"
+ENV_TCP_IDLE_TIMEOUT_SECONDS = "CITM_DNS_TCP_IDLE_TIMEOUT_SECONDS"
+ENV_TCP_MAX_QUERIES_PER_CONNECTION = "CITM_DNS_TCP_MAX_QUERIES_PER_CONNECTION"
+ENV_ANSWER_CACHE_MAX_ENTRIES = "CITM_DNS_ANSWER_CACHE_MAX_ENTRIES"
+ENV_UPSTREAM_STRATEGY = "CITM_DNS_UPSTREAM_STRATEGY"
+ENV_UPSTREAM_RACE_DELAY_SECONDS = "CITM_DNS_UPSTREAM_RACE_DELAY_SECONDS"
+ENV_STATS_PORT = "CITM_DNS_STATS_PORT"
+ENV_WORKERS = "CITM_DNS_WORKERS"
+ENV_SERVE_STALE_SECONDS = "CITM_DNS_SERVE_STALE_SECONDS"
+ENV_STALE_ANSWER_TIMEOUT_SECONDS = "CITM_DNS_STALE_ANSWER_TIMEOUT_SECONDS"
+ENV_DISCOVERY_FEED_PATH = "CITM_DNS_DISCOVERY_FEED_PATH"
+ENV_FORWARD_ZONES = "CITM_DNS_FORWARD_ZONES"
+ENV_ANSWER_ORDER = "CITM_DNS_ANSWER_ORDER"
+ENV_QUERY_LOG_SIZE = "CITM_DNS_QUERY_LOG_SIZE"
 
 DEFAULT_CACHE_TTL_SECONDS = 1.0
 DEFAULT_LISTEN_HOST = "0.0.0.0"
 DEFAULT_LISTEN_PORT = 53
+DEFAULT_STATS_HOST = "127.0.0.1"
+DEFAULT_STATS_PORT = 19053
 DEFAULT_UPSTREAM_TIMEOUT_SECONDS = 2.0
+DEFAULT_STALE_ANSWER_TIMEOUT_SECONDS = 0.5
 DEFAULT_RECORD_TTL_SECONDS = 30
+DEFAULT_NEGATIVE_CACHE_TTL_SECONDS = 30.0
+DEFAULT_FORCED_REFRESH_INTERVAL_SECONDS = 1.0
+NEGATIVE_CACHE_MAX_ENTRIES = 4096
+WORKER_SNAPSHOT_TIMEOUT_SECONDS = 5.0
+
+DISCOVERY_MODE_EVENTS = "events"
+DISCOVERY_MODE_POLL = "poll"
+DEFAULT_DISCOVERY_MODE = DISCOVERY_MODE_EVENTS
 
 RESOLV_CONF_PATH = "/etc/resolv.conf"
 RESOLV_CONF_BACKUP_PATH = "/etc/resolv.conf.bak"
 
-DNS_PORT = 53
 
 STATIC_RECORDS: dict[str, DnsRecordSet] = {
     "localhost": DnsRecordSet(ipv4=("127.0.0.1",), ipv6=()),
@@ -44,22 +133,64 @@ def _normalize_dns_name(name: str) -> str:
     return name.strip().lower().rstrip(".")
 
 
-def matches_suffix(name: str, suffix: str) -> bool:
-    normalized_name = _normalize_dns_name(name)
-    normalized_suffix = _normalize_dns_name(suffix)
-    return normalized_name == normalized_suffix or normalized_name.endswith(
-        f".{normalized_suffix}"
-    )
+def _with_edns(request: DNSRecord, reply: DNSRecord) -> DNSRecord:
+    if any(rr.rtype == QTYPE.OPT for rr in request.ar):
+        reply.add_ar(EDNS0(udp_len=EDNS_UDP_PAYLOAD_SIZE))
+    return reply
+
+
+def _address_records(
+    name: str, qtype: int, record_set: DnsRecordSet, ttl_seconds: int
+) -> list[RR]:
+    records = []
+    if qtype in {QTYPE.A, QTYPE.ANY}:
+        for ip in record_set.ipv4:
+            records.append(
+                RR(rname=name, rtype=QTYPE.A, rclass=1, ttl=ttl_seconds, rdata=A(ip))
+            )
+    if qtype in {QTYPE.AAAA, QTYPE.ANY}:
+        for ip in record_set.ipv6:
+            records.append(
+                RR(
+                    rname=name,
+                    rtype=QTYPE.AAAA,
+                    rclass=1,
+                    ttl=ttl_seconds,
+                    rdata=AAAA(ip),
+                )
+            )
+    return records
 
 
-def select_best_suffix_match(name: str, records: dict[str, DnsRecordSet]) -> str | None:
-    normalized_name = _normalize_dns_name(name)
-    matches = [
-        suffix for suffix in records.keys() if matches_suffix(normalized_name, suffix)
+def _build_srv_response(
+    request: DNSRecord, *, record_set: DnsRecordSet, ttl_seconds: int
+) -> DNSRecord | None:
+    labels = _normalize_dns_name(str(request.q.qname)).split(".")
+    if len(labels) < 3 or not (labels[0][:1] == labels[1][:1] == "_"):
+        return None
+    ports = [
+        srv.port
+        for srv in record_set.srv
+        if (srv.service, srv.protocol) == (labels[0][1:], labels[1][1:])
     ]
-    if not matches:
+    if not ports:
         return None
-    return max(matches, key=len)
+
+    target = ".".join(labels[2:])
+    reply = request.reply()
+    for port in ports:
+        reply.add_answer(
+            RR(
+                rname=request.q.qname,
+                rtype=QTYPE.SRV,
+                rclass=1,
+                ttl=ttl_seconds,
+                rdata=SRV(priority=0, weight=0, port=port, target=target),
+            )
+        )
+    for rr in _address_records(target, QTYPE.ANY, record_set, ttl_seconds):
+        reply.add_ar(rr)
+    return _with_edns(request, reply)
 
 
 def build_local_response(
@@ -69,37 +200,34 @@ def build_local_response(
     ttl_seconds: int,
 ) -> DNSRecord | None:
     qtype = request.q.qtype
+    if qtype == QTYPE.SRV:
+        return _build_srv_response(
+            request, record_set=record_set, ttl_seconds=ttl_seconds
+        )
     if qtype not in {QTYPE.A, QTYPE.AAAA, QTYPE.ANY}:
         return None
 
     reply = request.reply()
-    qname = request.q.qname
+    for rr in _address_records(request.q.qname, qtype, record_set, ttl_seconds):
+        reply.add_answer(rr)
+    return _with_edns(request, reply)
 
-    if qtype in {QTYPE.A, QTYPE.ANY}:
-        for ip in record_set.ipv4:
-            reply.add_answer(
-                RR(
-                    rname=qname,
-                    rtype=QTYPE.A,
-                    rclass=1,
-                    ttl=ttl_seconds,
-                    rdata=A(ip),
-                )
-            )
 
-    if qtype in {QTYPE.AAAA, QTYPE.ANY}:
-        for ip in record_set.ipv6:
-            reply.add_answer(
-                RR(
-                    rname=qname,
-                    rtype=QTYPE.AAAA,
-                    rclass=1,
-                    ttl=ttl_seconds,
-                    rdata=AAAA(ip),
-                )
+def build_ptr_response(
+    request: DNSRecord, *, names: Iterable[str], ttl_seconds: int
+) -> DNSRecord:
+    reply = request.reply()
+    for name in names:
+        reply.add_answer(
+            RR(
+                rname=request.q.qname,
+                rtype=QTYPE.PTR,
+                rclass=1,
+                ttl=ttl_seconds,
+                rdata=PTR(name),
             )
-
-    return reply
+        )
+    return _with_edns(request, reply)
 
 
 def _is_loopback_address(address: str) -> bool:
@@ -109,34 +237,6 @@ def _is_loopback_address(address: str) -> bool:
         return False
 
 
-def _address_family(address: str) -> socket.AddressFamily:
-    return (
-        socket.AF_INET6
-        if ipaddress.ip_address(address).version == 6
-        else socket.AF_INET
-    )
-
-
-def _socket_target(
-    address: str, port: int
-) -> tuple[str, int] | tuple[str, int, int, int]:
-    if _address_family(address) == socket.AF_INET6:
-        return (address, port, 0, 0)
-    return (address, port)
-
-
-def _read_exact(stream: socket.socket, size: int) -> bytes | None:
-    chunks: list[bytes] = []
-    remaining = size
-    while remaining > 0:
-        chunk = stream.recv(remaining)
-        if not chunk:
-            return None
-        chunks.append(chunk)
-        remaining -= len(chunk)
-    return b"".join(chunks)
-
-
 def _to_float_env(name: str, default: float) -> float:
     raw = os.getenv(name)
     if raw is None:
@@ -165,6 +265,17 @@ def _to_int_env(name: str, default: int) -> int:
         return default
 
 
+def _to_choice_env(name: str, default: str, choices: Collection[str]) -> str:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    value = raw.strip().lower()
+    if value in choices:
+        return value
+    print(f"Invalid {name}={raw!r}. Falling back to {default}.", flush=True)
+    return default
+
+
 def _parse_upstream_nameservers_env(name: str) -> list[str] | None:
     raw = os.getenv(name)
     if raw is None:
@@ -188,40 +299,146 @@ def _parse_upstream_nameservers_env(name: str) -> list[str] | None:
     return nameservers
 
 
+def _parse_forward_zones_env(name: str) -> list[ForwardZone]:
+    raw = os.getenv(name)
+    if not raw:
+        return []
+    try:
+        return parse_forward_zones(raw)
+    except ValueError as e:
+        print(f"Invalid {name}: {e}. Ignoring it.", flush=True)
+        return []
+
+
 @dataclass(frozen=True)
 class MatchResult:
     suffix: str
     records: DnsRecordSet
+    version: int = 0
+
+
+class NegativeCache:
+    def __init__(
+        self,
+        ttl_seconds: float,
+        *,
+        max_entries: int = NEGATIVE_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._clock = clock
+        self._expires_at: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            expires_at = self._expires_at.get(name)
+            if expires_at is None:
+                return False
+            if self._clock() >= expires_at:
+                del self._expires_at[name]
+                return False
+            return True
+
+    def add(self, name: str) -> None:
+        with self._lock:
+            self._expires_at[name] = self._clock() + self._ttl_seconds
+            self._expires_at.move_to_end(name)
+            while len(self._expires_at) > self._max_entries:
+                self._expires_at.popitem(last=False)
 
 
 class DiscoveryCache:
     def __init__(
-        self, ttl_seconds: float, loader: Callable[[], dict[str, DnsRecordSet]]
+        self,
+        ttl_seconds: float,
+        loader: Callable[[], dict[str, DnsRecordSet]],
+        *,
+        negative_ttl_seconds: float = DEFAULT_NEGATIVE_CACHE_TTL_SECONDS,
+        forced_refresh_interval_seconds: float = (
+            DEFAULT_FORCED_REFRESH_INTERVAL_SECONDS
+        ),
+        clock: Callable[[], float] = time.monotonic,
     ):
         self._ttl_seconds = ttl_seconds
         self._loader = loader
-        self._records: dict[str, DnsRecordSet] = {}
+        self._forced_refresh_interval_seconds = forced_refresh_interval_seconds
+        self._clock = clock
+        self._snapshot = DiscoverySnapshot()
         self._expires_at = 0.0
-        self._lock = threading.Lock()
+        self._next_forced_refresh_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self._refresh_done: threading.Event | None = None
+        self.misses = NegativeCache(negative_ttl_seconds, clock=clock)
+
+    @property
+    def pending_refresh(self) -> threading.Event | None:
+        return self._refresh_done
+
+    def current(self) -> DiscoverySnapshot:
+        snapshot = self._snapshot
+        if self._clock() < self._expires_at:
+            return snapshot
+        with self._refresh_lock:
+            if self._clock() < self._expires_at:
+                return self._snapshot
+            self._start_refresh()
+        return snapshot
+
+    @property
+    def snapshot(self) -> DiscoverySnapshot:
+        snapshot = self.current()
+        if snapshot.version == 0:
+            self.wait_for_refresh()
+            snapshot = self._snapshot
+        return snapshot
+
+    def request_forced_refresh(self) -> threading.Event | None:
+        with self._refresh_lock:
+            now = self._clock()
+            if now < self._next_forced_refresh_at:
+                return None
+            self._next_forced_refresh_at = now + self._forced_refresh_interval_seconds
+            return self._start_refresh()
+
+    def wait_for_refresh(self, timeout: float | None = None) -> bool:
+        refresh_done = self._refresh_done
+        return refresh_done is None or refresh_done.wait(timeout)
+
+    def _start_refresh(self) -> threading.Event:
+        if self._refresh_done is None:
+            self._refresh_done = threading.Event()
+            threading.Thread(
+                target=self._refresh, args=(self._refresh_done,), daemon=True
+            ).start()
+        return self._refresh_done
+
+    def _refresh(self, refresh_done: threading.Event) -> None:
+        try:
+            records = self._loader()
+        except Exception as e:
+            print(f"Docker discovery refresh failed: {e}", flush=True)
+        else:
+            self._snapshot = DiscoverySnapshot.build(
+                records, version=self._snapshot.version + 1
+            )
+        finally:
+            self._expires_at = self._clock() + self._ttl_seconds
+            with self._refresh_lock:
+                self._refresh_done = None
+            refresh_done.set()
 
-    def get_records(self, *, force: bool = False) -> dict[str, DnsRecordSet]:
-        now = time.monotonic()
-        with self._lock:
-            if force or now >= self._expires_at:
-                self._records = self._loader()
-                self._expires_at = now + self._ttl_seconds
-            return dict(self._records)
-
-
-def find_matching_record_set(name: str, cache: DiscoveryCache) -> MatchResult | None:
-    records = cache.get_records()
-    matched_suffix = select_best_suffix_match(name, records)
-    if not matched_suffix:
-        records = cache.get_records(force=True)
-        matched_suffix = select_best_suffix_match(name, records)
-        if not matched_suffix:
-            return None
-    return MatchResult(suffix=matched_suffix, records=records[matched_suffix])
+
+def match_snapshot(name: str, snapshot: DiscoverySnapshot) -> MatchResult | None:
+    matched_suffix = snapshot.match(name)
+    if matched_suffix is None:
+        return None
+    return MatchResult(
+        suffix=matched_suffix,
+        records=snapshot.records[matched_suffix],
+        version=snapshot.version,
+    )
 
 
 class ResolvConfManager:
@@ -289,21 +506,73 @@ def configure_local_resolver(
     return False
 
 
+def _log_prefetch_failure(prefetch: asyncio.Future[bytes | None]) -> None:
+    if not prefetch.cancelled() and prefetch.exception() is not None:
+        print(f"DNS prefetch failed: {prefetch.exception()}", flush=True)
+
+
 class DnsForwarder:
     def __init__(
         self,
         *,
-        docker_client: docker.DockerClient,
+        docker_client: docker.DockerClient | None,
         upstream_nameservers: list[str],
         cache_ttl_seconds: float,
         upstream_timeout_seconds: float,
         discovery_network: str | None = None,
+        negative_cache_ttl_seconds: float = DEFAULT_NEGATIVE_CACHE_TTL_SECONDS,
+        forced_refresh_interval_seconds: float = (
+            DEFAULT_FORCED_REFRESH_INTERVAL_SECONDS
+        ),
+        registry: DiscoveryRegistry | SnapshotSubscriber | None = None,
+        upstream_port: int = DNS_PORT,
+        answer_cache_max_entries: int = DEFAULT_ANSWER_CACHE_MAX_ENTRIES,
+        upstream_strategy: str = DEFAULT_UPSTREAM_STRATEGY,
+        upstream_race_delay_seconds: float = DEFAULT_RACE_DELAY_SECONDS,
+        serve_stale_seconds: float = DEFAULT_SERVE_STALE_SECONDS,
+        stale_answer_timeout_seconds: float = DEFAULT_STALE_ANSWER_TIMEOUT_SECONDS,
+        forward_zones: Iterable[ForwardZone] = (),
+        answer_order: str = DEFAULT_ANSWER_ORDER,
+        query_log_size: int = DEFAULT_QUERY_LOG_SIZE,
     ):
         self._docker_client = docker_client
-        self._upstream_nameservers = upstream_nameservers
-        self._upstream_timeout_seconds = upstream_timeout_seconds
+        self._registry = registry
+        self._upstream = UpstreamResolver(
+            upstream_nameservers,
+            deadline_seconds=upstream_timeout_seconds,
+            port=upstream_port,
+            strategy=upstream_strategy,
+            race_delay_seconds=upstream_race_delay_seconds,
+        )
+        self.forwarding = ForwardingTable(
+            forward_zones,
+            lambda zone: UpstreamResolver(
+                zone.nameservers,
+                deadline_seconds=zone.timeout_seconds or upstream_timeout_seconds,
+                port=zone.port,
+                strategy=upstream_strategy,
+                race_delay_seconds=upstream_race_delay_seconds,
+            ),
+        )
+        self.answer_order = AnswerOrder(answer_order)
         self._discovery_network = discovery_network
-        self._cache = DiscoveryCache(cache_ttl_seconds, self._load_discovery_records)
+        self._cache = DiscoveryCache(
+            cache_ttl_seconds,
+            self._load_discovery_records,
+            negative_ttl_seconds=negative_cache_ttl_seconds,
+            forced_refresh_interval_seconds=forced_refresh_interval_seconds,
+        )
+        self.answer_cache = AnswerCache(
+            answer_cache_max_entries, serve_stale_seconds=serve_stale_seconds
+        )
+        self._stale_answer_timeout_seconds = stale_answer_timeout_seconds
+        self._upstream_in_flight: dict[AnswerCacheKey, asyncio.Future[bytes | None]] = (
+            {}
+        )
+        self._refresh_waits: dict[threading.Event, asyncio.Future[bool]] = {}
+        self.coalesced_queries = 0
+        self.prefetches = 0
+        self.metrics = DnsMetrics(query_log_size)
 
     def _load_discovery_records(self) -> dict[str, DnsRecordSet]:
         discovered = get_citm_dns_record_sets(
@@ -315,6 +584,39 @@ class DnsForwarder:
             merged[name] = static_record
         return merged
 
+    async def _wait_for_refresh(self, refresh_done: threading.Event | None) -> None:
+        if refresh_done is None:
+            return
+        waiting = self._refresh_waits.get(refresh_done)
+        if waiting is None:
+            waiting = asyncio.ensure_future(asyncio.to_thread(refresh_done.wait))
+            self._refresh_waits[refresh_done] = waiting
+            waiting.add_done_callback(
+                lambda _: self._refresh_waits.pop(refresh_done, None)
+            )
+        await asyncio.shield(waiting)
+
+    async def _snapshot(self) -> DiscoverySnapshot:
+        if self._registry is not None:
+            return self._registry.snapshot
+        snapshot = self._cache.current()
+        if snapshot.version == 0:
+            await self._wait_for_refresh(self._cache.pending_refresh)
+            snapshot = self._cache.current()
+        return snapshot
+
+    async def _find_match(self, qname: str) -> MatchResult | None:
+        if self._registry is not None:
+            return match_snapshot(qname, self._registry.snapshot)
+        match = match_snapshot(qname, await self._snapshot())
+        if match is not None or qname in self._cache.misses:
+            return match
+        await self._wait_for_refresh(self._cache.request_forced_refresh())
+        match = match_snapshot(qname, self._cache.current())
+        if match is None:
+            self._cache.misses.add(qname)
+        return match
+
     def _to_servfail_response(self, request: DNSRecord) -> bytes:
         response = request.reply()
         response.header.rcode = RCODE.SERVFAIL
@@ -331,122 +633,345 @@ class DnsForwarder:
         )
         return response.pack()
 
-    def _forward_udp(self, nameserver: str, request_bytes: bytes) -> bytes:
-        family = _address_family(nameserver)
-        with socket.socket(family, socket.SOCK_DGRAM) as upstream_socket:
-            upstream_socket.settimeout(self._upstream_timeout_seconds)
-            upstream_socket.sendto(request_bytes, _socket_target(nameserver, DNS_PORT))
-            response, _ = upstream_socket.recvfrom(65535)
-        return response
-
-    def _forward_tcp(self, nameserver: str, request_bytes: bytes) -> bytes:
-        family = _address_family(nameserver)
-        with socket.socket(family, socket.SOCK_STREAM) as upstream_socket:
-            upstream_socket.settimeout(self._upstream_timeout_seconds)
-            upstream_socket.connect(_socket_target(nameserver, DNS_PORT))
-            upstream_socket.sendall(
-                len(request_bytes).to_bytes(2, "big") + request_bytes
-            )
-            response_len_wire = _read_exact(upstream_socket, 2)
-            if response_len_wire is None:
-                raise TimeoutError("No upstream TCP response length")
-            response_len = int.from_bytes(response_len_wire, "big")
-            response = _read_exact(upstream_socket, response_len)
-            if response is None:
-                raise TimeoutError("No upstream TCP response payload")
-            return response
-
-    def _is_truncated(self, response_bytes: bytes) -> bool:
+    async def _forward_upstream(
+        self, request_bytes: bytes, *, via_tcp: bool
+    ) -> bytes | None:
+        return await self._upstream.resolve(request_bytes, via_tcp=via_tcp)
+
+    def upstream_stats(self) -> dict[str, object]:
+        return {**self._upstream.stats(), "zones": self.forwarding.stats()}
+
+    def metrics_stats(self) -> dict[str, object]:
+        return {
+            **self.metrics.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "coalesced_queries": self.coalesced_queries,
+            "prefetches": self.prefetches,
+        }
+
+    def close(self) -> None:
+        self._upstream.close()
+        self.forwarding.close()
+
+    async def _forward_and_cache(
+        self, cache_key: AnswerCacheKey, request_bytes: bytes, *, via_tcp: bool
+    ) -> bytes | None:
+        route = self.forwarding.route(cache_key[0])
+        forward = self._forward_upstream if route is None else route.upstream.resolve
+        upstream_response = await forward(
+            advertise_udp_payload_size(request_bytes), via_tcp=via_tcp
+        )
+        if upstream_response is not None and (route is None or route.zone.cache):
+            self.answer_cache.put(cache_key, upstream_response)
+        return upstream_response
+
+    def _start_forward(
+        self, cache_key: AnswerCacheKey, request_bytes: bytes, *, via_tcp: bool
+    ) -> asyncio.Future[bytes | None]:
+        in_flight = asyncio.ensure_future(
+            self._forward_and_cache(cache_key, request_bytes, via_tcp=via_tcp)
+        )
+        self._upstream_in_flight[cache_key] = in_flight
+        in_flight.add_done_callback(
+            lambda _: self._upstream_in_flight.pop(cache_key, None)
+        )
+        return in_flight
+
+    def _prefetch(
+        self, cache_key: AnswerCacheKey, request_bytes: bytes, *, via_tcp: bool
+    ) -> None:
+        if cache_key in self._upstream_in_flight:
+            return
+        self.prefetches += 1
+        self._start_forward(
+            cache_key, request_bytes, via_tcp=via_tcp
+        ).add_done_callback(_log_prefetch_failure)
+
+    async def _forward_coalesced(
+        self,
+        cache_key: AnswerCacheKey,
+        request_bytes: bytes,
+        *,
+        via_tcp: bool,
+        timeout_seconds: float | None = None,
+    ) -> bytes | None:
+        in_flight = self._upstream_in_flight.get(cache_key)
+        if in_flight is None:
+            in_flight = self._start_forward(cache_key, request_bytes, via_tcp=via_tcp)
+        else:
+            self.coalesced_queries += 1
+
         try:
-            response = DNSRecord.parse(response_bytes)
-            return bool(response.header.tc)
-        except Exception:
-            return False
-
-    def _forward_upstream(self, request_bytes: bytes, *, via_tcp: bool) -> bytes | None:
-        for nameserver in self._upstream_nameservers:
-            try:
-                if via_tcp:
-                    return self._forward_tcp(nameserver, request_bytes)
-                response = self._forward_udp(nameserver, request_bytes)
-                if self._is_truncated(response):
-                    return self._forward_tcp(nameserver, request_bytes)
-                return response
-            except Exception:
-                continue
-        return None
+            async with asyncio.timeout(timeout_seconds):
+                upstream_response = await asyncio.shield(in_flight)
+        except TimeoutError:
+            return None
+        if upstream_response is None:
+            return None
+        return answer_for_query(upstream_response, request_bytes)
+
+    async def resolve(self, request_bytes: bytes, *, via_tcp: bool) -> bytes:
+        started = time.perf_counter()
+        record = self.metrics.record
+        query = parse_query(request_bytes)
+        match = None
+        if query is not None and query.qtype in LOCAL_ANSWER_QTYPES:
+            match = await self._find_match(query.name)
+            if match is not None:
+                return record(
+                    SOURCE_LOCAL,
+                    query.name,
+                    query.qtype,
+                    started,
+                    local_answer(
+                        request_bytes,
+                        query,
+                        match.records,
+                        ttl_seconds=DEFAULT_RECORD_TTL_SECONDS,
+                        max_size=(
+                            None
+                            if via_tcp
+                            else udp_payload_limit(query.udp_payload_size)
+                        ),
+                        address_order=self.answer_order.arrange(
+                            match.suffix, match.records, version=match.version
+                        ),
+                    ),
+                    via_tcp=via_tcp,
+                )
 
-    def resolve(self, request_bytes: bytes, *, via_tcp: bool) -> bytes:
         try:
             request = DNSRecord.parse(request_bytes)
         except Exception:
-            return b""
+            return record(SOURCE_INVALID, "", 0, started, b"", via_tcp=via_tcp)
 
         if not request.questions:
-            return self._to_formerr_response(request.header.id)
+            return record(
+                SOURCE_INVALID,
+                "",
+                0,
+                started,
+                self._to_formerr_response(request.header.id),
+                via_tcp=via_tcp,
+            )
 
         qname = _normalize_dns_name(str(request.q.qname))
-        match = find_matching_record_set(qname, self._cache)
-        if match is not None:
-            local_response = build_local_response(
-                request,
-                record_set=match.records,
-                ttl_seconds=DEFAULT_RECORD_TTL_SECONDS,
+        qtype = request.q.qtype
+        local_response = None
+        if qtype == QTYPE.PTR:
+            names = (await self._snapshot()).reverse_index.get(qname)
+            if names:
+                local_response = build_ptr_response(
+                    request, names=names, ttl_seconds=DEFAULT_RECORD_TTL_SECONDS
+                )
+        else:
+            if query is None or query.qtype not in LOCAL_ANSWER_QTYPES:
+                match = await self._find_match(qname)
+            if match is not None:
+                local_response = build_local_response(
+                    request,
+                    record_set=ordered_record_set(
+                        match.records,
+                        self.answer_order.arrange(
+                            match.suffix, match.records, version=match.version
+                        ),
+                    ),
+                    ttl_seconds=DEFAULT_RECORD_TTL_SECONDS,
+                )
+        if local_response is not None:
+            return record(
+                SOURCE_LOCAL,
+                qname,
+                qtype,
+                started,
+                response_for_client(
+                    local_response.pack(), request_bytes, via_tcp=via_tcp
+                ),
+                via_tcp=via_tcp,
             )
-            if local_response is not None:
-                return local_response.pack()
 
-        upstream_response = self._forward_upstream(request_bytes, via_tcp=via_tcp)
-        if upstream_response is not None:
-            return upstream_response
-        return self._to_servfail_response(request)
-
-
-class ThreadingUDPServer(socketserver.ThreadingMixIn, socketserver.UDPServer):
-    daemon_threads = True
-    allow_reuse_address = True
-    forwarder: DnsForwarder
+        cache_key = answer_cache_key(request)
+        cached_response = self.answer_cache.get(cache_key, request_bytes)
+        if cached_response is not None:
+            if self.answer_cache.needs_prefetch(cache_key):
+                self._prefetch(cache_key, request_bytes, via_tcp=via_tcp)
+            return record(
+                SOURCE_CACHE,
+                qname,
+                qtype,
+                started,
+                response_for_client(cached_response, request_bytes, via_tcp=via_tcp),
+                via_tcp=via_tcp,
+            )
 
+        has_stale = self.answer_cache.has_stale(cache_key)
+        upstream_response = await self._forward_coalesced(
+            cache_key,
+            request_bytes,
+            via_tcp=via_tcp,
+            timeout_seconds=self._stale_answer_timeout_seconds if has_stale else None,
+        )
+        if upstream_response is not None and not is_failed_response(upstream_response):
+            return record(
+                SOURCE_UPSTREAM,
+                qname,
+                qtype,
+                started,
+                response_for_client(upstream_response, request_bytes, via_tcp=via_tcp),
+                via_tcp=via_tcp,
+            )
+        if has_stale:
+            stale_response = self.answer_cache.get_stale(cache_key, request_bytes)
+            if stale_response is not None:
+                return record(
+                    SOURCE_STALE,
+                    qname,
+                    qtype,
+                    started,
+                    response_for_client(stale_response, request_bytes, via_tcp=via_tcp),
+                    via_tcp=via_tcp,
+                )
+        if upstream_response is not None:
+            return record(
+                SOURCE_SERVFAIL,
+                qname,
+                qtype,
+                started,
+                response_for_client(upstream_response, request_bytes, via_tcp=via_tcp),
+                via_tcp=via_tcp,
+            )
+        return record(
+            SOURCE_SERVFAIL,
+            qname,
+            qtype,
+            started,
+            self._to_servfail_response(request),
+            via_tcp=via_tcp,
+        )
 
-class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    daemon_threads = True
-    allow_reuse_address = True
-    forwarder: DnsForwarder
 
+def stats_routes(forwarder: DnsForwarder, server: DnsServer) -> dict[str, StatsRoute]:
+    return {
+        "/upstreams": forwarder.upstream_stats,
+        "/metrics": lambda: {
+            **forwarder.metrics_stats(),
+            "dropped_queries": server.dropped_queries,
+        },
+        "/querylog": forwarder.metrics.recent_queries,
+    }
 
-class DnsUdpHandler(socketserver.BaseRequestHandler):
-    def handle(self) -> None:
-        request_bytes: bytes = self.request[0]
-        response_socket: socket.socket = self.request[1]
-        response = self.server.forwarder.resolve(request_bytes, via_tcp=False)
-        if response:
-            response_socket.sendto(response, self.client_address)
 
+async def serve(
+    server: DnsServer,
+    forwarder: DnsForwarder,
+    *,
+    banner: str,
+    stats_server: StatsServer | None = None,
+) -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await server.start()
+    if stats_server is not None:
+        await stats_server.start()
+    print(banner, flush=True)
+    try:
+        await stop_event.wait()
+    finally:
+        if stats_server is not None:
+            await stats_server.close()
+        await server.close()
+        forwarder.close()
 
-class DnsTcpHandler(socketserver.StreamRequestHandler):
-    def handle(self) -> None:
-        while True:
-            request_len_wire = self.rfile.read(2)
-            if len(request_len_wire) == 0:
-                return
-            if len(request_len_wire) < 2:
-                return
 
-            request_len = int.from_bytes(request_len_wire, "big")
-            request_bytes = self.rfile.read(request_len)
-            if len(request_bytes) < request_len:
-                return
+@dataclass(frozen=True)
+class WorkerOptions:
+    listen_host: str
+    listen_port: int
+    stats_port: int
+    max_concurrent_queries: int
+    tcp_idle_timeout_seconds: float
+    tcp_max_queries_per_connection: int
+    discovery_feed_path: str
+    forwarder_options: dict[str, Any]
+
+
+def run_worker(index: int, options: WorkerOptions) -> None:
+    subscriber = SnapshotSubscriber(
+        options.discovery_feed_path,
+        initial=DiscoverySnapshot.build(STATIC_RECORDS, version=0),
+    )
+    subscriber.start()
+    subscriber.wait_for_snapshot(WORKER_SNAPSHOT_TIMEOUT_SECONDS)
+    forwarder = DnsForwarder(
+        docker_client=None, registry=subscriber, **options.forwarder_options
+    )
+    server = DnsServer(
+        forwarder.resolve,
+        host=options.listen_host,
+        port=options.listen_port,
+        max_concurrent_queries=options.max_concurrent_queries,
+        reuse_port=True,
+        tcp_idle_timeout_seconds=options.tcp_idle_timeout_seconds,
+        tcp_max_queries_per_connection=options.tcp_max_queries_per_connection,
+    )
+    stats_server = StatsServer(
+        stats_routes(forwarder, server),
+        host=DEFAULT_STATS_HOST,
+        port=options.stats_port + index,
+    )
+    try:
+        asyncio.run(
+            serve(
+                server,
+                forwarder,
+                banner=(
+                    f"CITM DNS worker {index} listening on "
+                    f"{options.listen_host}:{options.listen_port} (udp/tcp)"
+                ),
+                stats_server=stats_server,
+            )
+        )
+    finally:
+        subscriber.stop()
 
-            response = self.server.forwarder.resolve(request_bytes, via_tcp=True)
-            if not response:
-                return
-            self.wfile.write(len(response).to_bytes(2, "big") + response)
 
+def run_workers(
+    docker_client: docker.DockerClient,
+    count: int,
+    options: WorkerOptions,
+    *,
+    resync_interval_seconds: float,
+) -> None:
+    publisher = SnapshotPublisher(options.discovery_feed_path)
+    publisher.start()
+    registry = DiscoveryRegistry(
+        docker_client,
+        network_name=options.forwarder_options["discovery_network"],
+        static_records=STATIC_RECORDS,
+        resync_interval_seconds=resync_interval_seconds,
+        on_publish=publisher.publish,
+    )
+    registry.start()
+    pool = WorkerPool(count, run_worker, (options,))
+    stopped = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda _signum, _frame: stopped.set())
 
-def _start_server(server: socketserver.BaseServer) -> threading.Thread:
-    thread = threading.Thread(target=server.serve_forever, daemon=True)
-    thread.start()
-    return thread
+    pool.start()
+    print(
+        f"CITM DNS forwarder started {count} workers on "
+        f"{options.listen_host}:{options.listen_port} (udp/tcp), events discovery",
+        flush=True,
+    )
+    try:
+        pool.watch(stopped)
+    finally:
+        pool.stop()
+        registry.stop()
+        publisher.stop()
 
 
 def main() -> None:
@@ -456,7 +981,58 @@ def main() -> None:
     upstream_timeout_seconds = _to_float_env(
         ENV_UPSTREAM_TIMEOUT_SECONDS, DEFAULT_UPSTREAM_TIMEOUT_SECONDS
     )
+    negative_cache_ttl_seconds = _to_float_env(
+        ENV_NEGATIVE_CACHE_TTL_SECONDS, DEFAULT_NEGATIVE_CACHE_TTL_SECONDS
+    )
+    forced_refresh_interval_seconds = _to_float_env(
+        ENV_FORCED_REFRESH_INTERVAL_SECONDS, DEFAULT_FORCED_REFRESH_INTERVAL_SECONDS
+    )
     discovery_network = os.getenv(ENV_DISCOVERY_NETWORK) or os.getenv("CITM_NETWORK")
+    discovery_mode = _to_choice_env(
+        ENV_DISCOVERY_MODE,
+        DEFAULT_DISCOVERY_MODE,
+        (DISCOVERY_MODE_EVENTS, DISCOVERY_MODE_POLL),
+    )
+    resync_interval_seconds = _to_float_env(
+        ENV_RESYNC_INTERVAL_SECONDS, DEFAULT_RESYNC_INTERVAL_SECONDS
+    )
+    max_concurrent_queries = _to_int_env(
+        ENV_MAX_CONCURRENT_QUERIES, DEFAULT_MAX_CONCURRENT_QUERIES
+    )
+    tcp_idle_timeout_seconds = _to_float_env(
+        ENV_TCP_IDLE_TIMEOUT_SECONDS, DEFAULT_TCP_IDLE_TIMEOUT_SECONDS
+    )
+    tcp_max_queries_per_connection = _to_int_env(
+        ENV_TCP_MAX_QUERIES_PER_CONNECTION, DEFAULT_TCP_MAX_QUERIES_PER_CONNECTION
+    )
+    answer_cache_max_entries = _to_int_env(
+        ENV_ANSWER_CACHE_MAX_ENTRIES, DEFAULT_ANSWER_CACHE_MAX_ENTRIES
+    )
+    upstream_strategy = _to_choice_env(
+        ENV_UPSTREAM_STRATEGY, DEFAULT_UPSTREAM_STRATEGY, UPSTREAM_STRATEGIES
+    )
+    upstream_race_delay_seconds = _to_float_env(
+        ENV_UPSTREAM_RACE_DELAY_SECONDS, DEFAULT_RACE_DELAY_SECONDS
+    )
+    stats_port = _to_int_env(ENV_STATS_PORT, DEFAULT_STATS_PORT)
+    serve_stale_seconds = _to_float_env(
+        ENV_SERVE_STALE_SECONDS, DEFAULT_SERVE_STALE_SECONDS
+    )
+    stale_answer_timeout_seconds = _to_float_env(
+        ENV_STALE_ANSWER_TIMEOUT_SECONDS, DEFAULT_STALE_ANSWER_TIMEOUT_SECONDS
+    )
+    workers = _to_int_env(ENV_WORKERS, DEFAULT_WORKERS)
+    discovery_feed_path = os.getenv(
+        ENV_DISCOVERY_FEED_PATH, DEFAULT_DISCOVERY_FEED_PATH
+    )
+    answer_order = _to_choice_env(ENV_ANSWER_ORDER, DEFAULT_ANSWER_ORDER, ANSWER_ORDERS)
+    query_log_size = _to_int_env(ENV_QUERY_LOG_SIZE, DEFAULT_QUERY_LOG_SIZE)
+    forward_zones = _parse_forward_zones_env(ENV_FORWARD_ZONES)
+    for zone in forward_zones:
+        print(
+            f"Forwarding {zone.suffix} to {', '.join(zone.nameservers)}",
+            flush=True,
+        )
 
     docker_client = docker.from_env()
     resolv_manager = ResolvConfManager()
@@ -489,45 +1065,94 @@ def main() -> None:
     configure_local_resolver(resolv_manager, listen_port=listen_port)
     atexit.register(resolv_manager.restore)
 
+    forwarder_options = {
+        "upstream_nameservers": upstream_nameservers,
+        "cache_ttl_seconds": cache_ttl_seconds,
+        "upstream_timeout_seconds": upstream_timeout_seconds,
+        "discovery_network": discovery_network,
+        "negative_cache_ttl_seconds": negative_cache_ttl_seconds,
+        "forced_refresh_interval_seconds": forced_refresh_interval_seconds,
+        "answer_cache_max_entries": answer_cache_max_entries,
+        "upstream_strategy": upstream_strategy,
+        "upstream_race_delay_seconds": upstream_race_delay_seconds,
+        "serve_stale_seconds": serve_stale_seconds,
+        "stale_answer_timeout_seconds": stale_answer_timeout_seconds,
+        "forward_zones": forward_zones,
+        "answer_order": answer_order,
+        "query_log_size": query_log_size,
+    }
+
+    if workers > 1:
+        if discovery_mode == DISCOVERY_MODE_POLL:
+            print(
+                f"{ENV_DISCOVERY_MODE}=poll is not supported with {ENV_WORKERS} "
+                "above 1. Falling back to events discovery.",
+                flush=True,
+            )
+        try:
+            run_workers(
+                docker_client,
+                workers,
+                WorkerOptions(
+                    listen_host=listen_host,
+                    listen_port=listen_port,
+                    stats_port=stats_port,
+                    max_concurrent_queries=max_concurrent_queries,
+                    tcp_idle_timeout_seconds=tcp_idle_timeout_seconds,
+                    tcp_max_queries_per_connection=tcp_max_queries_per_connection,
+                    discovery_feed_path=discovery_feed_path,
+                    forwarder_options=forwarder_options,
+                ),
+                resync_interval_seconds=resync_interval_seconds,
+            )
+        finally:
+            resolv_manager.restore()
+            docker_client.close()
+        return
+
+    registry = None
+    if discovery_mode == DISCOVERY_MODE_EVENTS:
+        registry = DiscoveryRegistry(
+            docker_client,
+            network_name=discovery_network,
+            static_records=STATIC_RECORDS,
+            resync_interval_seconds=resync_interval_seconds,
+        )
+        registry.start()
+
     forwarder = DnsForwarder(
-        docker_client=docker_client,
-        upstream_nameservers=upstream_nameservers,
-        cache_ttl_seconds=cache_ttl_seconds,
-        upstream_timeout_seconds=upstream_timeout_seconds,
-        discovery_network=discovery_network,
+        docker_client=docker_client, registry=registry, **forwarder_options
     )
 
-    udp_server = ThreadingUDPServer((listen_host, listen_port), DnsUdpHandler)
-    udp_server.forwarder = forwarder
-    tcp_server = ThreadingTCPServer((listen_host, listen_port), DnsTcpHandler)
-    tcp_server.forwarder = forwarder
-
-    servers: list[socketserver.BaseServer] = [udp_server, tcp_server]
-    for server in servers:
-        _start_server(server)
-
-    print(
-        f"CITM DNS forwarder listening on {listen_host}:{listen_port} "
-        f"(udp/tcp), cache TTL {cache_ttl_seconds}s",
-        flush=True,
+    server = DnsServer(
+        forwarder.resolve,
+        host=listen_host,
+        port=listen_port,
+        max_concurrent_queries=max_concurrent_queries,
+        tcp_idle_timeout_seconds=tcp_idle_timeout_seconds,
+        tcp_max_queries_per_connection=tcp_max_queries_per_connection,
+    )
+    stats_server = StatsServer(
+        stats_routes(forwarder, server),
+        host=DEFAULT_STATS_HOST,
+        port=stats_port,
     )
-
-    stop_event = threading.Event()
-
-    def _request_shutdown(_sig: int, _frame: Any) -> None:
-        stop_event.set()
-        for server in servers:
-            server.shutdown()
-
-    signal.signal(signal.SIGINT, _request_shutdown)
-    signal.signal(signal.SIGTERM, _request_shutdown)
 
     try:
-        while not stop_event.wait(0.5):
-            continue
+        asyncio.run(
+            serve(
+                server,
+                forwarder,
+                banner=(
+                    f"CITM DNS forwarder listening on {listen_host}:{listen_port} "
+                    f"(udp/tcp), {discovery_mode} discovery"
+                ),
+                stats_server=stats_server,
+            )
+        )
     finally:
-        for server in servers:
-            server.server_close()
+        if registry is not None:
+            registry.stop()
         resolv_manager.restore()
         docker_client.close()
 
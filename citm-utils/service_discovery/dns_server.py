@@ -0,0 +1,203 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+DEFAULT_MAX_CONCURRENT_QUERIES = 256
+DEFAULT_TCP_IDLE_TIMEOUT_SECONDS = 10.0
+DEFAULT_TCP_MAX_QUERIES_PER_CONNECTION = 32
+
+Resolver = Callable[..., Awaitable[bytes]]
+
+
+class QuerySlots:
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self._limit or self._waiters:
+            return False
+        self.in_flight += 1
+        return True
+
+    async def acquire(self) -> None:
+        if self.try_acquire():
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+
+class _DnsDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server: "DnsServer"):
+        self._server = server
+        self._transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport  # type: ignore[assignment]
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        if not self._server.slots.try_acquire():
+            self._server.dropped_queries += 1
+            return
+        self._server.track(self._answer(data, addr))
+
+    async def _answer(self, data: bytes, addr: Any) -> None:
+        try:
+            response = await self._server.resolve(data, via_tcp=False)
+        finally:
+            self._server.slots.release()
+        if response and self._transport is not None:
+            self._transport.sendto(response, addr)
+
+
+class DnsServer:
+    def __init__(
+        self,
+        resolve: Resolver,
+        *,
+        host: str,
+        port: int,
+        max_concurrent_queries: int = DEFAULT_MAX_CONCURRENT_QUERIES,
+        reuse_port: bool = False,
+        tcp_idle_timeout_seconds: float = DEFAULT_TCP_IDLE_TIMEOUT_SECONDS,
+        tcp_max_queries_per_connection: int = DEFAULT_TCP_MAX_QUERIES_PER_CONNECTION,
+    ):
+        self.resolve = resolve
+        self.slots = QuerySlots(max_concurrent_queries)
+        self.tcp_idle_timeout_seconds = tcp_idle_timeout_seconds
+        self.tcp_max_queries_per_connection = tcp_max_queries_per_connection
+        self.dropped_queries = 0
+        self._host = host
+        self._port = port
+        self._reuse_port = reuse_port
+        self._tasks: set[asyncio.Task[None]] = set()
+        self._udp_transport: asyncio.DatagramTransport | None = None
+        self._tcp_server: asyncio.Server | None = None
+
+    @property
+    def port(self) -> int:
+        if self._udp_transport is None:
+            return self._port
+        return self._udp_transport.get_extra_info("sockname")[1]
+
+    def track(self, coroutine: Awaitable[None]) -> asyncio.Task[None]:
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task[None]) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"DNS query handling failed: {task.exception()}", flush=True)
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._udp_transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DnsDatagramProtocol(self),
+            local_addr=(self._host, self._port),
+            reuse_port=self._reuse_port,
+        )
+        self._tcp_server = await asyncio.start_server(
+            self._serve_tcp,
+            self._host,
+            self.port,
+            reuse_address=True,
+            reuse_port=self._reuse_port,
+        )
+
+    async def close(self) -> None:
+        if self._udp_transport is not None:
+            self._udp_transport.close()
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._tcp_server is not None:
+            await self._tcp_server.wait_closed()
+
+    async def _read_tcp_query(self, reader: asyncio.StreamReader) -> bytes | None:
+        try:
+            async with asyncio.timeout(self.tcp_idle_timeout_seconds):
+                request_len_wire = await reader.readexactly(2)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        request_len = int.from_bytes(request_len_wire, "big")
+        try:
+            async with asyncio.timeout(self.tcp_idle_timeout_seconds):
+                return await reader.readexactly(request_len)
+        except (TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    async def _answer_tcp(
+        self,
+        request_bytes: bytes,
+        writer: asyncio.StreamWriter,
+        connection_slots: asyncio.Semaphore,
+    ) -> None:
+        try:
+            response = await self.resolve(request_bytes, via_tcp=True)
+        finally:
+            self.slots.release()
+            connection_slots.release()
+        if not response:
+            writer.close()
+            return
+        writer.write(len(response).to_bytes(2, "big") + response)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            writer.close()
+
+    async def _serve_tcp(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._tasks.add(task)
+        connection_slots = asyncio.Semaphore(self.tcp_max_queries_per_connection)
+        pending: set[asyncio.Task[None]] = set()
+        try:
+            while not writer.is_closing():
+                try:
+                    request_bytes = await self._read_tcp_query(reader)
+                except TimeoutError:
+                    if pending:
+                        continue
+                    break
+                if request_bytes is None:
+                    break
+                await connection_slots.acquire()
+                try:
+                    await self.slots.acquire()
+                except BaseException:
+                    connection_slots.release()
+                    raise
+                answer = self.track(
+                    self._answer_tcp(request_bytes, writer, connection_slots)
+                )
+                pending.add(answer)
+                answer.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        finally:
+            if task is not None:
+                self._tasks.discard(task)
+            writer.close()
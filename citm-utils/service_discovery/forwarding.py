@@ -0,0 +1,105 @@
+import ipaddress
+import json
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from .suffix_trie import SuffixTrie
+from .upstream import DNS_PORT, UpstreamResolver
+
+
+def _normalize_dns_name(name: str) -> str:
+    return name.strip().lower().rstrip(".")
+
+
+@dataclass(frozen=True)
+class ForwardZone:
+    suffix: str
+    nameservers: tuple[str, ...]
+    timeout_seconds: float | None = None
+    cache: bool = True
+    port: int = DNS_PORT
+
+
+@dataclass(frozen=True)
+class ForwardRoute:
+    zone: ForwardZone
+    upstream: UpstreamResolver
+
+
+def _to_forward_zone(suffix: str, options: Any) -> ForwardZone:
+    if isinstance(options, list):
+        options = {"nameservers": options}
+    if not isinstance(options, dict):
+        raise ValueError("expected an object or a list of nameservers")
+
+    normalized = _normalize_dns_name(suffix)
+    if not normalized:
+        raise ValueError("zone name is empty")
+    nameservers = options.get("nameservers")
+    if not isinstance(nameservers, list) or not nameservers:
+        raise ValueError("nameservers must be a non-empty list")
+    timeout_seconds = options.get("timeout_seconds")
+    if timeout_seconds is not None:
+        timeout_seconds = float(timeout_seconds)
+        if timeout_seconds <= 0:
+            raise ValueError("timeout_seconds must be positive")
+    cache = options.get("cache", True)
+    if not isinstance(cache, bool):
+        raise ValueError("cache must be true or false")
+    port = options.get("port", DNS_PORT)
+    if not isinstance(port, int) or not 0 < port < 65536:
+        raise ValueError("port must be between 1 and 65535")
+
+    return ForwardZone(
+        suffix=normalized,
+        nameservers=tuple(str(ipaddress.ip_address(ns)) for ns in nameservers),
+        timeout_seconds=timeout_seconds,
+        cache=cache,
+        port=port,
+    )
+
+
+def parse_forward_zones(raw: str) -> list[ForwardZone]:
+    config = json.loads(raw)
+    if not isinstance(config, dict):
+        raise ValueError("expected a JSON object keyed by zone")
+
+    zones = []
+    for suffix, options in config.items():
+        try:
+            zones.append(_to_forward_zone(suffix, options))
+        except (TypeError, ValueError) as e:
+            print(f"Invalid forward zone {suffix!r}: {e}. Ignoring it.", flush=True)
+    return zones
+
+
+class ForwardingTable:
+    def __init__(
+        self,
+        zones: Iterable[ForwardZone],
+        upstream_factory: Callable[[ForwardZone], UpstreamResolver],
+    ):
+        self._routes = {
+            zone.suffix: ForwardRoute(zone, upstream_factory(zone)) for zone in zones
+        }
+        self._index = SuffixTrie(self._routes)
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def route(self, name: str) -> ForwardRoute | None:
+        if not self._routes:
+            return None
+        suffix = self._index.longest_match(name)
+        return None if suffix is None else self._routes[suffix]
+
+    def stats(self) -> dict[str, object]:
+        return {
+            suffix: {"cache": route.zone.cache, **route.upstream.stats()}
+            for suffix, route in self._routes.items()
+        }
+
+    def close(self) -> None:
+        for route in self._routes.values():
+            route.upstream.close()
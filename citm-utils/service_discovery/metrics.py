@@ -0,0 +1,132 @@
+import time
+from collections import deque
+
+from dnslib import QTYPE, RCODE
+
+DEFAULT_QUERY_LOG_SIZE = 256
+HISTOGRAM_BUCKETS = 24
+REPORT_QUANTILES = (0.5, 0.99, 0.999)
+
+SOURCE_LOCAL = "local"
+SOURCE_CACHE = "cache"
+SOURCE_STALE = "stale"
+SOURCE_UPSTREAM = "upstream"
+SOURCE_SERVFAIL = "servfail"
+SOURCE_INVALID = "invalid"
+ANSWER_SOURCES = (
+    SOURCE_LOCAL,
+    SOURCE_CACHE,
+    SOURCE_STALE,
+    SOURCE_UPSTREAM,
+    SOURCE_SERVFAIL,
+    SOURCE_INVALID,
+)
+
+
+def _bucket_upper_ms(index: int) -> float:
+    return (1 << index) / 1000
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.total_seconds = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets)
+
+    def observe(self, seconds: float) -> None:
+        index = int(seconds * 1_000_000).bit_length()
+        if index >= HISTOGRAM_BUCKETS:
+            index = HISTOGRAM_BUCKETS - 1
+        self.buckets[index] += 1
+        self.total_seconds += seconds
+
+    def quantile(self, q: float) -> float | None:
+        count = self.count
+        if count == 0:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if cumulative >= rank and bucket_count:
+                return _bucket_upper_ms(index)
+        return _bucket_upper_ms(HISTOGRAM_BUCKETS - 1)
+
+    def stats(self) -> dict[str, object]:
+        count = self.count
+        return {
+            "count": count,
+            "mean_ms": (
+                None if count == 0 else round(self.total_seconds * 1000 / count, 3)
+            ),
+            **{f"p{q * 100:g}_ms": self.quantile(q) for q in REPORT_QUANTILES},
+            "buckets_ms": {
+                str(_bucket_upper_ms(index)): bucket_count
+                for index, bucket_count in enumerate(self.buckets)
+                if bucket_count
+            },
+        }
+
+
+def _rcode(response: bytes) -> str | int | None:
+    if len(response) < 4:
+        return None
+    rcode = response[3] & 0xF
+    return RCODE.get(rcode, rcode)
+
+
+class DnsMetrics:
+    def __init__(self, query_log_size: int = DEFAULT_QUERY_LOG_SIZE):
+        self.latency = {source: LatencyHistogram() for source in ANSWER_SOURCES}
+        self.query_log: deque[tuple[float, str, int, str, bytes, float, bool]] = deque(
+            maxlen=query_log_size
+        )
+        self._wall_offset = time.time() - time.perf_counter()
+
+    def record(
+        self,
+        source: str,
+        name: str,
+        qtype: int,
+        started: float,
+        response: bytes,
+        *,
+        via_tcp: bool,
+    ) -> bytes:
+        elapsed = time.perf_counter() - started
+        self.latency[source].observe(elapsed)
+        self.query_log.append(
+            (started, name, qtype, source, response, elapsed, via_tcp)
+        )
+        return response
+
+    def stats(self) -> dict[str, object]:
+        answers = {
+            source: histogram.count for source, histogram in self.latency.items()
+        }
+        return {
+            "queries": sum(answers.values()),
+            "answers": answers,
+            "latency": {
+                source: histogram.stats() for source, histogram in self.latency.items()
+            },
+        }
+
+    def recent_queries(self) -> list[dict[str, object]]:
+        return [
+            {
+                "timestamp": round(started + self._wall_offset, 6),
+                "name": name,
+                "qtype": QTYPE.get(qtype, qtype),
+                "source": source,
+                "rcode": _rcode(response),
+                "duration_ms": round(elapsed * 1000, 3),
+                "transport": "tcp" if via_tcp else "udp",
+            }
+            for started, name, qtype, source, response, elapsed, via_tcp in reversed(
+                self.query_log
+            )
+        ]
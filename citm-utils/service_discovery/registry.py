@@ -0,0 +1,198 @@
+import ipaddress
+import threading
+import time
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any
+
+import docker
+from docker import DockerClient
+
+from .discovery import (
+    ContainerRecords,
+    DnsRecordSet,
+    get_container_records,
+    get_discovery_network,
+    list_container_records,
+    merge_container_records,
+)
+from .suffix_trie import SuffixTrie
+
+DEFAULT_RESYNC_INTERVAL_SECONDS = 60.0
+EVENTS_RECONNECT_DELAY_SECONDS = 1.0
+EVENT_FILTERS = {
+    "type": ["container", "network"],
+    "event": ["start", "die", "connect", "disconnect", "health_status"],
+}
+
+
+def build_reverse_index(
+    records: Mapping[str, DnsRecordSet],
+) -> dict[str, tuple[str, ...]]:
+    names: dict[str, set[str]] = {}
+    for name, record_set in records.items():
+        if "*" in name:
+            continue
+        for ip in (*record_set.ipv4, *record_set.ipv6):
+            try:
+                reverse_name = ipaddress.ip_address(ip).reverse_pointer
+            except ValueError:
+                continue
+            names.setdefault(reverse_name, set()).add(name)
+    return {reverse_name: tuple(sorted(n)) for reverse_name, n in names.items()}
+
+
+@dataclass(frozen=True)
+class DiscoverySnapshot:
+    records: Mapping[str, DnsRecordSet] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    version: int = 0
+    created_at: float = 0.0
+    suffix_index: SuffixTrie = field(default_factory=SuffixTrie)
+    reverse_index: Mapping[str, tuple[str, ...]] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+
+    @classmethod
+    def build(
+        cls, records: Mapping[str, DnsRecordSet], *, version: int
+    ) -> "DiscoverySnapshot":
+        return cls(
+            records=MappingProxyType(dict(records)),
+            version=version,
+            created_at=time.time(),
+            suffix_index=SuffixTrie(records),
+            reverse_index=MappingProxyType(build_reverse_index(records)),
+        )
+
+    def match(self, name: str) -> str | None:
+        return self.suffix_index.longest_match(name)
+
+
+class DiscoveryRegistry:
+    def __init__(
+        self,
+        docker_client: DockerClient,
+        *,
+        network_name: str | None = None,
+        static_records: Mapping[str, DnsRecordSet] | None = None,
+        resync_interval_seconds: float = DEFAULT_RESYNC_INTERVAL_SECONDS,
+        on_publish: Callable[[DiscoverySnapshot], None] | None = None,
+    ):
+        self._docker_client = docker_client
+        self._on_publish = on_publish
+        self._network_name = get_discovery_network(network_name)
+        self._static_records = dict(static_records or {})
+        self._resync_interval_seconds = resync_interval_seconds
+        self._containers: dict[str, ContainerRecords] = {}
+        self._update_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._events_stream: Any = None
+        self._threads: list[threading.Thread] = []
+        self._snapshot = DiscoverySnapshot()
+        self._publish()
+
+    @property
+    def snapshot(self) -> DiscoverySnapshot:
+        return self._snapshot
+
+    def _publish(self) -> None:
+        records = merge_container_records(self._containers.values())
+        records.update(self._static_records)
+        self._snapshot = DiscoverySnapshot.build(
+            records, version=self._snapshot.version + 1
+        )
+        if self._on_publish is not None:
+            self._on_publish(self._snapshot)
+
+    def resync(self) -> None:
+        with self._update_lock:
+            self._containers = list_container_records(
+                self._docker_client, network_name=self._network_name
+            )
+            self._publish()
+
+    def _inspect_container(self, container_id: str) -> ContainerRecords | None:
+        try:
+            container = self._docker_client.containers.get(container_id)
+        except docker.errors.NotFound:
+            return None
+        return get_container_records(container, network_name=self._network_name)
+
+    def apply_event(self, event: Mapping[str, Any]) -> None:
+        actor = event.get("Actor") or {}
+        action = (event.get("Action") or event.get("status") or "").split(":", 1)[0]
+        if event.get("Type") == "network":
+            container_id = (actor.get("Attributes") or {}).get("container")
+        else:
+            container_id = actor.get("ID") or event.get("id")
+        if not container_id or action not in EVENT_FILTERS["event"]:
+            return
+
+        with self._update_lock:
+            container_records = (
+                None if action == "die" else self._inspect_container(container_id)
+            )
+            if container_records == self._containers.get(container_id):
+                return
+            if container_records is None:
+                del self._containers[container_id]
+            else:
+                self._containers[container_id] = container_records
+            self._publish()
+
+    def _connect(self) -> Any:
+        stream = self._docker_client.events(decode=True, filters=EVENT_FILTERS)
+        self._events_stream = stream
+        self.resync()
+        return stream
+
+    def _watch_events(self, stream: Any) -> None:
+        while not self._stopped.is_set():
+            try:
+                if stream is None:
+                    stream = self._connect()
+                for event in stream:
+                    self.apply_event(event)
+            except Exception as e:
+                if self._stopped.is_set():
+                    return
+                print(
+                    f"Docker events stream failed: {e}. Reconnecting.",
+                    flush=True,
+                )
+            stream = None
+            self._stopped.wait(EVENTS_RECONNECT_DELAY_SECONDS)
+
+    def _resync_periodically(self) -> None:
+        while not self._stopped.wait(self._resync_interval_seconds):
+            try:
+                self.resync()
+            except Exception as e:
+                print(f"Docker discovery resync failed: {e}", flush=True)
+
+    def start(self) -> None:
+        try:
+            stream = self._connect()
+        except Exception as e:
+            print(
+                f"Docker discovery bootstrap failed: {e}. Retrying in background.",
+                flush=True,
+            )
+            stream = None
+
+        self._threads = [
+            threading.Thread(target=self._watch_events, args=(stream,), daemon=True),
+            threading.Thread(target=self._resync_periodically, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._events_stream is not None:
+            self._events_stream.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
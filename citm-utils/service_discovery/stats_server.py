@@ -0,0 +1,69 @@
+import asyncio
+import json
+from collections.abc import Callable, Mapping
+from http import HTTPStatus
+
+STATS_REQUEST_TIMEOUT_SECONDS = 5.0
+
+StatsRoute = Callable[[], object]
+
+
+class StatsServer:
+    def __init__(self, routes: Mapping[str, StatsRoute], *, host: str, port: int):
+        self._routes = dict(routes)
+        self._host = host
+        self._port = port
+        self._server: asyncio.Server | None = None
+
+    @property
+    def port(self) -> int:
+        if self._server is None:
+            return self._port
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._serve, self._host, self._port, reuse_address=True
+        )
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _respond(self, method: str, target: str) -> tuple[HTTPStatus, object]:
+        route = self._routes.get(target.split("?", 1)[0])
+        if route is None:
+            return HTTPStatus.NOT_FOUND, {"error": "Not found"}
+        if method != "GET":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Method not allowed"}
+        return HTTPStatus.OK, route()
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            async with asyncio.timeout(STATS_REQUEST_TIMEOUT_SECONDS):
+                request_line = await reader.readline()
+                while (await reader.readline()).strip():
+                    pass
+            method, target, _version = request_line.decode("latin-1").split()
+        except (TimeoutError, ValueError, ConnectionError):
+            writer.close()
+            return
+
+        status, payload = self._respond(method, target)
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
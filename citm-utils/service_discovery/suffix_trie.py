@@ -0,0 +1,38 @@
+from collections.abc import Iterable
+
+_NAME = None
+
+
+def _normalize_dns_name(name: str) -> str:
+    return name.strip().lower().rstrip(".")
+
+
+class SuffixTrie:
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._root: dict = {}
+        self._size = 0
+        for name in names:
+            normalized = _normalize_dns_name(name)
+            if not normalized:
+                continue
+            node = self._root
+            for label in reversed(normalized.split(".")):
+                node = node.setdefault(label, {})
+            if _NAME not in node:
+                self._size += 1
+            node[_NAME] = normalized
+
+    def __len__(self) -> int:
+        return self._size
+
+    def longest_match(self, name: str) -> str | None:
+        node = self._root
+        match = None
+        for label in reversed(_normalize_dns_name(name).split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            match = node.get(_NAME, match)
+        return match
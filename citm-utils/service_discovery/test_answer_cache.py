@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+from dnslib import A, EDNS0, RR, SOA, DNSRecord, QTYPE, RCODE
+
+import service_discovery.dns_forwarder as dns_forwarder
+from service_discovery.answer_cache import AnswerCache, answer_cache_key
+
+
+class FakeClock:
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _answer(request: DNSRecord, *ttls: int) -> bytes:
+    reply = request.reply()
+    for index, ttl in enumerate(ttls):
+        reply.add_answer(
+            RR(request.q.qname, QTYPE.A, ttl=ttl, rdata=A(f"192.0.2.{index + 1}"))
+        )
+    return reply.pack()
+
+
+def _negative(request: DNSRecord, *, rcode: int, soa_ttl: int, minimum: int) -> bytes:
+    reply = request.reply()
+    reply.header.rcode = rcode
+    reply.add_auth(
+        RR(
+            "example.com",
+            QTYPE.SOA,
+            ttl=soa_ttl,
+            rdata=SOA("ns.example.com", "admin.example.com", (1, 2, 3, 4, minimum)),
+        )
+    )
+    return reply.pack()
+
+
+def test_cached_answer_gets_request_id_and_case_with_decremented_ttls():
+    clock = FakeClock()
+    cache = AnswerCache(clock=clock)
+    first = DNSRecord.question("api.example.com")
+    key = answer_cache_key(first)
+    cache.put(key, _answer(first, 60, 30))
+
+    clock.now += 10.4
+    second = DNSRecord.question("API.Example.com")
+    cached = DNSRecord.parse(cache.get(answer_cache_key(second), second.pack()))
+
+    assert answer_cache_key(second) == key
+    assert cached.header.id == second.header.id
+    assert str(cached.q.qname) == "API.Example.com."
+    assert [rr.ttl for rr in cached.rr] == [50, 20]
+    assert [str(rr.rdata) for rr in cached.rr] == ["192.0.2.1", "192.0.2.2"]
+
+    clock.now += 20
+    assert cache.get(key, second.pack()) is None
+    assert cache.stats() == {
+        "entries": 1,
+        "hits": 1,
+        "misses": 1,
+        "stale_hits": 0,
+        "hit_ratio": 0.5,
+    }
+
+
+def test_negative_answers_expire_after_soa_minimum():
+    clock = FakeClock()
+    cache = AnswerCache(clock=clock)
+    request = DNSRecord.question("missing.example.com")
+    key = answer_cache_key(request)
+    cache.put(key, _negative(request, rcode=RCODE.NXDOMAIN, soa_ttl=600, minimum=60))
+
+    clock.now += 59
+    cached = DNSRecord.parse(cache.get(key, request.pack()))
+    assert cached.header.rcode == RCODE.NXDOMAIN
+    assert cached.auth[0].ttl == 1
+
+    clock.now += 1
+    assert cache.get(key, request.pack()) is None
+
+
+def test_expired_answers_are_served_stale_until_the_stale_window_ends():
+    clock = FakeClock()
+    cache = AnswerCache(clock=clock, serve_stale_seconds=300)
+    request = DNSRecord.question("api.example.com")
+    key = answer_cache_key(request)
+    cache.put(key, _answer(request, 60, 600))
+
+    assert not cache.has_stale(key)
+    clock.now += 61
+    assert cache.get(key, request.pack()) is None
+    assert cache.has_stale(key)
+    stale = DNSRecord.parse(cache.get_stale(key, request.pack()))
+    assert [rr.ttl for rr in stale.rr] == [30, 30]
+
+    clock.now += 300
+    assert cache.get(key, request.pack()) is None
+    assert not cache.has_stale(key)
+    assert cache.get_stale(key, request.pack()) is None
+    assert len(cache) == 0
+
+
+def test_prefetch_is_due_in_last_tenth_of_ttl_after_repeated_hits():
+    clock = FakeClock()
+    cache = AnswerCache(clock=clock)
+    request = DNSRecord.question("api.example.com")
+    key = answer_cache_key(request)
+    cache.put(key, _answer(request, 100))
+
+    clock.now += 89
+    cache.get(key, request.pack())
+    cache.get(key, request.pack())
+    assert not cache.needs_prefetch(key)
+    clock.now += 2
+    assert cache.needs_prefetch(key)
+    clock.now += 10
+    assert not cache.needs_prefetch(key)
+
+
+def test_prefetch_skips_answers_hit_once_in_their_ttl():
+    clock = FakeClock()
+    cache = AnswerCache(clock=clock)
+    request = DNSRecord.question("api.example.com")
+    key = answer_cache_key(request)
+    cache.put(key, _answer(request, 100))
+    cache.get(key, request.pack())
+    cache.get(key, request.pack())
+    cache.put(key, _answer(request, 100))
+
+    clock.now += 95
+    cache.get(key, request.pack())
+    assert not cache.needs_prefetch(key)
+    cache.get(key, request.pack())
+    assert cache.needs_prefetch(key)
+
+
+def test_uncacheable_responses_are_skipped():
+    cache = AnswerCache()
+    request = DNSRecord.question("example.com")
+    key = answer_cache_key(request)
+
+    servfail = request.reply()
+    servfail.header.rcode = RCODE.SERVFAIL
+    truncated = DNSRecord.parse(_answer(request, 60))
+    truncated.header.tc = 1
+    for response in (
+        servfail.pack(),
+        truncated.pack(),
+        request.reply().pack(),
+        _answer(request, 0),
+        b"garbage",
+    ):
+        cache.put(key, response)
+
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = AnswerCache(max_entries=2)
+    requests = [DNSRecord.question(f"host-{index}.example.com") for index in range(3)]
+    keys = [answer_cache_key(request) for request in requests]
+    cache.put(keys[0], _answer(requests[0], 60))
+    cache.put(keys[1], _answer(requests[1], 60))
+    assert cache.get(keys[0], requests[0].pack()) is not None
+    cache.put(keys[2], _answer(requests[2], 60))
+
+    assert cache.get(keys[1], requests[1].pack()) is None
+    assert cache.get(keys[0], requests[0].pack()) is not None
+
+
+def test_cache_key_separates_qtype_and_dnssec_ok():
+    plain = DNSRecord.question("example.com")
+    aaaa = DNSRecord.question("example.com", qtype="AAAA")
+    dnssec = DNSRecord.question("example.com")
+    dnssec.add_ar(EDNS0(flags="do"))
+
+    assert len({answer_cache_key(r) for r in (plain, aaaa, dnssec)}) == 3
+
+
+def _forwarder(monkeypatch, **kwargs):
+    monkeypatch.setattr(
+        dns_forwarder,
+        "get_citm_dns_record_sets",
+        lambda _docker_client, network_name=None: {},
+    )
+    return dns_forwarder.DnsForwarder(
+        docker_client=object(),
+        upstream_nameservers=["192.0.2.53"],
+        cache_ttl_seconds=60,
+        upstream_timeout_seconds=1.0,
+        **kwargs,
+    )
+
+
+def test_forwarder_serves_stale_answer_when_upstream_fails_or_stalls(monkeypatch):
+    forwarder = _forwarder(monkeypatch, stale_answer_timeout_seconds=0.05)
+    clock = FakeClock()
+    forwarder.answer_cache = AnswerCache(clock=clock)
+    upstream = {"mode": "answer"}
+
+    async def fake_forward_upstream(request_bytes, *, via_tcp):
+        request = DNSRecord.parse(request_bytes)
+        if upstream["mode"] == "stall":
+            await asyncio.sleep(0.5)
+        if upstream["mode"] == "servfail":
+            reply = request.reply()
+            reply.header.rcode = RCODE.SERVFAIL
+            return reply.pack()
+        return _answer(request, 60)
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+
+    async def scenario():
+        request = DNSRecord.question("registry.example.com")
+        await forwarder.resolve(request.pack(), via_tcp=False)
+        clock.now += 120
+        responses = []
+        for mode in ("servfail", "stall"):
+            upstream["mode"] = mode
+            started = time.perf_counter()
+            response = await forwarder.resolve(request.pack(), via_tcp=False)
+            responses.append((DNSRecord.parse(response), time.perf_counter() - started))
+        return responses
+
+    (servfail, _), (stalled, elapsed) = asyncio.run(scenario())
+
+    assert servfail.header.rcode == RCODE.NOERROR
+    assert servfail.rr[0].ttl == 30
+    assert stalled.rr[0].ttl == 30
+    assert elapsed < 0.4
+    assert forwarder.answer_cache.stale_hits == 2
+
+
+def test_forwarder_prefetches_hot_answers_before_they_expire(monkeypatch):
+    forwarder = _forwarder(monkeypatch)
+    clock = FakeClock()
+    forwarder.answer_cache = AnswerCache(clock=clock)
+    upstream_calls = []
+
+    async def fake_forward_upstream(request_bytes, *, via_tcp):
+        upstream_calls.append(request_bytes)
+        return _answer(DNSRecord.parse(request_bytes), 100)
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+
+    async def scenario():
+        request = DNSRecord.question("registry.example.com")
+        await forwarder.resolve(request.pack(), via_tcp=False)
+        clock.now += 95
+        await forwarder.resolve(request.pack(), via_tcp=False)
+        await asyncio.sleep(0)
+        prefetches_after_one_hit = forwarder.prefetches
+        await forwarder.resolve(request.pack(), via_tcp=False)
+        await asyncio.sleep(0)
+        clock.now += 10
+        response = await forwarder.resolve(request.pack(), via_tcp=False)
+        return prefetches_after_one_hit, response
+
+    prefetches_after_one_hit, response_bytes = asyncio.run(scenario())
+    response = DNSRecord.parse(response_bytes)
+
+    assert prefetches_after_one_hit == 0
+    assert len(upstream_calls) == 2
+    assert forwarder.prefetches == 1
+    assert response.rr[0].ttl == 90
+
+
+def test_forwarder_answers_repeated_queries_from_cache(monkeypatch):
+    monkeypatch.setattr(
+        dns_forwarder,
+        "get_citm_dns_record_sets",
+        lambda _docker_client, network_name=None: {},
+    )
+    forwarder = dns_forwarder.DnsForwarder(
+        docker_client=object(),
+        upstream_nameservers=["192.0.2.53"],
+        cache_ttl_seconds=60,
+        upstream_timeout_seconds=1.0,
+    )
+    upstream_calls = []
+
+    async def fake_forward_upstream(request_bytes, *, via_tcp):
+        upstream_calls.append(request_bytes)
+        return _answer(DNSRecord.parse(request_bytes), 300)
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+
+    async def scenario():
+        first = DNSRecord.question("registry.example.com")
+        second = DNSRecord.question("registry.example.com")
+        await forwarder.resolve(first.pack(), via_tcp=False)
+        return second, await forwarder.resolve(second.pack(), via_tcp=False)
+
+    second, response_bytes = asyncio.run(scenario())
+
+    assert len(upstream_calls) == 1
+    assert DNSRecord.parse(response_bytes).header.id == second.header.id
+    assert forwarder.answer_cache.stats()["hit_ratio"] == 0.5
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import random
+from collections import Counter
+
+from service_discovery.answer_order import (
+    ANSWER_ORDER_FIXED,
+    ANSWER_ORDER_RANDOM,
+    ANSWER_ORDER_ROUND_ROBIN,
+    ANSWER_ORDER_WEIGHTED,
+    AnswerOrder,
+    ordered_record_set,
+)
+from service_discovery.discovery import DnsRecordSet
+from service_discovery.wire import UNCHANGED_ORDER
+
+RECORD_SET = DnsRecordSet(
+    ipv4=("10.0.0.2", "10.0.0.3", "10.0.0.4"), ipv6=("fd00::2", "fd00::3")
+)
+
+
+def test_round_robin_rotates_each_name_independently():
+    order = AnswerOrder(ANSWER_ORDER_ROUND_ROBIN)
+
+    api = [
+        ordered_record_set(RECORD_SET, order.arrange("api.local", RECORD_SET))
+        for _ in range(4)
+    ]
+    db = ordered_record_set(RECORD_SET, order.arrange("db.local", RECORD_SET))
+
+    assert [record_set.ipv4[0] for record_set in api] == [
+        "10.0.0.2",
+        "10.0.0.3",
+        "10.0.0.4",
+        "10.0.0.2",
+    ]
+    assert [record_set.ipv6[0] for record_set in api] == [
+        "fd00::2",
+        "fd00::3",
+        "fd00::2",
+        "fd00::3",
+    ]
+    assert db == RECORD_SET
+
+
+def test_round_robin_counters_stay_bounded_and_reset_with_the_snapshot():
+    order = AnswerOrder(ANSWER_ORDER_ROUND_ROBIN)
+
+    for _ in range(13):
+        order.arrange("api.local", RECORD_SET, version=1)
+    order.arrange("db.local", RECORD_SET, version=1)
+
+    assert order._rotations == {"api.local": 1, "db.local": 1}
+    assert order.arrange("db.local", RECORD_SET, version=2) == UNCHANGED_ORDER
+    assert order._rotations == {"db.local": 1}
+
+
+def test_fixed_and_single_address_sets_are_unchanged():
+    single = DnsRecordSet(ipv4=("10.0.0.2",), ipv6=("fd00::2",))
+
+    assert AnswerOrder(ANSWER_ORDER_FIXED).arrange("api.local", RECORD_SET) == (
+        UNCHANGED_ORDER
+    )
+    assert AnswerOrder(ANSWER_ORDER_RANDOM).arrange("api.local", single) == (
+        UNCHANGED_ORDER
+    )
+    assert ordered_record_set(single, UNCHANGED_ORDER) is single
+
+
+def test_random_and_weighted_orders_keep_every_address():
+    random_order = AnswerOrder(ANSWER_ORDER_RANDOM, rng=random.Random(1))
+    weighted = AnswerOrder(ANSWER_ORDER_WEIGHTED, rng=random.Random(1))
+    record_set = DnsRecordSet(
+        ipv4=("10.0.0.2", "10.0.0.3"), ipv6=(), weights=(("10.0.0.2", 9),)
+    )
+
+    shuffled = [
+        ordered_record_set(RECORD_SET, random_order.arrange("api.local", RECORD_SET))
+        for _ in range(50)
+    ]
+    firsts = Counter(
+        ordered_record_set(record_set, weighted.arrange("api.local", record_set)).ipv4[
+            0
+        ]
+        for _ in range(1000)
+    )
+
+    assert all(sorted(r.ipv4) == list(RECORD_SET.ipv4) for r in shuffled)
+    assert len({r.ipv4 for r in shuffled}) > 1
+    assert 850 < firsts["10.0.0.2"] < 950
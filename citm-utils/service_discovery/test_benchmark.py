@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+
+import pytest
+from dnslib import DNSRecord
+
+from service_discovery.benchmark import (
+    FakeUpstream,
+    benchmark_discovery,
+    benchmark_dns_server,
+    benchmark_load,
+    benchmark_local_answer,
+    benchmark_suffix_match,
+    main,
+    matches_suffix,
+    parse_load_mix,
+    select_best_suffix_match,
+)
+from service_discovery.discovery import DnsRecordSet
+
+
+def test_benchmark_discovery_keeps_network_scoped_refresh_flat():
+    result = benchmark_discovery(containers=25, rounds=2)
+
+    per_container = result["per_container_inspect"]
+    network_scoped = result["network_scoped"]
+    assert per_container["containers_discovered"] == 25
+    assert network_scoped["containers_discovered"] == 25
+    assert per_container["api_calls_per_refresh"] == 26
+    assert network_scoped["api_calls_by_endpoint"] == {
+        "containers.list": 1,
+        "networks.inspect": 1,
+    }
+
+
+def test_benchmark_cli_prints_json_report(capsys):
+    assert main(["discovery", "--containers", "3", "--rounds", "1"]) == 0
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["benchmark"] == "discovery"
+    assert report["network_scoped"]["api_calls_per_refresh"] == 2
+
+
+def test_matches_label_boundary_suffix():
+    assert matches_suffix("a.b", "a.b")
+    assert matches_suffix("x.a.b", "a.b")
+    assert matches_suffix("y.x.a.b", "a.b")
+
+
+def test_does_not_match_without_label_boundary():
+    assert not matches_suffix("xa.b", "a.b")
+    assert not matches_suffix("a.bb", "a.b")
+
+
+def test_selects_longest_suffix_match():
+    records = {
+        "b": DnsRecordSet(ipv4=("10.0.0.1",), ipv6=()),
+        "a.b": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=()),
+        "x.a.b": DnsRecordSet(ipv4=("10.0.0.3",), ipv6=()),
+    }
+    assert select_best_suffix_match("z.x.a.b", records) == "x.a.b"
+
+
+def test_benchmark_suffix_match_agrees_with_linear_scan():
+    result = benchmark_suffix_match(names=20, queries=40)
+
+    assert result["linear_scan"]["matched"] == 20
+    assert result["suffix_trie"]["matched"] == 20
+
+
+def test_benchmark_local_answer_matches_dnslib_bytes():
+    result = benchmark_local_answer(queries=30)
+
+    assert result["identical_answers"] == 30
+
+
+def test_benchmark_dns_server_answers_every_workload():
+    result = benchmark_dns_server(queries=20, concurrency=4, names=5)
+
+    for workload in ("local", "forwarded", "cached"):
+        assert result[workload]["answered"] == 20
+        assert result[workload]["timeouts"] == 0
+    assert result["answer_cache"]["entries"] == 40
+
+
+def test_benchmark_load_replays_query_mix_over_udp_and_tcp():
+    result = benchmark_load(qps=200, duration_seconds=0.2, tcp_ratio=0.5, names=5)
+
+    assert result["queries"] == 40
+    assert result["answered"] + result["late_answers"] + result["timeouts"] == 40
+    nxdomain = result["by_kind"]["nxdomain"]
+    assert set(nxdomain["rcodes"]) <= {"NXDOMAIN"}
+    assert sum(nxdomain["rcodes"].values()) == (
+        nxdomain["answered"] + nxdomain["late_answers"]
+    )
+    assert sum(kind["queries"] for kind in result["by_kind"].values()) == 40
+    assert result["by_transport"]["tcp"]["queries"] > 0
+    assert result["by_transport"]["udp"]["queries"] > 0
+    assert set(result["latency_ms"]) == {"p50", "p99", "p99.9"}
+    assert {"sent_per_second", "queries_per_second", "answer_deadline_ms"} <= set(
+        result
+    )
+
+
+def test_fake_upstream_drops_udp_queries_at_configured_loss():
+    upstream = FakeUpstream(latency_seconds=0, loss=1.0)
+    request_bytes = DNSRecord.question("host.example.com").pack()
+
+    assert asyncio.run(upstream.resolve(request_bytes, via_tcp=False)) == b""
+    assert asyncio.run(upstream.resolve(request_bytes, via_tcp=True)) != b""
+    assert (upstream.queries, upstream.dropped) == (2, 1)
+
+
+def test_parse_load_mix_rejects_unknown_kinds():
+    assert parse_load_mix("local=1,nxdomain=3") == {"local": 1, "nxdomain": 3}
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_load_mix("remote=1")
@@ -2,13 +2,23 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 
-from service_discovery.discovery import get_citm_dns_entries, get_citm_dns_record_sets
+import docker
+
+from service_discovery.discovery import (
+    SrvRecord,
+    get_citm_dns_entries,
+    get_citm_dns_record_sets,
+)
 
 
 @dataclass
 class FakeContainer:
     id: str
-    labels: dict[str, str]
+    attrs: dict
+
+
+@dataclass
+class FakeNetwork:
     attrs: dict
 
 
@@ -17,48 +27,84 @@ class FakeContainerCollection:
         self._containers = containers
         self.last_list_call: dict | None = None
 
-    def list(self, all: bool, filters: dict):
-        self.last_list_call = {"all": all, "filters": filters}
+    def list(self, all: bool, filters: dict, sparse: bool):
+        self.last_list_call = {"all": all, "filters": filters, "sparse": sparse}
         return list(self._containers)
 
+    def get(self, _container_id: str):
+        raise AssertionError("discovery must not inspect containers one by one")
+
+
+class FakeNetworkCollection:
+    def __init__(self, networks: dict[str, FakeNetwork]):
+        self._networks = networks
+        self.get_calls: list[str] = []
+
+    def get(self, network_name: str):
+        self.get_calls.append(network_name)
+        try:
+            return self._networks[network_name]
+        except KeyError:
+            raise docker.errors.NotFound(network_name) from None
+
 
 class FakeDockerClient:
-    def __init__(self, containers: list[FakeContainer]):
+    def __init__(
+        self,
+        containers: list[FakeContainer],
+        networks: dict[str, FakeNetwork] | None = None,
+    ):
         self.containers = FakeContainerCollection(containers)
+        self.networks = FakeNetworkCollection(networks or {})
+
+
+def _container(
+    container_id: str, labels: dict[str, str], networks: dict[str, dict]
+) -> FakeContainer:
+    return FakeContainer(
+        id=container_id,
+        attrs={
+            "Id": container_id,
+            "Labels": labels,
+            "NetworkSettings": {"Networks": networks},
+        },
+    )
 
 
 def _network(ipv4: str = "", ipv6: str = "") -> dict[str, str]:
     return {"IPAddress": ipv4, "GlobalIPv6Address": ipv6}
 
 
+def _endpoint(ipv4: str = "", ipv6: str = "") -> dict[str, str]:
+    return {
+        "IPv4Address": f"{ipv4}/16" if ipv4 else "",
+        "IPv6Address": f"{ipv6}/64" if ipv6 else "",
+    }
+
+
 def test_get_citm_dns_record_sets_filters_by_selected_network_and_normalizes_names():
     containers = [
-        FakeContainer(
-            id="2",
-            labels={"citm_network": "net1", "citm_dns_names": "API.local, www.local."},
-            attrs={
-                "NetworkSettings": {
-                    "Networks": {"net1": _network("10.0.0.2", "fd00::2")}
-                }
-            },
+        _container(
+            "2", {"citm_network": "net1", "citm_dns_names": "API.local, www.local."}, {}
         ),
-        FakeContainer(
-            id="1",
-            labels={"citm_network": "net1", "citm_dns_names": "api.local,db.local"},
-            attrs={"NetworkSettings": {"Networks": {"net1": _network("10.0.0.3")}}},
-        ),
-        FakeContainer(
-            id="3",
-            labels={"citm_network": "net2", "citm_dns_names": "api.local"},
-            attrs={"NetworkSettings": {"Networks": {"net2": _network("10.0.0.4")}}},
-        ),
-        FakeContainer(
-            id="4",
-            labels={"citm_dns_names": "ignored.local"},
-            attrs={"NetworkSettings": {"Networks": {"net1": _network("10.0.0.5")}}},
+        _container(
+            "1", {"citm_network": "net1", "citm_dns_names": "api.local,db.local"}, {}
         ),
+        _container("3", {"citm_network": "net2", "citm_dns_names": "api.local"}, {}),
+        _container("4", {"citm_dns_names": "ignored.local"}, {}),
     ]
-    docker_client = FakeDockerClient(containers)
+    networks = {
+        "net1": FakeNetwork(
+            attrs={
+                "Containers": {
+                    "1": _endpoint("10.0.0.3"),
+                    "2": _endpoint("10.0.0.2", "fd00::2"),
+                    "4": _endpoint("10.0.0.5"),
+                }
+            }
+        )
+    }
+    docker_client = FakeDockerClient(containers, networks)
 
     records = get_citm_dns_record_sets(docker_client, network_name="net1")
 
@@ -67,6 +113,7 @@ def test_get_citm_dns_record_sets_filters_by_selected_network_and_normalizes_nam
     assert records["db.local"].ipv4 == ("10.0.0.3",)
     assert records["www.local"].ipv4 == ("10.0.0.2",)
     assert "ignored.local" not in records
+    assert docker_client.networks.get_calls == ["net1"]
     assert docker_client.containers.last_list_call == {
         "all": False,
         "filters": {
@@ -75,35 +122,102 @@ def test_get_citm_dns_record_sets_filters_by_selected_network_and_normalizes_nam
                 "citm_network=net1",
             ]
         },
+        "sparse": True,
     }
 
 
-def test_get_citm_dns_record_sets_uses_env_selected_network(monkeypatch):
+def test_get_citm_dns_record_sets_reads_srv_ports_from_labels():
     containers = [
-        FakeContainer(
-            id="1",
-            labels={"citm_network": "env-net", "citm_dns_names": "svc.local"},
-            attrs={
-                "NetworkSettings": {
-                    "Networks": {"env-net": _network("10.0.0.2", "fd00::2")}
-                }
+        _container(
+            "1",
+            {
+                "citm_network": "net1",
+                "citm_dns_names": "api.local",
+                "citm_dns_srv": "http:8080, _GRPC:9090/tcp,dns:53/udp,bad:x,web:70000",
             },
+            {},
         ),
-        FakeContainer(
-            id="2",
-            labels={"citm_network": "other-net", "citm_dns_names": "svc.local"},
-            attrs={
-                "NetworkSettings": {"Networks": {"other-net": _network("10.0.0.3")}}
+        _container(
+            "2",
+            {
+                "citm_network": "net1",
+                "citm_dns_names": "api.local",
+                "citm_dns_srv": "http:8080,metrics:9100/sctp",
             },
+            {},
         ),
     ]
-    docker_client = FakeDockerClient(containers)
+    networks = {
+        "net1": FakeNetwork(
+            attrs={
+                "Containers": {"1": _endpoint("10.0.0.2"), "2": _endpoint("10.0.0.3")}
+            }
+        )
+    }
+
+    records = get_citm_dns_record_sets(
+        FakeDockerClient(containers, networks), network_name="net1"
+    )
+
+    assert records["api.local"].srv == (
+        SrvRecord("dns", "udp", 53),
+        SrvRecord("grpc", "tcp", 9090),
+        SrvRecord("http", "tcp", 8080),
+    )
+
+
+def test_get_citm_dns_record_sets_skips_unhealthy_replicas_and_reads_weights():
+    labels = {"citm_network": "net1", "citm_dns_names": "api.local"}
+    containers = [
+        _container("1", {**labels, "citm_dns_weight": "3"}, {}),
+        _container("2", labels, {}),
+        _container("3", labels, {}),
+        _container("4", {"citm_network": "net1", "citm_dns_names": "db.local"}, {}),
+    ]
+    containers[2].attrs["Status"] = "Up 2 minutes (unhealthy)"
+    containers[3].attrs["Status"] = "Up 2 minutes (unhealthy)"
+    networks = {
+        "net1": FakeNetwork(
+            attrs={
+                "Containers": {
+                    "1": _endpoint("10.0.0.2"),
+                    "2": _endpoint("10.0.0.3"),
+                    "3": _endpoint("10.0.0.4"),
+                    "4": _endpoint("10.0.0.5"),
+                }
+            }
+        )
+    }
+
+    records = get_citm_dns_record_sets(
+        FakeDockerClient(containers, networks), network_name="net1"
+    )
+
+    assert records["api.local"].ipv4 == ("10.0.0.2", "10.0.0.3")
+    assert records["api.local"].weights == (("10.0.0.2", 3),)
+    assert records["db.local"].ipv4 == ("10.0.0.5",)
+
+
+def test_get_citm_dns_record_sets_uses_env_selected_network(monkeypatch):
+    containers = [
+        _container("1", {"citm_network": "env-net", "citm_dns_names": "svc.local"}, {}),
+        _container(
+            "2", {"citm_network": "other-net", "citm_dns_names": "svc.local"}, {}
+        ),
+    ]
+    networks = {
+        "env-net": FakeNetwork(
+            attrs={"Containers": {"1": _endpoint("10.0.0.2", "fd00::2")}}
+        ),
+    }
+    docker_client = FakeDockerClient(containers, networks)
     monkeypatch.setenv("CITM_DNS_NETWORK", "env-net")
     monkeypatch.setenv("CITM_NETWORK", "fallback-net")
 
     records = get_citm_dns_record_sets(docker_client)
 
     assert records["svc.local"].ipv4 == ("10.0.0.2",)
+    assert docker_client.networks.get_calls == ["env-net"]
     assert docker_client.containers.last_list_call == {
         "all": False,
         "filters": {
@@ -112,23 +226,55 @@ def test_get_citm_dns_record_sets_uses_env_selected_network(monkeypatch):
                 "citm_network=env-net",
             ]
         },
+        "sparse": True,
     }
 
 
-def test_get_citm_dns_entries_returns_json_friendly_lists():
+def test_get_citm_dns_record_sets_returns_empty_when_network_is_missing():
     containers = [
-        FakeContainer(
-            id="1",
-            labels={"citm_network": "net1", "citm_dns_names": "svc.local"},
-            attrs={
-                "NetworkSettings": {
-                    "Networks": {"net1": _network("10.0.0.2", "fd00::2")}
-                }
-            },
+        _container("1", {"citm_network": "net1", "citm_dns_names": "svc.local"}, {}),
+    ]
+    docker_client = FakeDockerClient(containers)
+
+    assert get_citm_dns_record_sets(docker_client, network_name="net1") == {}
+
+
+def test_get_citm_dns_record_sets_reads_list_networks_without_selected_network(
+    monkeypatch,
+):
+    monkeypatch.delenv("CITM_DNS_NETWORK", raising=False)
+    monkeypatch.delenv("CITM_NETWORK", raising=False)
+    containers = [
+        _container(
+            "1",
+            {"citm_network": "net1", "citm_dns_names": "svc.local"},
+            {"net1": _network("10.0.0.2")},
+        ),
+        _container(
+            "2",
+            {"citm_network": "net2", "citm_dns_names": "svc.local"},
+            {"net2": _network("10.0.1.2")},
         ),
     ]
     docker_client = FakeDockerClient(containers)
 
+    records = get_citm_dns_record_sets(docker_client)
+
+    assert records["svc.local"].ipv4 == ("10.0.0.2", "10.0.1.2")
+    assert docker_client.networks.get_calls == []
+
+
+def test_get_citm_dns_entries_returns_json_friendly_lists():
+    containers = [
+        _container("1", {"citm_network": "net1", "citm_dns_names": "svc.local"}, {}),
+    ]
+    networks = {
+        "net1": FakeNetwork(
+            attrs={"Containers": {"1": _endpoint("10.0.0.2", "fd00::2")}}
+        ),
+    }
+    docker_client = FakeDockerClient(containers, networks)
+
     entries = get_citm_dns_entries(docker_client, network_name="net1")
 
     assert entries == {"svc.local": {"ipv4": ["10.0.0.2"], "ipv6": ["fd00::2"]}}
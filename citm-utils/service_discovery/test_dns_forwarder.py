@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import asyncio
+import ipaddress
 import socket
-import time
+import threading
 
-from dnslib import DNSHeader, DNSRecord, QTYPE, RCODE
+from dnslib import A, EDNS0, RR, DNSHeader, DNSRecord, QTYPE, RCODE
 
 import service_discovery.dns_forwarder as dns_forwarder
 from service_discovery.dns_forwarder import (
@@ -11,10 +13,10 @@ from service_discovery.dns_forwarder import (
     DnsRecordSet,
     ResolvConfManager,
     build_local_response,
-    find_matching_record_set,
-    matches_suffix,
-    select_best_suffix_match,
 )
+from service_discovery.discovery import SrvRecord
+from service_discovery.forwarding import ForwardZone
+from service_discovery.registry import DiscoverySnapshot
 
 
 def _make_forwarder(monkeypatch, *, discovered_records=None, upstream_nameservers=None):
@@ -33,26 +35,6 @@ def _make_forwarder(monkeypatch, *, discovered_records=None, upstream_nameserver
     )
 
 
-def test_matches_label_boundary_suffix():
-    assert matches_suffix("a.b", "a.b")
-    assert matches_suffix("x.a.b", "a.b")
-    assert matches_suffix("y.x.a.b", "a.b")
-
-
-def test_does_not_match_without_label_boundary():
-    assert not matches_suffix("xa.b", "a.b")
-    assert not matches_suffix("a.bb", "a.b")
-
-
-def test_selects_longest_suffix_match():
-    records = {
-        "b": DnsRecordSet(ipv4=("10.0.0.1",), ipv6=()),
-        "a.b": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=()),
-        "x.a.b": DnsRecordSet(ipv4=("10.0.0.3",), ipv6=()),
-    }
-    assert select_best_suffix_match("z.x.a.b", records) == "x.a.b"
-
-
 def test_build_local_response_returns_ipv4_for_a_query():
     request = DNSRecord.question("svc.a.b", qtype="A")
     response = build_local_response(
@@ -108,7 +90,15 @@ def test_build_local_response_returns_none_for_non_address_query():
     assert response is None
 
 
-def test_cache_reuses_entries_within_ttl():
+class FakeClock:
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_cache_reuses_snapshot_within_ttl():
     calls = {"count": 0}
 
     def load_records():
@@ -116,26 +106,86 @@ def test_cache_reuses_entries_within_ttl():
         return {"a.b": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=())}
 
     cache = DiscoveryCache(0.5, load_records)
-    cache.get_records()
-    cache.get_records()
+    first = cache.snapshot
+    assert cache.snapshot is first
     assert calls["count"] == 1
+    assert first.match("x.a.b") == "a.b"
 
 
-def test_cache_refreshes_after_ttl():
+def test_cache_serves_stale_snapshot_while_refreshing_in_background():
+    loaded = threading.Event()
+    release = threading.Event()
     calls = {"count": 0}
 
     def load_records():
         calls["count"] += 1
-        return {"a.b": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=())}
+        if calls["count"] > 1:
+            loaded.set()
+            release.wait(5)
+        return {f"v{calls['count']}.b": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=())}
+
+    clock = FakeClock()
+    cache = DiscoveryCache(1.0, load_records, clock=clock)
+    stale = cache.snapshot
+    clock.now += 1.0
+
+    assert cache.snapshot is stale
+    assert loaded.wait(5)
+    assert cache.snapshot is stale
+    assert calls["count"] == 2
 
-    cache = DiscoveryCache(0.1, load_records)
-    cache.get_records()
-    time.sleep(0.2)
-    cache.get_records()
+    release.set()
+    assert cache.wait_for_refresh(5)
+    assert cache.snapshot.match("v2.b") == "v2.b"
     assert calls["count"] == 2
 
 
-def test_cache_miss_triggers_force_refresh():
+def test_cache_keeps_snapshot_when_refresh_fails(capsys):
+    calls = {"count": 0}
+
+    def load_records():
+        calls["count"] += 1
+        if calls["count"] > 1:
+            raise RuntimeError("docker unavailable")
+        return {"a.b": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=())}
+
+    clock = FakeClock()
+    cache = DiscoveryCache(1.0, load_records, clock=clock)
+    snapshot = cache.snapshot
+    clock.now += 1.0
+    cache.snapshot
+    assert cache.wait_for_refresh(5)
+
+    assert cache.snapshot is snapshot
+    assert "Docker discovery refresh failed: docker unavailable" in (
+        capsys.readouterr().out
+    )
+
+
+def _make_poll_forwarder(
+    monkeypatch, load_records, *, clock, forced_refresh_interval_seconds=5.0
+):
+    forwarder = _make_forwarder(monkeypatch)
+    monkeypatch.setattr(
+        dns_forwarder,
+        "get_citm_dns_record_sets",
+        lambda _docker_client, network_name=None: load_records(),
+    )
+    forwarder._cache = DiscoveryCache(
+        60,
+        forwarder._load_discovery_records,
+        forced_refresh_interval_seconds=forced_refresh_interval_seconds,
+        clock=clock,
+    )
+
+    async def fake_forward_upstream(_request_bytes, *, via_tcp):
+        return None
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+    return forwarder
+
+
+def test_resolve_forces_discovery_refresh_on_miss(monkeypatch):
     calls = {"count": 0}
 
     def load_records():
@@ -144,12 +194,73 @@ def test_cache_miss_triggers_force_refresh():
             return {}
         return {"a.b": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=())}
 
-    cache = DiscoveryCache(60, load_records)
-    result = find_matching_record_set("x.a.b", cache)
-    assert result is not None
+    forwarder = _make_poll_forwarder(monkeypatch, load_records, clock=FakeClock())
+
+    response = DNSRecord.parse(
+        _resolve(forwarder, DNSRecord.question("x.a.b").pack(), via_tcp=False)
+    )
+
+    assert [str(rr.rdata) for rr in response.rr] == ["10.0.0.2"]
     assert calls["count"] == 2
 
 
+def test_resolve_remembers_discovery_misses_per_name(monkeypatch):
+    calls = {"count": 0}
+
+    def load_records():
+        calls["count"] += 1
+        return {}
+
+    clock = FakeClock()
+    forwarder = _make_poll_forwarder(monkeypatch, load_records, clock=clock)
+    request_bytes = DNSRecord.question("github.com").pack()
+
+    first = DNSRecord.parse(_resolve(forwarder, request_bytes, via_tcp=False))
+    clock.now += 5
+    second = DNSRecord.parse(_resolve(forwarder, request_bytes, via_tcp=False))
+
+    assert first.header.rcode == second.header.rcode == RCODE.SERVFAIL
+    assert calls["count"] == 2
+
+
+def test_resolve_rate_limits_forced_refreshes_across_names(monkeypatch):
+    calls = {"count": 0}
+
+    def load_records():
+        calls["count"] += 1
+        return {}
+
+    clock = FakeClock()
+    forwarder = _make_poll_forwarder(
+        monkeypatch, load_records, clock=clock, forced_refresh_interval_seconds=1.0
+    )
+
+    def resolve(name):
+        _resolve(forwarder, DNSRecord.question(name).pack(), via_tcp=False)
+
+    resolve("github.com")
+    resolve("pypi.org")
+    assert calls["count"] == 2
+
+    clock.now += 1.0
+    resolve("files.pythonhosted.org")
+    assert calls["count"] == 3
+
+
+def test_negative_cache_expires_and_evicts_oldest_entries():
+    clock = FakeClock()
+    misses = dns_forwarder.NegativeCache(10, max_entries=2, clock=clock)
+
+    misses.add("a.example")
+    misses.add("b.example")
+    misses.add("c.example")
+    assert "a.example" not in misses
+    assert "b.example" in misses
+
+    clock.now += 10
+    assert "c.example" not in misses
+
+
 def test_resolv_conf_manager_activate_and_restore(tmp_path):
     resolv_path = tmp_path / "resolv.conf"
     backup_path = tmp_path / "resolv.conf.bak"
@@ -242,16 +353,20 @@ def test_parse_upstream_nameservers_env_ignores_invalid_entries(monkeypatch, cap
     )
 
 
+def _resolve(forwarder, request_bytes: bytes, *, via_tcp: bool) -> bytes:
+    return asyncio.run(forwarder.resolve(request_bytes, via_tcp=via_tcp))
+
+
 def test_resolve_returns_empty_bytes_for_invalid_request(monkeypatch):
     forwarder = _make_forwarder(monkeypatch)
-    assert forwarder.resolve(b"invalid-packet", via_tcp=False) == b""
+    assert _resolve(forwarder, b"invalid-packet", via_tcp=False) == b""
 
 
 def test_resolve_returns_formerr_when_no_questions(monkeypatch):
     forwarder = _make_forwarder(monkeypatch)
     request_bytes = DNSRecord(DNSHeader(id=7)).pack()
 
-    response_bytes = forwarder.resolve(request_bytes, via_tcp=False)
+    response_bytes = _resolve(forwarder, request_bytes, via_tcp=False)
     response = DNSRecord.parse(response_bytes)
 
     assert response.header.id == 7
@@ -267,13 +382,14 @@ def test_resolve_prefers_local_records_over_upstream(monkeypatch):
     )
     upstream_calls = {"count": 0}
 
-    def fake_forward_upstream(_request_bytes, *, via_tcp):
+    async def fake_forward_upstream(_request_bytes, *, via_tcp):
         assert via_tcp is False
         upstream_calls["count"] += 1
         return b"ignored"
 
     monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
-    response_bytes = forwarder.resolve(
+    response_bytes = _resolve(
+        forwarder,
         DNSRecord.question("api.svc.local", qtype="A").pack(),
         via_tcp=False,
     )
@@ -291,11 +407,14 @@ def test_resolve_forwards_non_address_query_when_local_name_matches(monkeypatch)
             "svc.local": DnsRecordSet(ipv4=("10.0.0.8",), ipv6=()),
         },
     )
-    monkeypatch.setattr(
-        forwarder, "_forward_upstream", lambda *_args, **_kwargs: b"upstream"
-    )
 
-    response = forwarder.resolve(
+    async def fake_forward_upstream(_request_bytes, *, via_tcp):
+        return b"upstream"
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+
+    response = _resolve(
+        forwarder,
         DNSRecord.question("api.svc.local", qtype="TXT").pack(),
         via_tcp=False,
     )
@@ -303,6 +422,37 @@ def test_resolve_forwards_non_address_query_when_local_name_matches(monkeypatch)
     assert response == b"upstream"
 
 
+def test_resolve_forwards_with_edns_and_fits_answer_to_client(monkeypatch):
+    forwarder = _make_forwarder(monkeypatch, upstream_nameservers=["192.0.2.53"])
+    upstream_requests = []
+
+    async def fake_forward_upstream(request_bytes, *, via_tcp):
+        request = DNSRecord.parse(request_bytes)
+        upstream_requests.append(request)
+        reply = request.reply()
+        for index in range(60):
+            reply.add_answer(
+                RR(request.q.qname, QTYPE.A, ttl=60, rdata=A(f"10.0.1.{index}"))
+            )
+        reply.add_ar(EDNS0(udp_len=4096))
+        return reply.pack()
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+    plain = DNSRecord.question("large.example.com")
+    edns = DNSRecord.question("large.example.com")
+    edns.add_ar(EDNS0(udp_len=1232))
+
+    plain_udp = DNSRecord.parse(_resolve(forwarder, plain.pack(), via_tcp=False))
+    edns_udp = DNSRecord.parse(_resolve(forwarder, edns.pack(), via_tcp=False))
+    plain_tcp = DNSRecord.parse(_resolve(forwarder, plain.pack(), via_tcp=True))
+
+    assert len(upstream_requests) == 1
+    assert upstream_requests[0].ar[0].edns_len == 1232
+    assert (plain_udp.header.tc, plain_udp.rr, plain_udp.ar) == (1, [], [])
+    assert (edns_udp.header.tc, len(edns_udp.rr)) == (0, 60)
+    assert (len(plain_tcp.rr), plain_tcp.ar) == (60, [])
+
+
 def test_resolve_returns_servfail_when_upstream_unavailable(monkeypatch):
     forwarder = _make_forwarder(
         monkeypatch,
@@ -310,7 +460,8 @@ def test_resolve_returns_servfail_when_upstream_unavailable(monkeypatch):
         upstream_nameservers=[],
     )
 
-    response_bytes = forwarder.resolve(
+    response_bytes = _resolve(
+        forwarder,
         DNSRecord.question("no-match.local", qtype="A").pack(),
         via_tcp=False,
     )
@@ -319,49 +470,243 @@ def test_resolve_returns_servfail_when_upstream_unavailable(monkeypatch):
     assert response.header.rcode == RCODE.SERVFAIL
 
 
-def test_forward_upstream_retries_over_tcp_for_truncated_udp(monkeypatch):
+def test_resolve_uses_registry_snapshot_without_forcing_refresh(monkeypatch):
+    class FakeRegistry:
+        snapshot = DiscoverySnapshot.build(
+            {"svc.local": DnsRecordSet(ipv4=("10.0.0.8",), ipv6=())}, version=1
+        )
+
+    def failing_loader(_docker_client, network_name=None):
+        raise AssertionError("registry mode must not poll Docker")
+
+    monkeypatch.setattr(dns_forwarder, "get_citm_dns_record_sets", failing_loader)
+    forwarder = dns_forwarder.DnsForwarder(
+        docker_client=object(),
+        upstream_nameservers=[],
+        cache_ttl_seconds=60,
+        upstream_timeout_seconds=1.0,
+        registry=FakeRegistry(),
+    )
+
+    local = DNSRecord.parse(
+        _resolve(forwarder, DNSRecord.question("api.svc.local").pack(), via_tcp=False)
+    )
+    external = DNSRecord.parse(
+        _resolve(forwarder, DNSRecord.question("github.com").pack(), via_tcp=False)
+    )
+
+    assert [str(rr.rdata) for rr in local.rr] == ["10.0.0.8"]
+    assert external.header.rcode == RCODE.SERVFAIL
+
+
+def test_resolve_answers_ptr_and_srv_for_discovered_containers(monkeypatch):
+    class FakeRegistry:
+        snapshot = DiscoverySnapshot.build(
+            {
+                "svc.local": DnsRecordSet(
+                    ipv4=("10.0.0.8",),
+                    ipv6=("fd00::8",),
+                    srv=(SrvRecord("http", "tcp", 8080),),
+                )
+            },
+            version=1,
+        )
+
+    forwarder = _make_forwarder(monkeypatch, upstream_nameservers=["192.0.2.53"])
+    forwarder._registry = FakeRegistry()
+    forwarded = []
+
+    async def fake_forward_upstream(request_bytes, *, via_tcp):
+        forwarded.append(str(DNSRecord.parse(request_bytes).q.qname))
+        return None
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+
+    def query(name: str, qtype: str) -> DNSRecord:
+        request = DNSRecord.question(name, qtype)
+        return DNSRecord.parse(_resolve(forwarder, request.pack(), via_tcp=False))
+
+    ptr_v4 = query("8.0.0.10.in-addr.arpa", "PTR")
+    ptr_v6 = query(ipaddress.ip_address("fd00::8").reverse_pointer, "PTR")
+    srv = query("_http._tcp.svc.local", "SRV")
+    query("9.0.0.10.in-addr.arpa", "PTR")
+    query("_grpc._tcp.svc.local", "SRV")
+
+    assert [str(rr.rdata) for rr in ptr_v4.rr] == ["svc.local."]
+    assert [str(rr.rdata) for rr in ptr_v6.rr] == ["svc.local."]
+    assert ptr_v4.header.aa == 1
+    assert [(rr.rdata.port, str(rr.rdata.target)) for rr in srv.rr] == [
+        (8080, "svc.local.")
+    ]
+    assert [str(rr.rdata) for rr in srv.ar] == ["10.0.0.8", "fd00::8"]
+    assert forwarded == ["9.0.0.10.in-addr.arpa.", "_grpc._tcp.svc.local."]
+
+
+def test_resolve_sends_zone_queries_only_to_zone_nameservers(monkeypatch):
+    monkeypatch.setattr(
+        dns_forwarder,
+        "get_citm_dns_record_sets",
+        lambda _docker_client, network_name=None: {},
+    )
+    forwarder = dns_forwarder.DnsForwarder(
+        docker_client=object(),
+        upstream_nameservers=["192.0.2.53"],
+        cache_ttl_seconds=60,
+        upstream_timeout_seconds=1.0,
+        forward_zones=[
+            ForwardZone(suffix="corp.example", nameservers=("10.0.0.53",), cache=False)
+        ],
+    )
+    sent = []
+
+    def answering(target):
+        async def resolve(request_bytes, *, via_tcp):
+            request = DNSRecord.parse(request_bytes)
+            sent.append((target, str(request.q.qname)))
+            reply = request.reply()
+            reply.add_answer(RR(request.q.qname, QTYPE.A, ttl=60, rdata=A("10.9.9.9")))
+            return reply.pack()
+
+        return resolve
+
+    monkeypatch.setattr(forwarder, "_forward_upstream", answering("default"))
+    monkeypatch.setattr(
+        forwarder.forwarding.route("corp.example").upstream,
+        "resolve",
+        answering("corp"),
+    )
+
+    for name in ("db.corp.example", "db.corp.example", "github.com", "github.com"):
+        _resolve(forwarder, DNSRecord.question(name).pack(), via_tcp=False)
+
+    assert sent == [
+        ("corp", "db.corp.example."),
+        ("corp", "db.corp.example."),
+        ("default", "github.com."),
+    ]
+    assert set(forwarder.upstream_stats()["zones"]) == {"corp.example"}
+
+
+def test_resolve_rotates_local_answers_across_replicas(monkeypatch):
     forwarder = _make_forwarder(
         monkeypatch,
-        discovered_records={},
-        upstream_nameservers=["1.1.1.1"],
+        discovered_records={
+            "svc.local": DnsRecordSet(ipv4=("10.0.0.8", "10.0.0.9"), ipv6=()),
+        },
     )
-    request_bytes = DNSRecord.question("svc.local", qtype="A").pack()
-    udp_response = DNSRecord.question("svc.local", qtype="A").reply()
-    udp_response.header.tc = 1
 
-    calls: list[tuple[str, str]] = []
+    firsts = []
+    for qtype in ("A", "ANY", "A", "ANY"):
+        request = DNSRecord.question("api.svc.local", qtype)
+        response = DNSRecord.parse(_resolve(forwarder, request.pack(), via_tcp=False))
+        firsts.append(str(response.rr[0].rdata))
+
+    assert firsts == ["10.0.0.8", "10.0.0.9", "10.0.0.8", "10.0.0.9"]
+
+
+def test_resolve_coalesces_identical_upstream_queries(monkeypatch):
+    forwarder = _make_forwarder(monkeypatch, upstream_nameservers=["192.0.2.53"])
+    upstream_calls = []
 
-    def fake_udp(nameserver: str, _request_bytes: bytes) -> bytes:
-        calls.append(("udp", nameserver))
-        return udp_response.pack()
+    async def slow_forward_upstream(request_bytes, *, via_tcp):
+        upstream_calls.append(request_bytes)
+        await asyncio.sleep(0.05)
+        reply = DNSRecord.parse(request_bytes).reply()
+        reply.header.rcode = RCODE.SERVFAIL
+        return reply.pack()
 
-    def fake_tcp(nameserver: str, _request_bytes: bytes) -> bytes:
-        calls.append(("tcp", nameserver))
-        return b"tcp-response"
+    monkeypatch.setattr(forwarder, "_forward_upstream", slow_forward_upstream)
+    requests = [DNSRecord.question("Registry.example.com") for _ in range(5)]
+    requests.append(DNSRecord.question("registry.example.com", qtype="AAAA"))
 
-    monkeypatch.setattr(forwarder, "_forward_udp", fake_udp)
-    monkeypatch.setattr(forwarder, "_forward_tcp", fake_tcp)
+    async def scenario():
+        return await asyncio.gather(
+            *(forwarder.resolve(r.pack(), via_tcp=False) for r in requests)
+        )
 
-    result = forwarder._forward_upstream(request_bytes, via_tcp=False)
+    responses = [DNSRecord.parse(response) for response in asyncio.run(scenario())]
 
-    assert result == b"tcp-response"
-    assert calls == [("udp", "1.1.1.1"), ("tcp", "1.1.1.1")]
+    assert len(upstream_calls) == 2
+    assert forwarder.coalesced_queries == 4
+    assert [r.header.id for r in responses] == [r.header.id for r in requests]
+    assert all(str(r.q.qname) == "Registry.example.com." for r in responses[:5])
+    assert forwarder._upstream_in_flight == {}
 
 
-def test_forward_upstream_returns_none_when_all_nameservers_fail(monkeypatch):
+def test_resolve_records_answer_sources_and_recent_queries(monkeypatch):
     forwarder = _make_forwarder(
         monkeypatch,
-        discovered_records={},
-        upstream_nameservers=["1.1.1.1", "8.8.8.8"],
+        discovered_records={"svc.local": DnsRecordSet(ipv4=("10.0.0.8",), ipv6=())},
     )
 
-    def failing_udp(_nameserver: str, _request_bytes: bytes) -> bytes:
-        raise TimeoutError("timed out")
+    async def fake_forward_upstream(request_bytes, *, via_tcp):
+        request = DNSRecord.parse(request_bytes)
+        if str(request.q.qname) == "down.example.":
+            return None
+        reply = request.reply()
+        reply.add_answer(RR(request.q.qname, QTYPE.A, rdata=A("93.184.216.34"), ttl=60))
+        return reply.pack()
 
-    monkeypatch.setattr(forwarder, "_forward_udp", failing_udp)
-    result = forwarder._forward_upstream(
-        DNSRecord.question("svc.local", qtype="A").pack(),
-        via_tcp=False,
+    monkeypatch.setattr(forwarder, "_forward_upstream", fake_forward_upstream)
+    for name in ("api.svc.local", "example.com", "example.com", "down.example"):
+        _resolve(forwarder, DNSRecord.question(name).pack(), via_tcp=False)
+    _resolve(forwarder, b"invalid-packet", via_tcp=True)
+
+    stats = dns_forwarder.stats_routes(
+        forwarder, dns_forwarder.DnsServer(forwarder.resolve, host="127.0.0.1", port=0)
+    )["/metrics"]()
+    recent = forwarder.metrics.recent_queries()
+
+    assert stats["queries"] == 5
+    assert stats["answers"] == {
+        "local": 1,
+        "cache": 1,
+        "stale": 0,
+        "upstream": 1,
+        "servfail": 1,
+        "invalid": 1,
+    }
+    assert stats["latency"]["local"]["count"] == 1
+    assert stats["answer_cache"]["entries"] == 1
+    assert stats["dropped_queries"] == 0
+    assert [(entry["source"], entry["transport"]) for entry in recent] == [
+        ("invalid", "tcp"),
+        ("servfail", "udp"),
+        ("cache", "udp"),
+        ("upstream", "udp"),
+        ("local", "udp"),
+    ]
+    assert recent[-1]["name"] == "api.svc.local"
+    assert (recent[-1]["qtype"], recent[-1]["rcode"]) == ("A", "NOERROR")
+    assert recent[1]["rcode"] == "SERVFAIL"
+
+
+def test_poll_mode_matches_on_the_loop_after_the_first_load(monkeypatch):
+    forwarder = _make_forwarder(
+        monkeypatch,
+        discovered_records={"svc.local": DnsRecordSet(ipv4=("10.0.0.8",), ipv6=())},
     )
+    to_thread = asyncio.to_thread
+    thread_hops = []
+
+    async def counting_to_thread(func, *args):
+        thread_hops.append(func)
+        return await to_thread(func, *args)
+
+    monkeypatch.setattr(dns_forwarder.asyncio, "to_thread", counting_to_thread)
+
+    async def resolve_all(names):
+        return await asyncio.gather(
+            *(
+                forwarder.resolve(DNSRecord.question(name).pack(), via_tcp=False)
+                for name in names
+            )
+        )
+
+    local = asyncio.run(resolve_all(["api.svc.local"] * 3))
+    assert len(thread_hops) == 1
+    assert all(DNSRecord.parse(response).rr for response in local)
 
-    assert result is None
+    asyncio.run(resolve_all(["a.other.local", "b.other.local"]))
+    assert len(thread_hops) == 2
+    assert "a.other.local" in forwarder._cache.misses
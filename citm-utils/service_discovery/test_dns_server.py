@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+
+from dnslib import A, DNSRecord, QTYPE, RR
+
+from service_discovery.dns_server import DnsServer, QuerySlots
+
+
+async def _echo_resolver(request_bytes: bytes, *, via_tcp: bool) -> bytes:
+    reply = DNSRecord.parse(request_bytes).reply()
+    reply.add_answer(RR("tcp" if via_tcp else "udp", QTYPE.A, rdata=A("10.0.0.1")))
+    return reply.pack()
+
+
+async def _udp_query(port: int, request_bytes: bytes) -> bytes:
+    loop = asyncio.get_running_loop()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+        client.setblocking(False)
+        await loop.sock_connect(client, ("127.0.0.1", port))
+        await loop.sock_sendall(client, request_bytes)
+        return await asyncio.wait_for(loop.sock_recv(client, 65535), 5)
+
+
+async def _tcp_queries(port: int, requests: list[bytes]) -> list[bytes]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        responses = []
+        for request_bytes in requests:
+            writer.write(len(request_bytes).to_bytes(2, "big") + request_bytes)
+            response_len = int.from_bytes(await reader.readexactly(2), "big")
+            responses.append(await reader.readexactly(response_len))
+        return responses
+    finally:
+        writer.close()
+
+
+def test_server_answers_udp_and_tcp_queries():
+    async def scenario():
+        server = DnsServer(_echo_resolver, host="127.0.0.1", port=0)
+        await server.start()
+        try:
+            request = DNSRecord.question("svc.local")
+            udp = DNSRecord.parse(await _udp_query(server.port, request.pack()))
+            tcp = await _tcp_queries(server.port, [request.pack(), request.pack()])
+        finally:
+            await server.close()
+        return request, udp, [DNSRecord.parse(response) for response in tcp]
+
+    request, udp, tcp = asyncio.run(scenario())
+
+    assert udp.header.id == request.header.id
+    assert str(udp.rr[0].rname) == "udp."
+    assert [str(response.rr[0].rname) for response in tcp] == ["tcp.", "tcp."]
+
+
+def test_pipelined_tcp_queries_are_answered_as_they_complete():
+    async def scenario():
+        release_slow = asyncio.Event()
+        resolving = []
+
+        async def resolver(request_bytes: bytes, *, via_tcp: bool) -> bytes:
+            name = str(DNSRecord.parse(request_bytes).q.qname)
+            resolving.append(name)
+            if name == "slow.local.":
+                await release_slow.wait()
+            return await _echo_resolver(request_bytes, via_tcp=via_tcp)
+
+        server = DnsServer(
+            resolver, host="127.0.0.1", port=0, tcp_max_queries_per_connection=2
+        )
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        try:
+            requests = [
+                DNSRecord.question(name)
+                for name in ("slow.local", "a.local", "b.local")
+            ]
+            for request in requests:
+                request_bytes = request.pack()
+                writer.write(len(request_bytes).to_bytes(2, "big") + request_bytes)
+            responses = []
+            for _ in range(2):
+                response_len = int.from_bytes(await reader.readexactly(2), "big")
+                responses.append(
+                    DNSRecord.parse(await reader.readexactly(response_len))
+                )
+            release_slow.set()
+            response_len = int.from_bytes(await reader.readexactly(2), "big")
+            responses.append(DNSRecord.parse(await reader.readexactly(response_len)))
+        finally:
+            writer.close()
+            await server.close()
+        return requests, responses, resolving
+
+    requests, responses, resolving = asyncio.run(scenario())
+
+    assert [str(response.q.qname) for response in responses] == [
+        "a.local.",
+        "b.local.",
+        "slow.local.",
+    ]
+    assert [response.header.id for response in responses] == [
+        requests[1].header.id,
+        requests[2].header.id,
+        requests[0].header.id,
+    ]
+    assert resolving == ["slow.local.", "a.local.", "b.local."]
+
+
+def test_idle_tcp_connections_are_closed():
+    async def scenario():
+        server = DnsServer(
+            _echo_resolver, host="127.0.0.1", port=0, tcp_idle_timeout_seconds=0.05
+        )
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        try:
+            request_bytes = DNSRecord.question("svc.local").pack()
+            writer.write(len(request_bytes).to_bytes(2, "big") + request_bytes)
+            response_len = int.from_bytes(await reader.readexactly(2), "big")
+            await reader.readexactly(response_len)
+            return await asyncio.wait_for(reader.read(), 5)
+        finally:
+            writer.close()
+            await server.close()
+
+    assert asyncio.run(scenario()) == b""
+
+
+def test_server_drops_udp_queries_beyond_concurrency_limit():
+    async def scenario():
+        release = asyncio.Event()
+        started = asyncio.Event()
+
+        async def blocking_resolver(request_bytes: bytes, *, via_tcp: bool) -> bytes:
+            started.set()
+            await release.wait()
+            return await _echo_resolver(request_bytes, via_tcp=via_tcp)
+
+        server = DnsServer(
+            blocking_resolver, host="127.0.0.1", port=0, max_concurrent_queries=1
+        )
+        await server.start()
+        try:
+            first = asyncio.create_task(
+                _udp_query(server.port, DNSRecord.question("a.local").pack())
+            )
+            await started.wait()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as client:
+                client.sendto(
+                    DNSRecord.question("b.local").pack(), ("127.0.0.1", server.port)
+                )
+            while server.dropped_queries == 0:
+                await asyncio.sleep(0.01)
+            release.set()
+            await first
+        finally:
+            await server.close()
+        return server
+
+    server = asyncio.run(scenario())
+
+    assert server.dropped_queries == 1
+    assert server.slots.in_flight == 0
+
+
+def test_query_slots_queue_waiters_in_order():
+    async def scenario():
+        slots = QuerySlots(1)
+        order = []
+
+        async def worker(name: str):
+            await slots.acquire()
+            order.append(name)
+            await asyncio.sleep(0)
+            slots.release()
+
+        assert slots.try_acquire()
+        tasks = [asyncio.create_task(worker(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        assert not slots.try_acquire()
+        slots.release()
+        await asyncio.gather(*tasks)
+        return order, slots.in_flight
+
+    assert asyncio.run(scenario()) == (["a", "b"], 0)
+
+
+def test_servers_with_reuse_port_share_one_port():
+    async def scenario():
+        first = DnsServer(_echo_resolver, host="127.0.0.1", port=0, reuse_port=True)
+        await first.start()
+        second = DnsServer(
+            _echo_resolver, host="127.0.0.1", port=first.port, reuse_port=True
+        )
+        await second.start()
+        try:
+            request = DNSRecord.question("svc.local")
+            response = await _udp_query(second.port, request.pack())
+        finally:
+            await first.close()
+            await second.close()
+        return first.port, second.port, DNSRecord.parse(response)
+
+    first_port, second_port, response = asyncio.run(scenario())
+
+    assert first_port == second_port
+    assert str(response.rr[0].rname) == "udp."
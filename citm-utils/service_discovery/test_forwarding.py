@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from service_discovery.forwarding import (
+    ForwardingTable,
+    ForwardZone,
+    parse_forward_zones,
+)
+from service_discovery.upstream import UpstreamResolver
+
+
+def test_parse_forward_zones_accepts_lists_and_objects_and_skips_invalid(capsys):
+    zones = parse_forward_zones("""{
+            "Corp.Example.": ["10.0.0.53", "10.0.0.54"],
+            "lab.internal": {
+                "nameservers": ["fd00::53"],
+                "timeout_seconds": 0.5,
+                "cache": false,
+                "port": 5353
+            },
+            "bad-ip.internal": ["not-an-ip"],
+            "bad-timeout.internal": {"nameservers": ["10.0.0.1"], "timeout_seconds": 0},
+            "empty.internal": []
+        }""")
+
+    assert zones == [
+        ForwardZone(suffix="corp.example", nameservers=("10.0.0.53", "10.0.0.54")),
+        ForwardZone(
+            suffix="lab.internal",
+            nameservers=("fd00::53",),
+            timeout_seconds=0.5,
+            cache=False,
+            port=5353,
+        ),
+    ]
+    output = capsys.readouterr().out
+    for zone in ("bad-ip.internal", "bad-timeout.internal", "empty.internal"):
+        assert f"Invalid forward zone {zone!r}" in output
+
+
+def test_forwarding_table_routes_by_longest_suffix():
+    table = ForwardingTable(
+        [
+            ForwardZone(suffix="corp.example", nameservers=("10.0.0.53",)),
+            ForwardZone(suffix="eu.corp.example", nameservers=("10.1.0.53",)),
+        ],
+        lambda zone: UpstreamResolver(zone.nameservers, deadline_seconds=1.0),
+    )
+
+    assert table.route("db.eu.corp.example").zone.suffix == "eu.corp.example"
+    assert table.route("WWW.Corp.Example.").zone.suffix == "corp.example"
+    assert table.route("notcorp.example") is None
+    assert table.route("github.com") is None
+    assert set(table.stats()) == {"corp.example", "eu.corp.example"}
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from service_discovery.metrics import DnsMetrics, LatencyHistogram
+
+
+def test_latency_histogram_reports_bucket_quantiles():
+    histogram = LatencyHistogram()
+    for _ in range(98):
+        histogram.observe(0.0003)
+    histogram.observe(0.02)
+    histogram.observe(120.0)
+
+    stats = histogram.stats()
+
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == 0.512
+    assert stats["p99_ms"] == 32.768
+    assert stats["p99.9_ms"] == 8388.608
+    assert stats["buckets_ms"] == {"0.512": 98, "32.768": 1, "8388.608": 1}
+    assert LatencyHistogram().stats()["p50_ms"] is None
+
+
+def test_query_log_keeps_most_recent_queries_first():
+    metrics = DnsMetrics(query_log_size=2)
+    response = b"\x00\x01\x81\x80" + b"\x00" * 8
+    for name in ("a.example", "b.example", "c.example"):
+        metrics.record("cache", name, 1, 0.0, response, via_tcp=False)
+
+    assert metrics.stats()["answers"]["cache"] == 3
+    assert [entry["name"] for entry in metrics.recent_queries()] == [
+        "c.example",
+        "b.example",
+    ]
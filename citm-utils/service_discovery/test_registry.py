@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import ipaddress
+import queue
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import docker
+import pytest
+
+from service_discovery.discovery import DnsRecordSet
+from service_discovery.registry import (
+    EVENT_FILTERS,
+    DiscoveryRegistry,
+    DiscoverySnapshot,
+)
+
+
+@dataclass
+class FakeContainer:
+    id: str
+    labels: dict[str, str]
+    attrs: dict
+
+
+class FakeContainerCollection:
+    def __init__(self, containers: list[FakeContainer]):
+        self.by_id = {container.id: container for container in containers}
+        self.list_calls = 0
+        self.get_calls = 0
+
+    def list(self, all: bool, filters: dict, sparse: bool):
+        self.list_calls += 1
+        return list(self.by_id.values())
+
+    def get(self, container_id: str):
+        self.get_calls += 1
+        try:
+            return self.by_id[container_id]
+        except KeyError:
+            raise docker.errors.NotFound(container_id) from None
+
+
+class FakeEventStream:
+    def __init__(self):
+        self._events: queue.Queue = queue.Queue()
+        self.closed = False
+
+    def put(self, event: dict) -> None:
+        self._events.put(event)
+
+    def __iter__(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            yield event
+
+    def close(self) -> None:
+        self.closed = True
+        self._events.put(None)
+
+
+class FakeNetworkCollection:
+    def __init__(self, containers: FakeContainerCollection):
+        self._containers = containers
+
+    def get(self, _network_name: str):
+        return SimpleNamespace(
+            attrs={
+                "Containers": {
+                    container.id: {
+                        "IPv4Address": f"{network['IPAddress']}/16",
+                        "IPv6Address": "",
+                    }
+                    for container in self._containers.by_id.values()
+                    for network in container.attrs["NetworkSettings"][
+                        "Networks"
+                    ].values()
+                }
+            }
+        )
+
+
+class FakeDockerClient:
+    def __init__(self, containers: list[FakeContainer]):
+        self.containers = FakeContainerCollection(containers)
+        self.networks = FakeNetworkCollection(self.containers)
+        self.stream = FakeEventStream()
+        self.events_calls: list[dict] = []
+
+    def events(self, *, decode: bool, filters: dict):
+        self.events_calls.append({"decode": decode, "filters": filters})
+        return self.stream
+
+
+def _container(container_id: str, names: str, ipv4: str) -> FakeContainer:
+    labels = {"citm_network": "net1", "citm_dns_names": names}
+    return FakeContainer(
+        id=container_id,
+        labels=labels,
+        attrs={
+            "Labels": labels,
+            "NetworkSettings": {
+                "Networks": {"net1": {"IPAddress": ipv4, "GlobalIPv6Address": ""}}
+            },
+        },
+    )
+
+
+def _container_event(action: str, container_id: str) -> dict:
+    return {"Type": "container", "Action": action, "Actor": {"ID": container_id}}
+
+
+def _network_event(action: str, container_id: str) -> dict:
+    return {
+        "Type": "network",
+        "Action": action,
+        "Actor": {
+            "ID": "network-id",
+            "Attributes": {"container": container_id, "name": "net1"},
+        },
+    }
+
+
+def test_registry_resync_publishes_immutable_snapshot_with_static_records():
+    docker_client = FakeDockerClient([_container("1", "api.local", "10.0.0.2")])
+    registry = DiscoveryRegistry(
+        docker_client,
+        network_name="net1",
+        static_records={"citm.internal": DnsRecordSet(ipv4=("127.0.0.1",), ipv6=())},
+    )
+
+    registry.resync()
+    snapshot = registry.snapshot
+
+    assert snapshot.records["api.local"].ipv4 == ("10.0.0.2",)
+    assert snapshot.records["citm.internal"].ipv4 == ("127.0.0.1",)
+    assert snapshot.match("v1.API.local.") == "api.local"
+    assert snapshot.match("citm.internal") == "citm.internal"
+    with pytest.raises(TypeError):
+        snapshot.records["other.local"] = DnsRecordSet(ipv4=(), ipv6=())
+
+
+def test_snapshot_reverse_index_maps_addresses_to_names():
+    snapshot = DiscoverySnapshot.build(
+        {
+            "api.local": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=("fd00::2",)),
+            "alt-api.local": DnsRecordSet(ipv4=("10.0.0.2",), ipv6=()),
+            "*.wild.local": DnsRecordSet(ipv4=("10.0.0.9",), ipv6=()),
+        },
+        version=1,
+    )
+
+    assert snapshot.reverse_index["2.0.0.10.in-addr.arpa"] == (
+        "alt-api.local",
+        "api.local",
+    )
+    assert snapshot.reverse_index[ipaddress.ip_address("fd00::2").reverse_pointer] == (
+        "api.local",
+    )
+    assert "9.0.0.10.in-addr.arpa" not in snapshot.reverse_index
+
+
+def test_registry_applies_container_and_network_events_incrementally():
+    docker_client = FakeDockerClient([_container("1", "api.local", "10.0.0.2")])
+    registry = DiscoveryRegistry(docker_client, network_name="net1")
+    registry.resync()
+    before = registry.snapshot
+
+    docker_client.containers.by_id["2"] = _container("2", "api.local", "10.0.0.3")
+    registry.apply_event(_container_event("start", "2"))
+    assert registry.snapshot.records["api.local"].ipv4 == ("10.0.0.2", "10.0.0.3")
+    assert before.records["api.local"].ipv4 == ("10.0.0.2",)
+
+    docker_client.containers.by_id["2"].attrs["NetworkSettings"]["Networks"] = {}
+    registry.apply_event(_network_event("disconnect", "2"))
+    assert registry.snapshot.records["api.local"].ipv4 == ("10.0.0.2",)
+
+    registry.apply_event(_container_event("die", "1"))
+    assert "api.local" not in registry.snapshot.records
+    assert docker_client.containers.list_calls == 1
+
+
+def test_registry_drops_unhealthy_replicas_on_health_status_events():
+    docker_client = FakeDockerClient(
+        [
+            _container("1", "api.local", "10.0.0.2"),
+            _container("2", "api.local", "10.0.0.3"),
+        ]
+    )
+    registry = DiscoveryRegistry(docker_client, network_name="net1")
+    registry.resync()
+
+    docker_client.containers.by_id["2"].attrs["State"] = {
+        "Health": {"Status": "unhealthy"}
+    }
+    registry.apply_event(_container_event("health_status: unhealthy", "2"))
+    assert registry.snapshot.records["api.local"].ipv4 == ("10.0.0.2",)
+
+    docker_client.containers.by_id["2"].attrs["State"]["Health"]["Status"] = "healthy"
+    registry.apply_event(_container_event("health_status: healthy", "2"))
+    assert registry.snapshot.records["api.local"].ipv4 == ("10.0.0.2", "10.0.0.3")
+
+
+def test_registry_ignores_events_that_do_not_change_records():
+    docker_client = FakeDockerClient([_container("1", "api.local", "10.0.0.2")])
+    registry = DiscoveryRegistry(docker_client, network_name="net1")
+    registry.resync()
+    version = registry.snapshot.version
+
+    registry.apply_event(_network_event("connect", "1"))
+    registry.apply_event(_container_event("die", "unknown"))
+    registry.apply_event(_container_event("pause", "1"))
+
+    assert registry.snapshot.version == version
+
+
+def test_registry_hands_every_published_snapshot_to_on_publish():
+    docker_client = FakeDockerClient([_container("1", "api.local", "10.0.0.2")])
+    published = []
+    registry = DiscoveryRegistry(
+        docker_client, network_name="net1", on_publish=published.append
+    )
+
+    registry.resync()
+    registry.apply_event(_container_event("die", "1"))
+
+    assert [snapshot.version for snapshot in published] == [1, 2, 3]
+    assert published[-1] is registry.snapshot
+
+
+def test_registry_start_bootstraps_and_follows_event_stream():
+    docker_client = FakeDockerClient([_container("1", "api.local", "10.0.0.2")])
+    registry = DiscoveryRegistry(docker_client, network_name="net1")
+
+    registry.start()
+    try:
+        assert registry.snapshot.records["api.local"].ipv4 == ("10.0.0.2",)
+        assert docker_client.events_calls == [
+            {"decode": True, "filters": EVENT_FILTERS}
+        ]
+
+        docker_client.containers.by_id["2"] = _container("2", "web.local", "10.0.0.3")
+        docker_client.stream.put(_container_event("start", "2"))
+        deadline = time.monotonic() + 2
+        while "web.local" not in registry.snapshot.records:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        registry.stop()
+
+    assert docker_client.stream.closed
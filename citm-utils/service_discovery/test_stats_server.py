@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from service_discovery.stats_server import StatsServer
+
+
+async def _http_get(port: int, target: str, *, method: str = "GET") -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b"\r\n\r\n", 1)
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_stats_server_serves_json_routes():
+    async def scenario():
+        server = StatsServer(
+            {"/upstreams": lambda: {"nameservers": []}}, host="127.0.0.1", port=0
+        )
+        await server.start()
+        try:
+            return [
+                await _http_get(server.port, "/upstreams?pretty=1"),
+                await _http_get(server.port, "/missing"),
+                await _http_get(server.port, "/upstreams", method="POST"),
+            ]
+        finally:
+            await server.close()
+
+    ok, missing, post = asyncio.run(scenario())
+
+    assert ok == (200, {"nameservers": []})
+    assert missing[0] == 404
+    assert post[0] == 405
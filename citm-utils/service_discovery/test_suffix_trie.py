@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+from service_discovery.suffix_trie import SuffixTrie
+
+
+def test_suffix_trie_returns_longest_matching_suffix():
+    trie = SuffixTrie(["b", "a.b", "x.a.b"])
+
+    assert trie.longest_match("z.x.a.b") == "x.a.b"
+    assert trie.longest_match("y.a.b") == "a.b"
+    assert trie.longest_match("b") == "b"
+
+
+def test_suffix_trie_matches_only_on_label_boundaries():
+    trie = SuffixTrie(["a.b"])
+
+    assert trie.longest_match("xa.b") is None
+    assert trie.longest_match("a.bb") is None
+    assert trie.longest_match("b") is None
+
+
+def test_suffix_trie_normalizes_names_and_queries():
+    trie = SuffixTrie(["API.Local.", " ", "api.local"])
+
+    assert len(trie) == 1
+    assert trie.longest_match("V1.api.LOCAL.") == "api.local"
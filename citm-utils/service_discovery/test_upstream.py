@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+
+from dnslib import A, DNSRecord, QTYPE, RCODE, RR
+
+from service_discovery.upstream import (
+    DEFAULT_UDP_POOL_SIZE,
+    UPSTREAM_STRATEGY_RACE,
+    UPSTREAM_STRATEGY_SEQUENTIAL,
+    UpstreamHealth,
+    UdpUpstream,
+    UpstreamResolver,
+    _PendingQueries,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeNameserver(asyncio.DatagramProtocol):
+    def __init__(
+        self,
+        host: str,
+        *,
+        delay: float = 0.0,
+        drop: bool = False,
+        truncate: bool = False,
+        rcode: int = RCODE.NOERROR,
+    ):
+        self.host = host
+        self.delay = delay
+        self.drop = drop
+        self.truncate = truncate
+        self.rcode = rcode
+        self.udp_peers: set[tuple] = set()
+        self.tcp_connections = 0
+        self.queries: list[tuple[str, str]] = []
+        self._transport: asyncio.DatagramTransport | None = None
+        self._tcp_server: asyncio.Server | None = None
+
+    async def start(self, port: int = 0) -> int:
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: self, local_addr=(self.host, port)
+        )
+        port = self._transport.get_extra_info("sockname")[1]
+        self._tcp_server = await asyncio.start_server(self._serve_tcp, self.host, port)
+        return port
+
+    def close(self) -> None:
+        self._transport.close()
+        self._tcp_server.close()
+
+    def _answer(self, request_bytes: bytes, *, via_tcp: bool) -> bytes:
+        request = DNSRecord.parse(request_bytes)
+        self.queries.append(("tcp" if via_tcp else "udp", str(request.q.qname)))
+        reply = request.reply()
+        reply.header.rcode = self.rcode
+        if self.truncate and not via_tcp:
+            reply.header.tc = 1
+        else:
+            reply.add_answer(RR(request.q.qname, QTYPE.A, ttl=60, rdata=A("192.0.2.1")))
+        return reply.pack()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.udp_peers.add(addr)
+        if self.drop:
+            return
+        response = self._answer(data, via_tcp=False)
+        asyncio.get_running_loop().call_later(
+            self.delay, self._transport.sendto, response, addr
+        )
+
+    async def _serve_tcp(self, reader, writer) -> None:
+        self.tcp_connections += 1
+        pending = set()
+        try:
+            while True:
+                request_len = int.from_bytes(await reader.readexactly(2), "big")
+                request_bytes = await reader.readexactly(request_len)
+                response = self._answer(request_bytes, via_tcp=True)
+                task = asyncio.create_task(self._reply_tcp(writer, response))
+                pending.add(task)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await asyncio.gather(*pending)
+            writer.close()
+
+    async def _reply_tcp(self, writer, response: bytes) -> None:
+        await asyncio.sleep(self.delay)
+        writer.write(len(response).to_bytes(2, "big") + response)
+
+
+def _run(nameservers, scenario):
+    async def main():
+        port = await nameservers[0].start()
+        for nameserver in nameservers[1:]:
+            await nameserver.start(port)
+        try:
+            return await scenario(port)
+        finally:
+            for nameserver in nameservers:
+                nameserver.close()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_queries_share_a_small_socket_pool_and_connections():
+    nameserver = FakeNameserver("127.0.0.1", delay=0.01)
+
+    async def scenario(port):
+        resolver = UpstreamResolver(["127.0.0.1"], deadline_seconds=2.0, port=port)
+        requests = [
+            DNSRecord.question(f"host-{index}.example.com") for index in range(20)
+        ]
+        for request in requests:
+            request.header.id = 7
+        try:
+            udp = await asyncio.gather(
+                *(resolver.resolve(r.pack(), via_tcp=False) for r in requests)
+            )
+            tcp = await asyncio.gather(
+                *(resolver.resolve(r.pack(), via_tcp=True) for r in requests)
+            )
+        finally:
+            resolver.close()
+        return requests, udp + tcp
+
+    requests, responses = _run([nameserver], scenario)
+
+    names = [str(r.q.qname) for r in requests] * 2
+    parsed = [DNSRecord.parse(response) for response in responses]
+    assert [str(response.q.qname) for response in parsed] == names
+    assert all(response.header.id == 7 for response in parsed)
+    assert 1 < len(nameserver.udp_peers) <= DEFAULT_UDP_POOL_SIZE
+    assert nameserver.tcp_connections <= 2
+
+
+def test_udp_sockets_are_reopened_on_new_source_ports():
+    nameserver = FakeNameserver("127.0.0.1")
+
+    async def scenario(port):
+        upstream = UdpUpstream("127.0.0.1", port, pool_size=1, max_queries_per_socket=2)
+        try:
+            for index in range(6):
+                await upstream.query(
+                    DNSRecord.question(f"host-{index}.example.com").pack()
+                )
+        finally:
+            upstream.close()
+
+    _run([nameserver], scenario)
+
+    assert len(nameserver.queries) == 6
+    assert len(nameserver.udp_peers) == 3
+
+
+def test_truncated_udp_answer_is_retried_over_tcp():
+    nameserver = FakeNameserver("127.0.0.1", truncate=True)
+
+    async def scenario(port):
+        resolver = UpstreamResolver(["127.0.0.1"], deadline_seconds=2.0, port=port)
+        try:
+            return await resolver.resolve(
+                DNSRecord.question("large.example.com").pack(), via_tcp=False
+            )
+        finally:
+            resolver.close()
+
+    response = DNSRecord.parse(_run([nameserver], scenario))
+
+    assert response.header.tc == 0
+    assert [transport for transport, _name in nameserver.queries] == ["udp", "tcp"]
+
+
+def test_race_takes_answer_from_second_nameserver_when_first_is_silent():
+    silent = FakeNameserver("127.0.0.1", drop=True)
+    healthy = FakeNameserver("127.0.0.2")
+
+    async def scenario(port):
+        resolver = UpstreamResolver(
+            ["127.0.0.1", "127.0.0.2"],
+            deadline_seconds=2.0,
+            port=port,
+            strategy=UPSTREAM_STRATEGY_RACE,
+            race_delay_seconds=0.05,
+        )
+        started = time.perf_counter()
+        try:
+            response = await resolver.resolve(
+                DNSRecord.question("example.com").pack(), via_tcp=False
+            )
+        finally:
+            resolver.close()
+        return response, time.perf_counter() - started, resolver
+
+    response, elapsed, resolver = _run([silent, healthy], scenario)
+
+    assert response is not None
+    assert elapsed < 1.0
+    assert healthy.queries == [("udp", "example.com.")]
+    assert resolver.ordered_nameservers() == ["127.0.0.2", "127.0.0.1"]
+
+
+def test_failed_answers_fall_back_to_last_response_or_none():
+    refusing = FakeNameserver("127.0.0.1", rcode=RCODE.SERVFAIL)
+    silent = FakeNameserver("127.0.0.2", drop=True)
+
+    async def scenario(port):
+        results = []
+        for strategy in (UPSTREAM_STRATEGY_SEQUENTIAL, UPSTREAM_STRATEGY_RACE):
+            for nameservers in (["127.0.0.1", "127.0.0.2"], ["127.0.0.2"]):
+                resolver = UpstreamResolver(
+                    nameservers, deadline_seconds=0.1, port=port, strategy=strategy
+                )
+                try:
+                    results.append(
+                        await resolver.resolve(
+                            DNSRecord.question("example.com").pack(), via_tcp=False
+                        )
+                    )
+                finally:
+                    resolver.close()
+        return results
+
+    results = _run([refusing, silent], scenario)
+
+    assert [
+        None if r is None else DNSRecord.parse(r).header.rcode for r in results
+    ] == [
+        RCODE.SERVFAIL,
+        None,
+        RCODE.SERVFAIL,
+        None,
+    ]
+
+
+def test_sequential_attempts_share_one_deadline_budget():
+    silent = FakeNameserver("127.0.0.1", drop=True)
+    also_silent = FakeNameserver("127.0.0.2", drop=True)
+
+    async def scenario(port):
+        resolver = UpstreamResolver(
+            ["127.0.0.1", "127.0.0.2"],
+            deadline_seconds=0.3,
+            port=port,
+            strategy=UPSTREAM_STRATEGY_SEQUENTIAL,
+        )
+        started = time.perf_counter()
+        try:
+            response = await resolver.resolve(
+                DNSRecord.question("example.com").pack(), via_tcp=False
+            )
+        finally:
+            resolver.close()
+        return response, time.perf_counter() - started, resolver.stats()
+
+    response, elapsed, stats = _run([silent, also_silent], scenario)
+
+    assert response is None
+    assert elapsed < 0.6
+    assert [ns["failures"] for ns in stats["nameservers"]] == [1, 1]
+
+
+def test_health_opens_circuit_after_repeated_failures_with_growing_backoff():
+    clock = FakeClock()
+    health = UpstreamHealth("192.0.2.53", clock=clock)
+    for _ in range(3):
+        health.record_failure()
+    assert health.circuit_open
+    clock.now += 1.0
+    assert not health.circuit_open
+
+    health.record_failure()
+    clock.now += 1.5
+    assert health.circuit_open
+
+    health.record_success(0.02)
+    assert not health.circuit_open
+    assert health.stats()["consecutive_failures"] == 0
+    assert health.stats()["failures"] == 4
+    assert health.stats()["rtt"]["count"] == 1
+
+
+def test_ordering_prefers_low_srtt_and_skips_open_circuits():
+    clock = FakeClock()
+    resolver = UpstreamResolver(
+        ["10.0.0.1", "10.0.0.2", "10.0.0.3"], deadline_seconds=2.0, clock=clock
+    )
+    resolver.health["10.0.0.1"].record_success(0.4)
+    resolver.health["10.0.0.2"].record_success(0.01)
+    assert resolver.ordered_nameservers() == ["10.0.0.2", "10.0.0.1", "10.0.0.3"]
+
+    for _ in range(3):
+        resolver.health["10.0.0.2"].record_failure()
+    assert resolver.ordered_nameservers() == ["10.0.0.1", "10.0.0.3"]
+
+    for address in ("10.0.0.1", "10.0.0.3"):
+        for _ in range(4):
+            resolver.health[address].record_failure()
+    assert resolver.ordered_nameservers() == ["10.0.0.2", "10.0.0.1", "10.0.0.3"]
+
+
+def test_pending_queries_ignore_responses_for_other_questions():
+    async def scenario():
+        pending = _PendingQueries()
+        request = DNSRecord.question("example.com")
+        query_id, response, wire = pending.register(request.pack())
+        spoofed = DNSRecord.question("evil.example.com").reply()
+        spoofed.header.id = query_id
+        pending.resolve(spoofed.pack())
+        assert not response.done()
+
+        reply = DNSRecord.parse(wire).reply()
+        pending.resolve(reply.pack())
+        return await response, len(pending)
+
+    response, remaining = asyncio.run(scenario())
+
+    assert DNSRecord.parse(response).q.qname == "example.com"
+    assert remaining == 0
+
+
+def test_pending_query_ids_do_not_follow_the_random_module_seed():
+    async def register_ids():
+        pending = _PendingQueries()
+        return [
+            pending.register(DNSRecord.question(f"{index}.example.com").pack())[0]
+            for index in range(8)
+        ]
+
+    random.seed(0)
+    ids = asyncio.run(register_ids())
+    random.seed(0)
+
+    assert ids != [random.getrandbits(16) for _ in ids]
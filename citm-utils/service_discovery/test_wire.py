@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from dnslib import A, EDNS0, DNSRecord, QTYPE, RR
+
+from service_discovery.answer_order import ordered_record_set
+from service_discovery.discovery import DnsRecordSet
+from service_discovery.dns_forwarder import build_local_response
+from service_discovery.wire import (
+    EDNS_UDP_PAYLOAD_SIZE,
+    advertise_udp_payload_size,
+    local_answer,
+    packed_answers,
+    parse_query,
+    response_for_client,
+)
+
+RECORD_SET = DnsRecordSet(ipv4=("10.0.0.2", "10.0.0.3"), ipv6=("fd00::2",))
+
+
+def test_local_answer_matches_dnslib_reply_bytes():
+    requests = []
+    for qtype in ("A", "AAAA", "ANY"):
+        request = DNSRecord.question("Api.Example.Internal", qtype)
+        request.header.rd = 0
+        requests.append(request)
+    with_edns = DNSRecord.question("api.example.internal")
+    with_edns.add_ar(EDNS0(udp_len=1232))
+    requests.append(with_edns)
+
+    for request in requests:
+        query = parse_query(request.pack())
+        expected = build_local_response(request, record_set=RECORD_SET, ttl_seconds=30)
+
+        assert query.name == "api.example.internal"
+        assert (
+            local_answer(request.pack(), query, RECORD_SET, ttl_seconds=30)
+            == expected.pack()
+        )
+
+
+def test_local_answer_reorders_packed_records_without_new_record_sets():
+    record_set = DnsRecordSet(
+        ipv4=("10.0.0.2", "10.0.0.3", "10.0.0.4"), ipv6=("fd00::2", "fd00::3")
+    )
+    packed_answers.cache_clear()
+
+    for qtype in ("A", "AAAA", "ANY"):
+        request = DNSRecord.question("api.example.internal", qtype)
+        query = parse_query(request.pack())
+        for address_order in (((2, 0, 1), (1, 0)), ((1, 2, 0), None)):
+            expected = build_local_response(
+                request,
+                record_set=ordered_record_set(record_set, address_order),
+                ttl_seconds=30,
+            )
+
+            assert (
+                local_answer(
+                    request.pack(),
+                    query,
+                    record_set,
+                    ttl_seconds=30,
+                    address_order=address_order,
+                )
+                == expected.pack()
+            )
+
+    assert packed_answers.cache_info().currsize == 3
+
+
+def test_parse_query_leaves_unusual_queries_to_dnslib():
+    plain = DNSRecord.question("api.example.internal")
+    chaos = DNSRecord.question("version.bind", "TXT", "CH")
+    two_questions = DNSRecord.question("a.example.internal")
+    two_questions.add_question(*DNSRecord.question("b.example.internal").questions)
+    response = plain.reply()
+    dotted_label = plain.pack().replace(b"\x03api", b"\x03a.i")
+    trailing_garbage = plain.pack() + b"\x00"
+
+    assert parse_query(plain.pack()).qtype == QTYPE.A
+    for data in (
+        chaos.pack(),
+        two_questions.pack(),
+        response.pack(),
+        dotted_label,
+        trailing_garbage,
+        plain.pack()[:-2],
+        b"\x00" * 5,
+    ):
+        assert parse_query(data) is None
+
+
+def _large_answer(request: DNSRecord) -> bytes:
+    reply = request.reply()
+    for index in range(60):
+        reply.add_answer(RR(request.q.qname, QTYPE.A, rdata=A(f"10.0.1.{index}")))
+    if request.ar:
+        reply.add_ar(EDNS0(udp_len=4096))
+    return reply.pack()
+
+
+def test_upstream_queries_advertise_edns_payload_size():
+    plain = DNSRecord.question("example.com")
+    small = DNSRecord.question("example.com")
+    small.add_ar(EDNS0(udp_len=512, flags="do"))
+    large = DNSRecord.question("example.com")
+    large.add_ar(EDNS0(udp_len=4096))
+
+    advertised = [
+        DNSRecord.parse(advertise_udp_payload_size(request.pack()))
+        for request in (plain, small, large)
+    ]
+
+    assert [request.ar[0].edns_len for request in advertised] == [
+        EDNS_UDP_PAYLOAD_SIZE,
+        EDNS_UDP_PAYLOAD_SIZE,
+        4096,
+    ]
+    assert advertised[1].ar[0].edns_do
+    assert advertised[0].q == plain.q
+
+
+def test_responses_fit_the_client_payload_size():
+    plain = DNSRecord.question("example.com")
+    edns = DNSRecord.question("example.com")
+    edns.add_ar(EDNS0(udp_len=1232))
+    response = _large_answer(edns)
+    assert 512 < len(response) <= 1232
+
+    for_edns = DNSRecord.parse(
+        response_for_client(response, edns.pack(), via_tcp=False)
+    )
+    for_plain_udp = DNSRecord.parse(
+        response_for_client(response, plain.pack(), via_tcp=False)
+    )
+    for_plain_tcp = DNSRecord.parse(
+        response_for_client(response, plain.pack(), via_tcp=True)
+    )
+
+    assert (for_edns.header.tc, len(for_edns.rr), len(for_edns.ar)) == (0, 60, 1)
+    assert (for_plain_udp.header.tc, for_plain_udp.rr, for_plain_udp.ar) == (1, [], [])
+    assert for_plain_udp.q == plain.q
+    assert (len(for_plain_tcp.rr), for_plain_tcp.ar) == (60, [])
+
+
+def test_local_answer_is_truncated_beyond_client_payload_size():
+    record_set = DnsRecordSet(
+        ipv4=tuple(f"10.0.1.{index}" for index in range(60)), ipv6=()
+    )
+    plain = DNSRecord.question("api.example.internal")
+    edns = DNSRecord.question("api.example.internal")
+    edns.add_ar(EDNS0(udp_len=1232))
+
+    truncated = DNSRecord.parse(
+        local_answer(
+            plain.pack(),
+            parse_query(plain.pack()),
+            record_set,
+            ttl_seconds=30,
+            max_size=512,
+        )
+    )
+    complete = DNSRecord.parse(
+        local_answer(
+            edns.pack(),
+            parse_query(edns.pack()),
+            record_set,
+            ttl_seconds=30,
+            max_size=1232,
+        )
+    )
+
+    assert (truncated.header.tc, truncated.rr) == (1, [])
+    assert (complete.header.tc, len(complete.rr)) == (0, 60)
+    assert complete.ar[0].edns_len == EDNS_UDP_PAYLOAD_SIZE
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import os
+import socket
+import time
+
+import service_discovery.workers as workers
+from service_discovery.discovery import DnsRecordSet, SrvRecord
+from service_discovery.registry import DiscoverySnapshot
+from service_discovery.workers import (
+    SnapshotPublisher,
+    SnapshotSubscriber,
+    WorkerPool,
+    decode_snapshot,
+    encode_snapshot,
+)
+
+
+def _snapshot(ipv4: str, *, version: int) -> DiscoverySnapshot:
+    return DiscoverySnapshot.build(
+        {
+            "api.local": DnsRecordSet(
+                ipv4=(ipv4,),
+                ipv6=("fd00::2",),
+                srv=(SrvRecord("http", "tcp", 80),),
+                weights=((ipv4, 2),),
+            )
+        },
+        version=version,
+    )
+
+
+def test_snapshot_frames_round_trip():
+    frame = encode_snapshot(_snapshot("10.0.0.2", version=7))
+    snapshot = decode_snapshot(frame[workers.FRAME_HEADER_SIZE :])
+
+    assert int.from_bytes(frame[: workers.FRAME_HEADER_SIZE], "big") == len(frame) - 4
+    assert snapshot.version == 7
+    assert snapshot.records["api.local"] == DnsRecordSet(
+        ipv4=("10.0.0.2",),
+        ipv6=("fd00::2",),
+        srv=(SrvRecord("http", "tcp", 80),),
+        weights=(("10.0.0.2", 2),),
+    )
+    assert snapshot.reverse_index["2.0.0.10.in-addr.arpa"] == ("api.local",)
+    assert snapshot.match("v1.api.local") == "api.local"
+
+
+def test_subscriber_follows_publisher_and_reconnects(tmp_path, monkeypatch):
+    monkeypatch.setattr(workers, "FEED_RECONNECT_DELAY_SECONDS", 0.01)
+    path = str(tmp_path / "feed.sock")
+    subscriber = SnapshotSubscriber(path)
+    subscriber.start()
+    publisher = SnapshotPublisher(path)
+    try:
+        publisher.publish(_snapshot("10.0.0.2", version=1))
+        publisher.start()
+        assert subscriber.wait_for_snapshot(timeout=5)
+        assert subscriber.snapshot.records["api.local"].ipv4 == ("10.0.0.2",)
+
+        publisher.publish(_snapshot("10.0.0.3", version=2))
+        deadline = time.monotonic() + 5
+        while subscriber.snapshot.version != 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert subscriber.snapshot.records["api.local"].ipv4 == ("10.0.0.3",)
+    finally:
+        subscriber.stop()
+        publisher.stop()
+
+    assert not os.path.exists(path)
+
+
+def test_worker_pool_restarts_exited_workers():
+    pool = WorkerPool(2, os._exit)
+    pool.start()
+    try:
+        for process in pool._processes.values():
+            process.join(10)
+        pool.check()
+    finally:
+        pool.stop()
+
+    assert pool.restarts == 2
+
+
+def test_worker_pool_backs_off_workers_that_keep_exiting(capsys):
+    now = [0.0]
+    pool = WorkerPool(1, os._exit, clock=lambda: now[0])
+
+    def exit_and_check(seconds_later: float = 0.0) -> int:
+        pool._processes[0].join(10)
+        now[0] += seconds_later
+        pool.check()
+        return pool.restarts
+
+    pool.start()
+    try:
+        assert exit_and_check() == 1
+        assert exit_and_check() == 1
+        assert exit_and_check(1.0) == 2
+        assert exit_and_check() == 2
+        assert exit_and_check(1.0) == 2
+        assert exit_and_check(1.0) == 3
+        assert exit_and_check() == 3
+    finally:
+        pool.stop()
+
+    log = capsys.readouterr().out
+    assert [line.rsplit(" ", 1)[1] for line in log.splitlines()] == [
+        "0s.",
+        "1s.",
+        "2s.",
+        "4s.",
+    ]
+
+
+def _large_snapshot(version: int) -> DiscoverySnapshot:
+    return DiscoverySnapshot.build(
+        {
+            f"svc-{index}.local": DnsRecordSet(
+                ipv4=(f"10.0.{index // 250}.{index % 250}",), ipv6=()
+            )
+            for index in range(2000)
+        },
+        version=version,
+    )
+
+
+def test_publisher_drops_frames_for_a_stalled_subscriber(tmp_path):
+    path = str(tmp_path / "feed.sock")
+    publisher = SnapshotPublisher(path)
+    publisher.start()
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stalled.connect(path)
+    subscriber = SnapshotSubscriber(path)
+    subscriber.start()
+    try:
+        started = time.monotonic()
+        for version in range(1, 31):
+            publisher.publish(_large_snapshot(version))
+        assert time.monotonic() - started < 5
+
+        deadline = time.monotonic() + 5
+        while subscriber.snapshot.version != 30 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert subscriber.snapshot.version == 30
+
+        versions = []
+        stalled.settimeout(5)
+        with stalled.makefile("rb") as reader:
+            while not versions or versions[-1] != 30:
+                header = reader.read(workers.FRAME_HEADER_SIZE)
+                payload = reader.read(int.from_bytes(header, "big"))
+                versions.append(decode_snapshot(payload).version)
+        assert len(versions) < 30
+    finally:
+        stalled.close()
+        subscriber.stop()
+        publisher.stop()
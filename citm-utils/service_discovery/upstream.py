@@ -0,0 +1,534 @@
+import asyncio
+import ipaddress
+import secrets
+import socket
+import time
+from collections.abc import Callable
+
+from dnslib import RCODE
+
+from .metrics import LatencyHistogram
+from .wire import DNS_HEADER_SIZE, question_end
+
+DNS_PORT = 53
+DEFAULT_TCP_POOL_SIZE = 2
+DEFAULT_UDP_POOL_SIZE = 4
+UDP_SOCKET_MAX_QUERIES = 64
+DEFAULT_RACE_DELAY_SECONDS = 0.2
+INITIAL_ATTEMPT_TIMEOUT_SECONDS = 1.0
+MIN_ATTEMPT_TIMEOUT_SECONDS = 0.1
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_BACKOFF_SECONDS = 1.0
+MAX_CIRCUIT_BACKOFF_SECONDS = 30.0
+
+UPSTREAM_STRATEGY_RACE = "race"
+UPSTREAM_STRATEGY_SEQUENTIAL = "sequential"
+UPSTREAM_STRATEGIES = (UPSTREAM_STRATEGY_RACE, UPSTREAM_STRATEGY_SEQUENTIAL)
+DEFAULT_UPSTREAM_STRATEGY = UPSTREAM_STRATEGY_RACE
+
+FAILED_RCODES = frozenset({RCODE.SERVFAIL, RCODE.REFUSED})
+TRUNCATED_FLAG = 0x02
+
+
+def address_family(address: str) -> socket.AddressFamily:
+    return (
+        socket.AF_INET6
+        if ipaddress.ip_address(address).version == 6
+        else socket.AF_INET
+    )
+
+
+def _is_truncated(response: bytes) -> bool:
+    return len(response) > 2 and bool(response[2] & TRUNCATED_FLAG)
+
+
+def is_failed_response(response: bytes) -> bool:
+    return len(response) < DNS_HEADER_SIZE or (response[3] & 0xF) in FAILED_RCODES
+
+
+def _question(message: bytes) -> bytes:
+    return message[DNS_HEADER_SIZE : question_end(message)].lower()
+
+
+class _PendingQueries:
+    def __init__(self):
+        self._queries: dict[int, tuple[asyncio.Future[bytes], bytes]] = {}
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def register(
+        self, request_bytes: bytes
+    ) -> tuple[int, asyncio.Future[bytes], bytes]:
+        query_id = secrets.randbits(16)
+        while query_id in self._queries:
+            query_id = secrets.randbits(16)
+        response = asyncio.get_running_loop().create_future()
+        self._queries[query_id] = (response, _question(request_bytes))
+        return query_id, response, query_id.to_bytes(2, "big") + request_bytes[2:]
+
+    def discard(self, query_id: int) -> None:
+        self._queries.pop(query_id, None)
+
+    def resolve(self, response_bytes: bytes) -> None:
+        if len(response_bytes) < DNS_HEADER_SIZE:
+            return
+        query_id = int.from_bytes(response_bytes[:2], "big")
+        pending = self._queries.get(query_id)
+        if pending is None:
+            return
+        response, question = pending
+        try:
+            if _question(response_bytes) != question:
+                return
+        except IndexError:
+            return
+        del self._queries[query_id]
+        if not response.done():
+            response.set_result(response_bytes)
+
+    def fail_all(self, exc: Exception) -> None:
+        for response, _question_bytes in self._queries.values():
+            if not response.done():
+                response.set_exception(exc)
+        self._queries.clear()
+
+
+async def _query_pending(
+    pending: _PendingQueries, request_bytes: bytes, send: Callable[[bytes], None]
+) -> bytes:
+    query_id, response, wire = pending.register(request_bytes)
+    try:
+        send(wire)
+        return request_bytes[:2] + (await response)[2:]
+    finally:
+        pending.discard(query_id)
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, udp_socket: "_UdpSocket"):
+        self._socket = udp_socket
+
+    def datagram_received(self, data: bytes, _addr: object) -> None:
+        self._socket.pending.resolve(data)
+
+    def error_received(self, exc: Exception) -> None:
+        self._socket.pending.fail_all(exc)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._socket.reset(exc or ConnectionError("Upstream UDP socket closed"))
+
+
+class _UdpSocket:
+    def __init__(self, address: str, port: int):
+        self.pending = _PendingQueries()
+        self.queries = 0
+        self.closed = False
+        self._retired = False
+        self._connecting = asyncio.get_running_loop().create_task(
+            self._connect(address, port)
+        )
+
+    async def _connect(self, address: str, port: int) -> asyncio.DatagramTransport:
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _UdpProtocol(self),
+            remote_addr=(address, port),
+            family=address_family(address),
+        )
+        return transport
+
+    def reset(self, exc: Exception) -> None:
+        self.closed = True
+        self.pending.fail_all(exc)
+
+    async def query(self, request_bytes: bytes) -> bytes:
+        self.queries += 1
+        try:
+            transport = await asyncio.shield(self._connecting)
+        except Exception:
+            self.closed = True
+            raise
+        try:
+            return await _query_pending(self.pending, request_bytes, transport.sendto)
+        finally:
+            if self._retired and not self.pending:
+                self.close()
+
+    def retire(self) -> None:
+        self._retired = True
+        if not self.pending:
+            self.close()
+
+    def close(self) -> None:
+        self.closed = True
+        if not self._connecting.done():
+            self._connecting.cancel()
+        elif not self._connecting.cancelled() and self._connecting.exception() is None:
+            self._connecting.result().close()
+
+
+class UdpUpstream:
+    def __init__(
+        self,
+        address: str,
+        port: int = DNS_PORT,
+        *,
+        pool_size: int = DEFAULT_UDP_POOL_SIZE,
+        max_queries_per_socket: int = UDP_SOCKET_MAX_QUERIES,
+    ):
+        self._address = address
+        self._port = port
+        self._max_queries_per_socket = max_queries_per_socket
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._sockets: list[_UdpSocket | None] = [None] * pool_size
+
+    def _socket(self) -> _UdpSocket:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._sockets = [None] * len(self._sockets)
+        index = secrets.randbelow(len(self._sockets))
+        udp_socket = self._sockets[index]
+        if (
+            udp_socket is None
+            or udp_socket.closed
+            or udp_socket.queries >= self._max_queries_per_socket
+        ):
+            if udp_socket is not None:
+                udp_socket.retire()
+            udp_socket = self._sockets[index] = _UdpSocket(self._address, self._port)
+        return udp_socket
+
+    async def query(self, request_bytes: bytes) -> bytes:
+        return await self._socket().query(request_bytes)
+
+    def close(self) -> None:
+        for udp_socket in self._sockets:
+            if udp_socket is not None:
+                udp_socket.close()
+        self._sockets = [None] * len(self._sockets)
+
+
+class _TcpConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.pending = _PendingQueries()
+        self.closed = False
+        self._writer = writer
+        self._reader_task = asyncio.create_task(self._read_responses(reader))
+
+    async def _read_responses(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                response_len = int.from_bytes(await reader.readexactly(2), "big")
+                self.pending.resolve(await reader.readexactly(response_len))
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            self.closed = True
+            self.pending.fail_all(ConnectionError("Upstream TCP connection closed"))
+            self._writer.close()
+
+    def _send(self, wire: bytes) -> None:
+        self._writer.write(len(wire).to_bytes(2, "big") + wire)
+
+    async def query(self, request_bytes: bytes) -> bytes:
+        if self.closed:
+            raise ConnectionError("Upstream TCP connection closed")
+        return await _query_pending(self.pending, request_bytes, self._send)
+
+    def close(self) -> None:
+        self._reader_task.cancel()
+
+
+class TcpUpstream:
+    def __init__(
+        self,
+        address: str,
+        port: int = DNS_PORT,
+        *,
+        pool_size: int = DEFAULT_TCP_POOL_SIZE,
+    ):
+        self._address = address
+        self._port = port
+        self._pool_size = pool_size
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._connections: list[asyncio.Task[_TcpConnection]] = []
+
+    async def _connect(self) -> _TcpConnection:
+        reader, writer = await asyncio.open_connection(self._address, self._port)
+        return _TcpConnection(reader, writer)
+
+    @staticmethod
+    def _is_usable(connecting: asyncio.Task[_TcpConnection]) -> bool:
+        if not connecting.done():
+            return True
+        return (
+            not connecting.cancelled()
+            and connecting.exception() is None
+            and not connecting.result().closed
+        )
+
+    @staticmethod
+    def _load(connecting: asyncio.Task[_TcpConnection]) -> int:
+        return len(connecting.result().pending) if connecting.done() else 1
+
+    def _connection(self) -> asyncio.Task[_TcpConnection]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._connections = []
+        self._connections = [c for c in self._connections if self._is_usable(c)]
+        if self._connections:
+            least_loaded = min(self._connections, key=self._load)
+            if self._load(least_loaded) == 0 or len(self._connections) >= (
+                self._pool_size
+            ):
+                return least_loaded
+        connecting = loop.create_task(self._connect())
+        self._connections.append(connecting)
+        return connecting
+
+    async def query(self, request_bytes: bytes) -> bytes:
+        connection = await asyncio.shield(self._connection())
+        try:
+            return await connection.query(request_bytes)
+        except ConnectionError:
+            connection = await asyncio.shield(self._connection())
+            return await connection.query(request_bytes)
+
+    def close(self) -> None:
+        for connecting in self._connections:
+            if not connecting.done():
+                connecting.cancel()
+            elif self._is_usable(connecting):
+                connecting.result().close()
+        self._connections = []
+
+
+class UpstreamHealth:
+    def __init__(self, address: str, *, clock: Callable[[], float] = time.monotonic):
+        self.address = address
+        self._clock = clock
+        self.srtt: float | None = None
+        self.rttvar = 0.0
+        self.queries = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.rtt = LatencyHistogram()
+
+    def record_rtt(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def record_success(self, rtt: float) -> None:
+        self.queries += 1
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.rtt.observe(rtt)
+        self.record_rtt(rtt)
+
+    def record_failure(self) -> None:
+        self.queries += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD:
+            doublings = self.consecutive_failures - CIRCUIT_FAILURE_THRESHOLD
+            backoff = CIRCUIT_BACKOFF_SECONDS * 2 ** min(doublings, 16)
+            self.open_until = self._clock() + min(backoff, MAX_CIRCUIT_BACKOFF_SECONDS)
+
+    @property
+    def circuit_open(self) -> bool:
+        return self._clock() < self.open_until
+
+    def attempt_timeout(self) -> float:
+        if self.srtt is None:
+            return INITIAL_ATTEMPT_TIMEOUT_SECONDS
+        return max(self.srtt + 4 * self.rttvar, MIN_ATTEMPT_TIMEOUT_SECONDS)
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "address": self.address,
+            "srtt_ms": None if self.srtt is None else round(self.srtt * 1000, 3),
+            "rttvar_ms": round(self.rttvar * 1000, 3),
+            "attempt_timeout_ms": round(self.attempt_timeout() * 1000, 3),
+            "queries": self.queries,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "circuit_open": self.circuit_open,
+            "retry_in_seconds": round(max(self.open_until - self._clock(), 0.0), 3),
+            "rtt": self.rtt.stats(),
+        }
+
+
+class UpstreamResolver:
+    def __init__(
+        self,
+        nameservers: list[str],
+        *,
+        deadline_seconds: float,
+        port: int = DNS_PORT,
+        strategy: str = DEFAULT_UPSTREAM_STRATEGY,
+        race_delay_seconds: float = DEFAULT_RACE_DELAY_SECONDS,
+        tcp_pool_size: int = DEFAULT_TCP_POOL_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._nameservers = list(nameservers)
+        self._deadline_seconds = deadline_seconds
+        self._strategy = strategy
+        self._race_delay_seconds = race_delay_seconds
+        self._clock = clock
+        self.health = {
+            address: UpstreamHealth(address, clock=clock) for address in nameservers
+        }
+        self._udp = {address: UdpUpstream(address, port) for address in nameservers}
+        self._tcp = {
+            address: TcpUpstream(address, port, pool_size=tcp_pool_size)
+            for address in nameservers
+        }
+
+    def ordered_nameservers(self) -> list[str]:
+        rank = {address: index for index, address in enumerate(self._nameservers)}
+
+        def score(address: str) -> tuple[float, int]:
+            srtt = self.health[address].srtt
+            return (
+                INITIAL_ATTEMPT_TIMEOUT_SECONDS if srtt is None else srtt,
+                rank[address],
+            )
+
+        closed = [a for a in self._nameservers if not self.health[a].circuit_open]
+        if closed:
+            return sorted(closed, key=score)
+        return sorted(self._nameservers, key=lambda a: self.health[a].open_until)
+
+    async def _query(
+        self, nameserver: str, request_bytes: bytes, *, via_tcp: bool
+    ) -> bytes:
+        if not via_tcp:
+            response = await self._udp[nameserver].query(request_bytes)
+            if not _is_truncated(response):
+                return response
+        return await self._tcp[nameserver].query(request_bytes)
+
+    async def exchange(
+        self,
+        nameserver: str,
+        request_bytes: bytes,
+        *,
+        via_tcp: bool,
+        timeout_seconds: float,
+    ) -> bytes:
+        health = self.health[nameserver]
+        started = self._clock()
+        try:
+            async with asyncio.timeout(timeout_seconds):
+                response = await self._query(nameserver, request_bytes, via_tcp=via_tcp)
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(self._clock() - started)
+        return response
+
+    async def _sequential(
+        self, request_bytes: bytes, *, via_tcp: bool, deadline: float
+    ) -> bytes | None:
+        fallback = None
+        nameservers = self.ordered_nameservers()
+        for index, nameserver in enumerate(nameservers):
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                break
+            timeout_seconds = remaining
+            if index < len(nameservers) - 1:
+                timeout_seconds = min(
+                    self.health[nameserver].attempt_timeout(),
+                    remaining / (len(nameservers) - index),
+                )
+            try:
+                response = await self.exchange(
+                    nameserver,
+                    request_bytes,
+                    via_tcp=via_tcp,
+                    timeout_seconds=timeout_seconds,
+                )
+            except Exception:
+                continue
+            if not is_failed_response(response):
+                return response
+            fallback = response
+        return fallback
+
+    async def _race(
+        self, request_bytes: bytes, *, via_tcp: bool, deadline: float
+    ) -> bytes | None:
+        fallback = None
+        nameservers = iter(self.ordered_nameservers())
+        running: dict[asyncio.Task[bytes], tuple[str, float]] = {}
+        try:
+            while True:
+                nameserver = next(nameservers, None)
+                remaining = deadline - self._clock()
+                if nameserver is not None and remaining > 0:
+                    task = asyncio.create_task(
+                        self.exchange(
+                            nameserver,
+                            request_bytes,
+                            via_tcp=via_tcp,
+                            timeout_seconds=remaining,
+                        )
+                    )
+                    running[task] = (nameserver, self._clock())
+                else:
+                    nameserver = None
+                if not running:
+                    return fallback
+                stagger = None
+                if nameserver is not None:
+                    stagger = min(
+                        self._race_delay_seconds,
+                        self.health[nameserver].attempt_timeout(),
+                    )
+                done, _pending = await asyncio.wait(
+                    running, timeout=stagger, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    del running[task]
+                    if task.exception() is not None:
+                        continue
+                    response = task.result()
+                    if not is_failed_response(response):
+                        return response
+                    fallback = response
+        finally:
+            now = self._clock()
+            for task, (nameserver, started) in running.items():
+                task.cancel()
+                health = self.health[nameserver]
+                if now - started > health.attempt_timeout():
+                    health.record_rtt(now - started)
+
+    async def resolve(self, request_bytes: bytes, *, via_tcp: bool) -> bytes | None:
+        deadline = self._clock() + self._deadline_seconds
+        if self._strategy == UPSTREAM_STRATEGY_RACE:
+            return await self._race(request_bytes, via_tcp=via_tcp, deadline=deadline)
+        return await self._sequential(request_bytes, via_tcp=via_tcp, deadline=deadline)
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "strategy": self._strategy,
+            "deadline_seconds": self._deadline_seconds,
+            "order": self.ordered_nameservers(),
+            "nameservers": [
+                self.health[address].stats() for address in self._nameservers
+            ],
+        }
+
+    def close(self) -> None:
+        for upstream in (*self._udp.values(), *self._tcp.values()):
+            upstream.close()
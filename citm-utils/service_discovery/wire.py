@@ -0,0 +1,252 @@
+import functools
+import ipaddress
+import struct
+from dataclasses import dataclass
+
+from dnslib import CLASS, QTYPE
+
+from .discovery import DnsRecordSet
+
+DNS_HEADER_SIZE = 12
+DNS_UDP_PAYLOAD_SIZE = 512
+EDNS_UDP_PAYLOAD_SIZE = 1232
+MAX_LABEL_LENGTH = 63
+PACKED_ANSWERS_CACHE_SIZE = 4096
+
+QR_FLAG = 0x8000
+OPCODE_MASK = 0x7800
+AA_FLAG = 0x0400
+TC_FLAG = 0x0200
+RA_FLAG = 0x0080
+QUESTION_NAME_POINTER = b"\xc0\x0c"
+OPT_RECORD = b"\x00" + struct.pack("!HHIH", QTYPE.OPT, EDNS_UDP_PAYLOAD_SIZE, 0, 0)
+A_RECORD_SIZE = len(QUESTION_NAME_POINTER) + 10 + 4
+AAAA_RECORD_SIZE = len(QUESTION_NAME_POINTER) + 10 + 16
+
+AddressOrder = tuple[tuple[int, ...] | None, tuple[int, ...] | None]
+UNCHANGED_ORDER: AddressOrder = (None, None)
+
+LOCAL_ANSWER_QTYPES = frozenset({QTYPE.A, QTYPE.AAAA, QTYPE.ANY})
+_NAME_BYTES = frozenset(b"abcdefghijklmnopqrstuvwxyz0123456789-_*")
+
+
+@dataclass(frozen=True)
+class WireQuery:
+    name: str
+    qtype: int
+    question_end: int
+    udp_payload_size: int | None = None
+
+
+def skip_name(data: bytes, offset: int) -> int:
+    while True:
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            return offset + 2
+        offset += 1 + length
+        if length == 0:
+            return offset
+
+
+def question_end(data: bytes) -> int:
+    offset = DNS_HEADER_SIZE
+    for _ in range(struct.unpack_from("!H", data, 4)[0]):
+        offset = skip_name(data, offset) + 4
+    return offset
+
+
+def _trailing_opt_payload_size(data: bytes, offset: int) -> int | None:
+    if len(data) < offset + 11 or data[offset] != 0:
+        return None
+    rtype, payload_size, _ttl, rdlength = struct.unpack_from("!HHIH", data, offset + 1)
+    if rtype != QTYPE.OPT or offset + 11 + rdlength != len(data):
+        return None
+    return payload_size
+
+
+def find_opt(data: bytes) -> tuple[int, int] | None:
+    ancount, nscount, arcount = struct.unpack_from("!3H", data, 6)
+    offset = question_end(data)
+    for index in range(ancount + nscount + arcount):
+        start = offset
+        offset = skip_name(data, offset)
+        rtype = struct.unpack_from("!H", data, offset)[0]
+        offset += 10 + struct.unpack_from("!H", data, offset + 8)[0]
+        if rtype == QTYPE.OPT and index >= ancount + nscount:
+            return start, offset
+    if offset > len(data):
+        raise ValueError("Truncated DNS message")
+    return None
+
+
+def udp_payload_limit(udp_payload_size: int | None) -> int:
+    return max(udp_payload_size or DNS_UDP_PAYLOAD_SIZE, DNS_UDP_PAYLOAD_SIZE)
+
+
+def advertise_udp_payload_size(request_bytes: bytes) -> bytes:
+    try:
+        opt = find_opt(request_bytes)
+        if opt is None:
+            if struct.unpack_from("!H", request_bytes, 10)[0]:
+                return request_bytes
+            return request_bytes[:10] + b"\x00\x01" + request_bytes[12:] + OPT_RECORD
+    except (IndexError, struct.error, ValueError):
+        return request_bytes
+    size_offset = skip_name(request_bytes, opt[0]) + 2
+    payload_size = struct.unpack_from("!H", request_bytes, size_offset)[0]
+    if payload_size >= EDNS_UDP_PAYLOAD_SIZE:
+        return request_bytes
+    advertised = bytearray(request_bytes)
+    struct.pack_into("!H", advertised, size_offset, EDNS_UDP_PAYLOAD_SIZE)
+    return bytes(advertised)
+
+
+def _truncated(response: bytes, opt: bytes) -> bytes:
+    flags, qdcount = struct.unpack_from("!2H", response, 2)
+    header = response[:2] + struct.pack(
+        "!5H", flags | TC_FLAG, qdcount, 0, 0, 1 if opt else 0
+    )
+    return header + response[DNS_HEADER_SIZE : question_end(response)] + opt
+
+
+def response_for_client(
+    response: bytes, request_bytes: bytes, *, via_tcp: bool
+) -> bytes:
+    try:
+        request_opt = find_opt(request_bytes)
+        response_opt = find_opt(response)
+    except (IndexError, struct.error, ValueError):
+        return response
+    opt = b""
+    if response_opt is not None:
+        start, end = response_opt
+        if request_opt is None:
+            arcount = struct.unpack_from("!H", response, 10)[0]
+            response = (
+                response[:10]
+                + struct.pack("!H", arcount - 1)
+                + response[DNS_HEADER_SIZE:start]
+                + response[end:]
+            )
+        else:
+            opt = response[start:end]
+    if via_tcp:
+        return response
+
+    udp_payload_size = None
+    if request_opt is not None:
+        size_offset = skip_name(request_bytes, request_opt[0]) + 2
+        udp_payload_size = struct.unpack_from("!H", request_bytes, size_offset)[0]
+    if len(response) <= udp_payload_limit(udp_payload_size):
+        return response
+    return _truncated(response, opt)
+
+
+def parse_query(data: bytes) -> WireQuery | None:
+    if len(data) < DNS_HEADER_SIZE:
+        return None
+    flags, qdcount, ancount, nscount, arcount = struct.unpack_from("!5H", data, 2)
+    if flags & (QR_FLAG | OPCODE_MASK) or (qdcount, ancount, nscount) != (1, 0, 0):
+        return None
+
+    labels = []
+    offset = DNS_HEADER_SIZE
+    while offset < len(data):
+        length = data[offset]
+        offset += 1
+        if length == 0:
+            break
+        if length > MAX_LABEL_LENGTH:
+            return None
+        label = data[offset : offset + length].lower()
+        if len(label) != length or not _NAME_BYTES.issuperset(label):
+            return None
+        labels.append(label.decode("ascii"))
+        offset += length
+    else:
+        return None
+
+    if len(data) < offset + 4:
+        return None
+    qtype, qclass = struct.unpack_from("!HH", data, offset)
+    end = offset + 4
+    if qclass != CLASS.IN:
+        return None
+    udp_payload_size = None
+    if arcount == 0:
+        if end != len(data):
+            return None
+    elif arcount != 1:
+        return None
+    else:
+        udp_payload_size = _trailing_opt_payload_size(data, end)
+        if udp_payload_size is None:
+            return None
+    return WireQuery(
+        name=".".join(labels),
+        qtype=qtype,
+        question_end=end,
+        udp_payload_size=udp_payload_size,
+    )
+
+
+@functools.lru_cache(maxsize=PACKED_ANSWERS_CACHE_SIZE)
+def packed_answers(
+    record_set: DnsRecordSet, qtype: int, ttl_seconds: int
+) -> tuple[int, bytes]:
+    records = []
+    if qtype in (QTYPE.A, QTYPE.ANY):
+        records.extend(
+            (QTYPE.A, ipaddress.IPv4Address(ip).packed) for ip in record_set.ipv4
+        )
+    if qtype in (QTYPE.AAAA, QTYPE.ANY):
+        records.extend(
+            (QTYPE.AAAA, ipaddress.IPv6Address(ip).packed) for ip in record_set.ipv6
+        )
+    return len(records), b"".join(
+        QUESTION_NAME_POINTER
+        + struct.pack("!HHIH", rtype, CLASS.IN, ttl_seconds, len(rdata))
+        + rdata
+        for rtype, rdata in records
+    )
+
+
+def _reordered(
+    records: bytes, record_size: int, order: tuple[int, ...] | None
+) -> bytes:
+    if order is None or not records:
+        return records
+    return b"".join(
+        records[index * record_size : (index + 1) * record_size] for index in order
+    )
+
+
+def local_answer(
+    request_bytes: bytes,
+    query: WireQuery,
+    record_set: DnsRecordSet,
+    *,
+    ttl_seconds: int,
+    max_size: int | None = None,
+    address_order: AddressOrder = UNCHANGED_ORDER,
+) -> bytes:
+    answer_count, answers = packed_answers(record_set, query.qtype, ttl_seconds)
+    if address_order != UNCHANGED_ORDER:
+        ipv4_order, ipv6_order = address_order
+        ipv4_end = 0 if query.qtype == QTYPE.AAAA else len(record_set.ipv4)
+        ipv4_end *= A_RECORD_SIZE
+        answers = _reordered(answers[:ipv4_end], A_RECORD_SIZE, ipv4_order) + (
+            _reordered(answers[ipv4_end:], AAAA_RECORD_SIZE, ipv6_order)
+        )
+    flags = struct.unpack_from("!H", request_bytes, 2)[0] | QR_FLAG | AA_FLAG | RA_FLAG
+    question = request_bytes[DNS_HEADER_SIZE : query.question_end]
+    opt = b"" if query.udp_payload_size is None else OPT_RECORD
+    if (
+        max_size is not None
+        and DNS_HEADER_SIZE + len(question) + len(answers) + len(opt) > max_size
+    ):
+        answer_count, answers, flags = 0, b"", flags | TC_FLAG
+    header = request_bytes[:2] + struct.pack(
+        "!5H", flags, 1, answer_count, 0, 1 if opt else 0
+    )
+    return header + question + answers + opt
@@ -0,0 +1,314 @@
+import json
+import multiprocessing
+import os
+import select
+import socket
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from .discovery import DnsRecordSet, SrvRecord
+from .registry import DiscoverySnapshot
+
+DEFAULT_WORKERS = 1
+DEFAULT_DISCOVERY_FEED_PATH = "/tmp/citm-dns-discovery.sock"
+FEED_RECONNECT_DELAY_SECONDS = 1.0
+WORKER_CHECK_INTERVAL_SECONDS = 1.0
+WORKER_RESTART_BACKOFF_SECONDS = 1.0
+MAX_WORKER_RESTART_BACKOFF_SECONDS = 60.0
+WORKER_STABLE_SECONDS = 60.0
+WORKER_STOP_TIMEOUT_SECONDS = 5.0
+FRAME_HEADER_SIZE = 4
+
+
+def encode_snapshot(snapshot: DiscoverySnapshot) -> bytes:
+    payload = json.dumps(
+        {
+            "version": snapshot.version,
+            "records": {
+                name: {
+                    "ipv4": record_set.ipv4,
+                    "ipv6": record_set.ipv6,
+                    "srv": [
+                        [srv.service, srv.protocol, srv.port] for srv in record_set.srv
+                    ],
+                    "weights": [list(weight) for weight in record_set.weights],
+                }
+                for name, record_set in snapshot.records.items()
+            },
+        }
+    ).encode()
+    return len(payload).to_bytes(FRAME_HEADER_SIZE, "big") + payload
+
+
+def decode_snapshot(payload: bytes) -> DiscoverySnapshot:
+    message = json.loads(payload)
+    records = {
+        name: DnsRecordSet(
+            ipv4=tuple(record_set["ipv4"]),
+            ipv6=tuple(record_set["ipv6"]),
+            srv=tuple(SrvRecord(*srv) for srv in record_set.get("srv", ())),
+            weights=tuple((ip, weight) for ip, weight in record_set.get("weights", ())),
+        )
+        for name, record_set in message["records"].items()
+    }
+    return DiscoverySnapshot.build(records, version=message["version"])
+
+
+class _FeedSubscriber:
+    def __init__(self, connection: socket.socket):
+        connection.setblocking(False)
+        self.connection = connection
+        self.sending = memoryview(b"")
+        self._queued = b""
+
+    def offer(self, frame: bytes) -> None:
+        if self.sending:
+            self._queued = frame
+        else:
+            self.sending = memoryview(frame)
+
+    def flush(self) -> bool:
+        try:
+            while self.sending:
+                sent = self.connection.send(self.sending)
+                self.sending = self.sending[sent:]
+                if not self.sending:
+                    self.sending, self._queued = memoryview(self._queued), b""
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.connection.close()
+            return False
+        return True
+
+
+class SnapshotPublisher:
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._frame = b""
+        self._subscribers: list[_FeedSubscriber] = []
+        self._server: socket.socket | None = None
+        self._threads: list[threading.Thread] = []
+        self._stopped = threading.Event()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+
+    def _wake(self) -> None:
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            pass
+
+    def publish(self, snapshot: DiscoverySnapshot) -> None:
+        frame = encode_snapshot(snapshot)
+        with self._lock:
+            self._frame = frame
+            for subscriber in self._subscribers:
+                subscriber.offer(frame)
+        self._wake()
+
+    def _accept(self, server: socket.socket) -> None:
+        while True:
+            try:
+                connection, _addr = server.accept()
+            except OSError:
+                return
+            subscriber = _FeedSubscriber(connection)
+            with self._lock:
+                if self._frame:
+                    subscriber.offer(self._frame)
+                self._subscribers.append(subscriber)
+            self._wake()
+
+    def _send(self) -> None:
+        while not self._stopped.is_set():
+            with self._lock:
+                self._subscribers = [
+                    subscriber for subscriber in self._subscribers if subscriber.flush()
+                ]
+                waiting = [
+                    subscriber.connection
+                    for subscriber in self._subscribers
+                    if subscriber.sending
+                ]
+            readable, _writable, _failed = select.select(
+                [self._wakeup_reader], waiting, []
+            )
+            if readable:
+                try:
+                    self._wakeup_reader.recv(4096)
+                except OSError:
+                    pass
+
+    def start(self) -> None:
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self._path)
+        self._server.listen()
+        self._threads = [
+            threading.Thread(target=self._accept, args=(self._server,), daemon=True),
+            threading.Thread(target=self._send, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wake()
+        if self._server is not None:
+            try:
+                self._server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._server.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        with self._lock:
+            for subscriber in self._subscribers:
+                subscriber.connection.close()
+            self._subscribers = []
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+class SnapshotSubscriber:
+    def __init__(self, path: str, *, initial: DiscoverySnapshot | None = None):
+        self._path = path
+        self._snapshot = initial or DiscoverySnapshot()
+        self._received = threading.Event()
+        self._stopped = threading.Event()
+        self._connection: socket.socket | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def snapshot(self) -> DiscoverySnapshot:
+        return self._snapshot
+
+    def wait_for_snapshot(self, timeout: float | None = None) -> bool:
+        return self._received.wait(timeout)
+
+    def _read_frames(self, connection: socket.socket) -> None:
+        with connection.makefile("rb") as reader:
+            while True:
+                header = reader.read(FRAME_HEADER_SIZE)
+                if len(header) < FRAME_HEADER_SIZE:
+                    return
+                payload = reader.read(int.from_bytes(header, "big"))
+                self._snapshot = decode_snapshot(payload)
+                self._received.set()
+
+    def _follow(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                    connection.connect(self._path)
+                    self._connection = connection
+                    self._read_frames(connection)
+            except (OSError, ValueError) as e:
+                if self._stopped.is_set():
+                    return
+                print(f"Discovery feed failed: {e}. Reconnecting.", flush=True)
+            self._stopped.wait(FEED_RECONNECT_DELAY_SECONDS)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._follow, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._connection is not None:
+            try:
+                self._connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        count: int,
+        target: Callable[..., None],
+        args: tuple[Any, ...] = (),
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._count = count
+        self._target = target
+        self._args = args
+        self._clock = clock
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: dict[int, multiprocessing.process.BaseProcess] = {}
+        self._started_at: dict[int, float] = {}
+        self._failures: dict[int, int] = {}
+        self._restart_at: dict[int, float] = {}
+        self.restarts = 0
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=self._target,
+            args=(index, *self._args),
+            name=f"citm-dns-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = self._clock()
+
+    def start(self) -> None:
+        for index in range(self._count):
+            self._spawn(index)
+
+    def _restart_delay(self, index: int) -> float:
+        now = self._clock()
+        if now - self._started_at[index] >= WORKER_STABLE_SECONDS:
+            self._failures[index] = 0
+        failures = self._failures.get(index, 0)
+        self._failures[index] = failures + 1
+        if failures == 0:
+            return 0.0
+        return min(
+            WORKER_RESTART_BACKOFF_SECONDS * 2 ** (failures - 1),
+            MAX_WORKER_RESTART_BACKOFF_SECONDS,
+        )
+
+    def check(self) -> None:
+        for index, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            if index not in self._restart_at:
+                delay = self._restart_delay(index)
+                self._restart_at[index] = self._clock() + delay
+                print(
+                    f"DNS worker {index} exited with code {process.exitcode}. "
+                    f"Restarting in {delay:g}s.",
+                    flush=True,
+                )
+            if self._clock() < self._restart_at[index]:
+                continue
+            del self._restart_at[index]
+            self.restarts += 1
+            self._spawn(index)
+
+    def watch(self, stopped: threading.Event) -> None:
+        while not stopped.wait(WORKER_CHECK_INTERVAL_SECONDS):
+            self.check()
+
+    def stop(self) -> None:
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(WORKER_STOP_TIMEOUT_SECONDS)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        self._processes = {}
@@ -5,6 +5,7 @@ from typing import Any
 
 from app import (
     DEFAULT_CADDY_ADMIN_PORT,
+    DEFAULT_CITM_DNS_STATS_PORT,
     DEFAULT_MITMPROXY_WEB_PORT,
     create_app,
 )
@@ -22,8 +23,12 @@ class FakeDockerClient:
 
 
 class FakeResponse:
-    def __init__(self, status_code: int):
+    def __init__(self, status_code: int, payload: Any = None):
         self.status_code = status_code
+        self._payload = payload
+
+    def json(self) -> Any:
+        return self._payload
 
 
 def test_root_returns_request_data_and_dns_entries():
@@ -204,3 +209,65 @@ def test_health_skips_disabled_mitmproxy(monkeypatch):
     payload = response.get_json()
     checks = {check["check"]: check for check in payload["checks"]}
     assert checks["mitmproxy_serving"]["skipped"] is True
+
+
+def test_dns_upstreams_proxies_forwarder_stats():
+    stats = {"strategy": "race", "nameservers": [{"address": "10.0.0.53"}]}
+
+    requested = []
+
+    def fake_get(url: str, timeout: int, **kwargs: Any) -> FakeResponse:
+        assert timeout == 2
+        requested.append(url)
+        return FakeResponse(200, stats)
+
+    app = create_app(docker_client=FakeDockerClient(), http_get=fake_get)
+
+    response = app.test_client().get("/dns/upstreams")
+
+    assert response.status_code == 200
+    assert response.get_json() == stats
+    assert requested == [f"http://127.0.0.1:{DEFAULT_CITM_DNS_STATS_PORT}/upstreams"]
+
+    app.test_client().get("/dns/upstreams?worker=2")
+    assert requested[-1] == (
+        f"http://127.0.0.1:{DEFAULT_CITM_DNS_STATS_PORT + 2}/upstreams"
+    )
+
+
+def test_dns_metrics_and_querylog_proxy_forwarder_stats():
+    requested = []
+
+    def fake_get(url: str, timeout: int, **kwargs: Any) -> FakeResponse:
+        requested.append(url)
+        return FakeResponse(200, {"queries": 1})
+
+    app = create_app(docker_client=FakeDockerClient(), http_get=fake_get)
+
+    metrics = app.test_client().get("/dns/metrics?worker=1")
+    app.test_client().get("/dns/querylog")
+
+    assert metrics.get_json() == {"queries": 1}
+    assert requested == [
+        f"http://127.0.0.1:{DEFAULT_CITM_DNS_STATS_PORT + 1}/metrics",
+        f"http://127.0.0.1:{DEFAULT_CITM_DNS_STATS_PORT}/querylog",
+    ]
+
+
+def test_dns_upstreams_reports_unavailable_or_disabled_forwarder(monkeypatch):
+    def failing_get(_url: str, timeout: int, **_kwargs: Any) -> FakeResponse:
+        raise ConnectionError("connection refused")
+
+    app = create_app(docker_client=FakeDockerClient(), http_get=failing_get)
+    unavailable = app.test_client().get("/dns/upstreams")
+
+    invalid = app.test_client().get("/dns/upstreams?worker=-1")
+
+    monkeypatch.setenv("ENABLE_CITM_UTILS_DNS_FORWARDER", "false")
+    app = create_app(docker_client=FakeDockerClient(), http_get=failing_get)
+    disabled = app.test_client().get("/dns/upstreams")
+
+    assert unavailable.status_code == 502
+    assert invalid.status_code == 400
+    assert "connection refused" in unavailable.get_json()["details"]
+    assert disabled.status_code == 404
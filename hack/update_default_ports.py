@@ -81,6 +81,13 @@ PORTS = (
         "DNS listener",
         protocol="tcp/udp",
     ),
+    Port(
+        "CITM_DNS_STATS_PORT",
+        19053,
+        "Internal",
+        "citm-utils-dns-forwarder",
+        "Loopback-only DNS stats listener",
+    ),
 )
 
 PORT_BY_ENV = {port.env: port for port in PORTS}
@@ -117,6 +124,7 @@ def render_citm_utils_python_constants() -> str:
         [
             f'DEFAULT_CADDY_ADMIN_PORT = {PORT_BY_ENV["CADDY_ADMIN_PORT"].default}',
             f'DEFAULT_CITM_UTILS_WEB_PORT = {PORT_BY_ENV["CITM_UTILS_WEB_PORT"].default}',
+            f'DEFAULT_CITM_DNS_STATS_PORT = {PORT_BY_ENV["CITM_DNS_STATS_PORT"].default}',
             f'DEFAULT_MITMPROXY_WEB_PORT = {PORT_BY_ENV["MITMPROXY_WEB_PORT"].default}',
         ]
     )
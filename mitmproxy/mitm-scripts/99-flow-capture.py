@@ -0,0 +1,3 @@
+from flow_capture.addon import FlowCapture
+
+addons = [FlowCapture()]
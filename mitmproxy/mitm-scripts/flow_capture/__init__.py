@@ -0,0 +1,5 @@
+from .addon import FlowCapture
+from .policy import BlobStore, CapturePolicy
+from .segments import SegmentedCapture
+
+__all__ = ["BlobStore", "CapturePolicy", "FlowCapture", "SegmentedCapture"]
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import os
+from collections.abc import Callable
+from pathlib import Path
+
+from mitmproxy import ctx, dns, flow, http, tcp, udp
+
+from .policy import CapturePolicy
+from .segments import SegmentedCapture
+
+CAPTURE_DIR_ENV_VAR = "MITMPROXY_CAPTURE_DIR"
+SEGMENT_MAX_BYTES_ENV_VAR = "MITMPROXY_CAPTURE_SEGMENT_MAX_BYTES"
+SEGMENT_MAX_AGE_SECONDS_ENV_VAR = "MITMPROXY_CAPTURE_SEGMENT_MAX_AGE_SECONDS"
+MAX_SEGMENTS_ENV_VAR = "MITMPROXY_CAPTURE_MAX_SEGMENTS"
+FILTER_ENV_VAR = "MITMPROXY_CAPTURE_FILTER"
+BODY_MAX_BYTES_ENV_VAR = "MITMPROXY_CAPTURE_BODY_MAX_BYTES"
+
+DEFAULT_CAPTURE_DIR = "/var/lib/mitmproxy/capture"
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SEGMENT_MAX_AGE_SECONDS = 600.0
+DEFAULT_MAX_SEGMENTS = 16
+DEFAULT_BODY_MAX_BYTES = 1024 * 1024
+
+
+def _log_warn(message: str) -> None:
+    logger = getattr(ctx, "log", None)
+    if logger is not None:
+        logger.warn(message)
+        return
+    logging.getLogger(__name__).warning(message)
+
+
+def _positive_env(name: str, default: float, parse: Callable[[str], float]) -> float:
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = parse(raw)
+        if value <= 0:
+            raise ValueError
+        return value
+    except ValueError:
+        _log_warn(f"Invalid {name}={raw!r}. Falling back to {default}.")
+        return default
+
+
+def _build_policy() -> CapturePolicy:
+    body_max_bytes = int(
+        _positive_env(BODY_MAX_BYTES_ENV_VAR, DEFAULT_BODY_MAX_BYTES, int)
+    )
+    filter_expression = os.environ.get(FILTER_ENV_VAR, "").strip() or None
+    try:
+        return CapturePolicy(
+            filter_expression=filter_expression, body_max_bytes=body_max_bytes
+        )
+    except ValueError as exc:
+        _log_warn(
+            f"Invalid {FILTER_ENV_VAR}={filter_expression!r}: {exc}. "
+            "Capturing all flows."
+        )
+        return CapturePolicy(body_max_bytes=body_max_bytes)
+
+
+class FlowCapture:
+    def __init__(self, capture: SegmentedCapture | None = None) -> None:
+        self.capture = capture or SegmentedCapture(
+            Path(os.environ.get(CAPTURE_DIR_ENV_VAR, DEFAULT_CAPTURE_DIR)),
+            max_segment_bytes=_positive_env(
+                SEGMENT_MAX_BYTES_ENV_VAR, DEFAULT_SEGMENT_MAX_BYTES, int
+            ),
+            max_segment_age_seconds=_positive_env(
+                SEGMENT_MAX_AGE_SECONDS_ENV_VAR, DEFAULT_SEGMENT_MAX_AGE_SECONDS, float
+            ),
+            max_segments=_positive_env(MAX_SEGMENTS_ENV_VAR, DEFAULT_MAX_SEGMENTS, int),
+            policy=_build_policy(),
+        )
+
+    def save_flow(self, captured_flow: flow.Flow) -> None:
+        self.capture.add(captured_flow)
+
+    def response(self, flow: http.HTTPFlow) -> None:
+        # WebSocket flows are persisted once the connection ends.
+        if flow.websocket is None:
+            self.save_flow(flow)
+
+    def error(self, flow: http.HTTPFlow) -> None:
+        self.response(flow)
+
+    def websocket_end(self, flow: http.HTTPFlow) -> None:
+        self.save_flow(flow)
+
+    def tcp_end(self, flow: tcp.TCPFlow) -> None:
+        self.save_flow(flow)
+
+    def tcp_error(self, flow: tcp.TCPFlow) -> None:
+        self.save_flow(flow)
+
+    def udp_end(self, flow: udp.UDPFlow) -> None:
+        self.save_flow(flow)
+
+    def udp_error(self, flow: udp.UDPFlow) -> None:
+        self.save_flow(flow)
+
+    def dns_response(self, flow: dns.DNSFlow) -> None:
+        self.save_flow(flow)
+
+    def dns_error(self, flow: dns.DNSFlow) -> None:
+        self.save_flow(flow)
+
+    def done(self) -> None:
+        self.capture.close()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+from mitmproxy import flow, flowfilter
+
+SPILLED_BODIES_METADATA_KEY = "citm_spilled_bodies"
+BLOBS_DIR_NAME = "blobs"
+
+
+class BlobStore:
+    def __init__(self, blobs_dir: Path) -> None:
+        self.blobs_dir = blobs_dir
+
+    def path_for(self, digest: str) -> Path:
+        return self.blobs_dir / digest[:2] / digest
+
+    def put(self, data: bytes) -> tuple[str, int]:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if path.exists():
+            return digest, 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{digest}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+        return digest, len(data)
+
+    def retain(self, live_digests: Iterable[str]) -> None:
+        live = set(live_digests)
+        if not self.blobs_dir.exists():
+            return
+        for path in self.blobs_dir.glob("*/*"):
+            if path.name not in live:
+                path.unlink(missing_ok=True)
+
+
+class CapturePolicy:
+    def __init__(
+        self,
+        *,
+        filter_expression: str | None = None,
+        body_max_bytes: int | None = None,
+    ) -> None:
+        self.filter_expression = filter_expression
+        self.body_max_bytes = body_max_bytes
+        self._filter = (
+            flowfilter.parse(filter_expression) if filter_expression else None
+        )
+
+    def should_capture(self, captured_flow: flow.Flow) -> bool:
+        if self._filter is None:
+            return True
+        return bool(flowfilter.match(self._filter, captured_flow))
+
+    def spill_bodies(
+        self, state: dict[str, Any], blob_store: BlobStore
+    ) -> tuple[set[str], int]:
+        if self.body_max_bytes is None:
+            return set(), 0
+
+        digests: set[str] = set()
+        written_bytes = 0
+        spilled: dict[str, dict[str, Any]] = {}
+        for message_key in ("request", "response"):
+            message = state.get(message_key)
+            if not isinstance(message, dict):
+                continue
+            content = message.get("content")
+            if not isinstance(content, bytes) or len(content) <= self.body_max_bytes:
+                continue
+
+            digest, written = blob_store.put(content)
+            message["content"] = b""
+            spilled[message_key] = {"sha256": digest, "size": len(content)}
+            digests.add(digest)
+            written_bytes += written
+
+        if spilled:
+            metadata = state.setdefault("metadata", {})
+            metadata[SPILLED_BODIES_METADATA_KEY] = spilled
+        return digests, written_bytes
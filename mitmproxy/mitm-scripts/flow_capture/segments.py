@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import BinaryIO
+
+from mitmproxy import flow, http
+from mitmproxy.io import tnetstring
+
+from .policy import BLOBS_DIR_NAME, BlobStore, CapturePolicy
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+SEGMENT_NAME_FORMAT = "segment-{sequence:06d}.flow"
+
+
+@dataclass
+class SegmentInfo:
+    name: str
+    sequence: int
+    created: float
+    closed: bool = False
+    size: int = 0
+    flow_count: int = 0
+    min_timestamp: float | None = None
+    max_timestamp: float | None = None
+    blob_bytes: int = 0
+    blobs: list[str] = field(default_factory=list)
+
+    def include_timestamp(self, timestamp: float) -> None:
+        if self.min_timestamp is None or timestamp < self.min_timestamp:
+            self.min_timestamp = timestamp
+        if self.max_timestamp is None or timestamp > self.max_timestamp:
+            self.max_timestamp = timestamp
+
+
+def flow_timestamp(captured_flow: flow.Flow) -> float:
+    if isinstance(captured_flow, http.HTTPFlow):
+        return captured_flow.request.timestamp_start
+    return captured_flow.timestamp_created
+
+
+class SegmentedCapture:
+    def __init__(
+        self,
+        capture_dir: Path,
+        *,
+        max_segment_bytes: int,
+        max_segment_age_seconds: float,
+        max_segments: int,
+        policy: CapturePolicy | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.capture_dir = capture_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age_seconds = max_segment_age_seconds
+        self.max_segments = max_segments
+        self.policy = policy or CapturePolicy()
+        self.blob_store = BlobStore(capture_dir / BLOBS_DIR_NAME)
+        self._clock = clock
+        self._segments: list[SegmentInfo] = []
+        self._active: SegmentInfo | None = None
+        self._handle: BinaryIO | None = None
+
+        self.capture_dir.mkdir(parents=True, exist_ok=True)
+        self._load_manifest()
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.capture_dir / MANIFEST_NAME
+
+    @property
+    def segments(self) -> list[SegmentInfo]:
+        return list(self._segments)
+
+    def _load_manifest(self) -> None:
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if manifest.get("version") != MANIFEST_VERSION:
+            return
+
+        for raw_segment in manifest.get("segments", []):
+            segment = SegmentInfo(**raw_segment)
+            segment_path = self.capture_dir / segment.name
+            if not segment_path.exists():
+                continue
+            segment.closed = True
+            segment.size = segment_path.stat().st_size
+            self._segments.append(segment)
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "segments": [asdict(segment) for segment in self._segments],
+        }
+        temp_path = self.manifest_path.with_name(f".{MANIFEST_NAME}.tmp")
+        temp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        os.replace(temp_path, self.manifest_path)
+
+    def _next_sequence(self) -> int:
+        if not self._segments:
+            return 1
+        return self._segments[-1].sequence + 1
+
+    def _open_segment(self) -> None:
+        sequence = self._next_sequence()
+        segment = SegmentInfo(
+            name=SEGMENT_NAME_FORMAT.format(sequence=sequence),
+            sequence=sequence,
+            created=self._clock(),
+        )
+        self._handle = open(self.capture_dir / segment.name, "wb")
+        self._active = segment
+        self._segments.append(segment)
+        self._prune_segments()
+        self._write_manifest()
+
+    def _close_segment(self) -> None:
+        if self._active is None or self._handle is None:
+            return
+        self._handle.close()
+        self._active.closed = True
+        self._handle = None
+        self._active = None
+        self._write_manifest()
+
+    def _prune_segments(self) -> None:
+        pruned = False
+        while len(self._segments) > self.max_segments:
+            expired = self._segments.pop(0)
+            for path in self.capture_dir.glob(f"{expired.name}*"):
+                path.unlink(missing_ok=True)
+            pruned = pruned or bool(expired.blobs)
+        if pruned:
+            self.blob_store.retain(
+                digest for segment in self._segments for digest in segment.blobs
+            )
+
+    def _is_full(self, segment: SegmentInfo) -> bool:
+        return segment.size + segment.blob_bytes >= self.max_segment_bytes
+
+    def _should_rotate(self, segment: SegmentInfo) -> bool:
+        if self._is_full(segment):
+            return True
+        return self._clock() - segment.created >= self.max_segment_age_seconds
+
+    def add(self, captured_flow: flow.Flow) -> None:
+        if not self.policy.should_capture(captured_flow):
+            return
+
+        if self._active is not None and self._should_rotate(self._active):
+            self._close_segment()
+        if self._active is None:
+            self._open_segment()
+
+        assert self._active is not None
+        assert self._handle is not None
+
+        state = captured_flow.get_state()
+        digests, blob_bytes = self.policy.spill_bodies(state, self.blob_store)
+        tnetstring.dump(state, self._handle)
+        self._handle.flush()
+        self._active.size = self._handle.tell()
+        self._active.blob_bytes += blob_bytes
+        self._active.blobs.extend(sorted(digests - set(self._active.blobs)))
+        self._active.flow_count += 1
+        self._active.include_timestamp(flow_timestamp(captured_flow))
+
+        if self._is_full(self._active):
+            self._close_segment()
+
+    def close(self) -> None:
+        self._close_segment()
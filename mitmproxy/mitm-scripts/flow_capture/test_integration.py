@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+from mitmproxy import connection, http, io
+
+from flow_capture.addon import FlowCapture
+from flow_capture.policy import CapturePolicy
+from flow_capture.segments import SegmentedCapture
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _build_flow(
+    url: str = "https://service.example/api",
+    *,
+    timestamp_start: float = 1000.0,
+    body: bytes = b"",
+) -> http.HTTPFlow:
+    client = connection.Client(
+        peername=("127.0.0.1", 55123),
+        sockname=("127.0.0.1", 8380),
+    )
+    server = connection.Server(address=("service.example", 443))
+    flow = http.HTTPFlow(client, server)
+    flow.request = http.Request.make("GET", url, body)
+    flow.request.timestamp_start = timestamp_start
+    flow.response = http.Response.make(200, b"ok")
+    return flow
+
+
+def _create_capture(
+    capture_dir: Path,
+    *,
+    max_segment_bytes: int = 1024 * 1024,
+    max_segment_age_seconds: float = 600.0,
+    max_segments: int = 4,
+    policy: CapturePolicy | None = None,
+    clock: FakeClock | None = None,
+) -> SegmentedCapture:
+    return SegmentedCapture(
+        capture_dir,
+        max_segment_bytes=max_segment_bytes,
+        max_segment_age_seconds=max_segment_age_seconds,
+        max_segments=max_segments,
+        policy=policy,
+        clock=clock or FakeClock(),
+    )
+
+
+def _read_manifest(capture_dir: Path) -> dict:
+    return json.loads((capture_dir / "manifest.json").read_text(encoding="utf-8"))
+
+
+def _read_flows(segment_path: Path) -> list[http.HTTPFlow]:
+    with open(segment_path, "rb") as handle:
+        return list(io.FlowReader(handle).stream())
+
+
+def _read_urls(segment_path: Path) -> list[str]:
+    return [flow.request.url for flow in _read_flows(segment_path)]
+
+
+def test_response_writes_flow_to_active_segment_and_manifest(tmp_path: Path):
+    addon = FlowCapture(_create_capture(tmp_path))
+
+    addon.response(_build_flow("https://service.example/one"))
+    addon.response(_build_flow("https://service.example/two"))
+
+    assert _read_urls(tmp_path / "segment-000001.flow") == [
+        "https://service.example/one",
+        "https://service.example/two",
+    ]
+    manifest = _read_manifest(tmp_path)
+    assert manifest["version"] == 1
+    assert [segment["name"] for segment in manifest["segments"]] == [
+        "segment-000001.flow"
+    ]
+    assert manifest["segments"][0]["closed"] is False
+
+
+def test_segment_rotates_when_size_limit_is_reached(tmp_path: Path):
+    addon = FlowCapture(_create_capture(tmp_path, max_segment_bytes=1))
+
+    addon.response(_build_flow("https://service.example/one", timestamp_start=10.0))
+    addon.response(_build_flow("https://service.example/two", timestamp_start=20.0))
+
+    manifest = _read_manifest(tmp_path)
+    assert [segment["name"] for segment in manifest["segments"]] == [
+        "segment-000001.flow",
+        "segment-000002.flow",
+    ]
+    assert all(segment["closed"] for segment in manifest["segments"])
+    assert manifest["segments"][0]["flow_count"] == 1
+    assert manifest["segments"][0]["min_timestamp"] == 10.0
+    assert manifest["segments"][1]["max_timestamp"] == 20.0
+    assert _read_urls(tmp_path / "segment-000002.flow") == [
+        "https://service.example/two"
+    ]
+
+
+def test_segment_rotates_when_age_limit_is_reached(tmp_path: Path):
+    clock = FakeClock()
+    addon = FlowCapture(
+        _create_capture(tmp_path, max_segment_age_seconds=60.0, clock=clock)
+    )
+
+    addon.response(_build_flow("https://service.example/one"))
+    clock.now += 61.0
+    addon.response(_build_flow("https://service.example/two"))
+
+    assert _read_urls(tmp_path / "segment-000001.flow") == [
+        "https://service.example/one"
+    ]
+    assert _read_urls(tmp_path / "segment-000002.flow") == [
+        "https://service.example/two"
+    ]
+
+
+def test_oldest_segments_and_sidecars_are_removed_beyond_segment_limit(
+    tmp_path: Path,
+):
+    addon = FlowCapture(_create_capture(tmp_path, max_segment_bytes=1, max_segments=2))
+
+    addon.response(_build_flow())
+    (tmp_path / "segment-000001.flow.idx").write_text("{}\n", encoding="utf-8")
+    addon.response(_build_flow())
+    addon.response(_build_flow())
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "manifest.json",
+        "segment-000002.flow",
+        "segment-000003.flow",
+    ]
+    assert [
+        segment["sequence"] for segment in _read_manifest(tmp_path)["segments"]
+    ] == [
+        2,
+        3,
+    ]
+
+
+def test_websocket_flow_is_only_written_when_connection_ends(tmp_path: Path):
+    addon = FlowCapture(_create_capture(tmp_path))
+    flow = _build_flow()
+    flow.websocket = object()
+
+    addon.response(flow)
+    assert not (tmp_path / "segment-000001.flow").exists()
+
+    flow.websocket = None
+    addon.websocket_end(flow)
+    assert len(_read_urls(tmp_path / "segment-000001.flow")) == 1
+
+
+def test_capture_resumes_sequence_from_existing_manifest(tmp_path: Path):
+    first = FlowCapture(_create_capture(tmp_path))
+    first.response(_build_flow())
+    first.done()
+
+    second = FlowCapture(_create_capture(tmp_path))
+    second.response(_build_flow())
+
+    segments = _read_manifest(tmp_path)["segments"]
+    assert [segment["name"] for segment in segments] == [
+        "segment-000001.flow",
+        "segment-000002.flow",
+    ]
+    assert segments[0]["closed"] is True
+    assert segments[1]["closed"] is False
+
+
+def test_invalid_env_values_fall_back_to_defaults(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+    monkeypatch.setenv("MITMPROXY_CAPTURE_DIR", str(tmp_path))
+    monkeypatch.setenv("MITMPROXY_CAPTURE_SEGMENT_MAX_BYTES", "-1")
+    monkeypatch.setenv("MITMPROXY_CAPTURE_MAX_SEGMENTS", "not-a-number")
+    monkeypatch.setenv("MITMPROXY_CAPTURE_SEGMENT_MAX_AGE_SECONDS", "30")
+
+    addon = FlowCapture()
+
+    assert addon.capture.capture_dir == tmp_path
+    assert addon.capture.max_segment_bytes == 64 * 1024 * 1024
+    assert addon.capture.max_segments == 16
+    assert addon.capture.max_segment_age_seconds == 30.0
+
+
+def test_filter_expression_skips_non_matching_flows(tmp_path: Path):
+    addon = FlowCapture(
+        _create_capture(
+            tmp_path, policy=CapturePolicy(filter_expression="~d keep.example")
+        )
+    )
+
+    addon.response(_build_flow("https://drop.example/a"))
+    addon.response(_build_flow("https://keep.example/b"))
+
+    assert _read_urls(tmp_path / "segment-000001.flow") == ["https://keep.example/b"]
+
+
+def test_large_bodies_are_spilled_to_content_addressed_blobs(tmp_path: Path):
+    addon = FlowCapture(
+        _create_capture(tmp_path, policy=CapturePolicy(body_max_bytes=8))
+    )
+    body = b"x" * 64
+    flow = _build_flow(body=body)
+
+    addon.response(flow)
+
+    assert flow.request.content == body
+    [captured] = _read_flows(tmp_path / "segment-000001.flow")
+    assert captured.request.content == b""
+    assert captured.response.content == b"ok"
+    reference = captured.metadata["citm_spilled_bodies"]["request"]
+    assert reference["size"] == len(body)
+    digest = reference["sha256"]
+    assert (tmp_path / "blobs" / digest[:2] / digest).read_bytes() == body
+
+
+def test_identical_spilled_bodies_are_stored_once(tmp_path: Path):
+    addon = FlowCapture(
+        _create_capture(tmp_path, policy=CapturePolicy(body_max_bytes=8))
+    )
+
+    addon.response(_build_flow("https://service.example/a", body=b"y" * 64))
+    addon.response(_build_flow("https://service.example/b", body=b"y" * 64))
+
+    assert len(list((tmp_path / "blobs").glob("*/*"))) == 1
+    addon.done()
+    segment = _read_manifest(tmp_path)["segments"][0]
+    assert len(segment["blobs"]) == 1
+    assert segment["blob_bytes"] == 64
+
+
+def test_blobs_are_removed_with_their_last_referencing_segment(tmp_path: Path):
+    addon = FlowCapture(
+        _create_capture(
+            tmp_path,
+            max_segment_bytes=1,
+            max_segments=1,
+            policy=CapturePolicy(body_max_bytes=8),
+        )
+    )
+
+    addon.response(_build_flow(body=b"a" * 64))
+    addon.response(_build_flow(body=b"b" * 64))
+
+    [remaining] = list((tmp_path / "blobs").glob("*/*"))
+    assert remaining.read_bytes() == b"b" * 64
+
+
+def test_invalid_filter_env_captures_all_flows(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+    monkeypatch.setenv("MITMPROXY_CAPTURE_DIR", str(tmp_path))
+    monkeypatch.setenv("MITMPROXY_CAPTURE_FILTER", "~d ((")
+    monkeypatch.setenv("MITMPROXY_CAPTURE_BODY_MAX_BYTES", "128")
+
+    addon = FlowCapture()
+    addon.response(_build_flow())
+
+    assert addon.capture.policy.filter_expression is None
+    assert addon.capture.policy.body_max_bytes == 128
+    assert len(_read_urls(tmp_path / "segment-000001.flow")) == 1
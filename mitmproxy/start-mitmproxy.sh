@@ -3,6 +3,7 @@
 set -euo pipefail
 
 MITMPROXY_DATA_DIR="/var/lib/mitmproxy"
+export MITMPROXY_CAPTURE_DIR="${MITMPROXY_DATA_DIR}/capture"
 
 # BEGIN GENERATED DEFAULT PORTS
 HTTP_PROXY_PORT="${MITMPROXY_HTTP_PROXY_PORT:-19080}"
@@ -23,7 +24,8 @@ if [ -d "/mitm-scripts" ]; then
 fi
 
 mkdir -p "${MITMPROXY_DATA_DIR}"
-rm -f "${MITMPROXY_DATA_DIR}/dump.flow"
+rm -f "${MITMPROXY_DATA_DIR}"/dump.flow*
+rm -rf "${MITMPROXY_CAPTURE_DIR}"
 
 DNS_ARGS=()
 if [ "${DNS_LISTEN_PORT}" = "53" ]; then
@@ -35,7 +37,6 @@ fi
 uv run mitmweb \
 	--mode regular@"${HTTP_PROXY_PORT}" \
 	--mode socks5@"${SOCKS_PROXY_PORT}" \
-	-w "${MITMPROXY_DATA_DIR}/dump.flow" \
 	--set ssl_insecure=true \
 	--set web_port="${WEB_PORT}" \
 	--set web_password=secret \